@@ -11,7 +11,7 @@ parent_dir = os.path.dirname(current_dir)
 if parent_dir not in sys.path:
     sys.path.append(parent_dir)
 
-from utils.data_loader import load_weekly_data, get_hierarchy
+from utils.data_loader import load_weekly_data, load_routing_table, get_hierarchy
 from utils.modeling import run_hybrid_forecast
 from components.ui import load_css, metric_card, deep_dive_alert
 
@@ -64,7 +64,9 @@ def main():
     train_end = cutoff_date if model_mode == 'backtest' else df['week_start'].max()
     
     with st.spinner("Calculating forecast..."):
-        result = run_hybrid_forecast(df, selected_store, selected_family, train_end, horizon, mode=model_mode)
+        result = run_hybrid_forecast(
+            df, selected_store, selected_family, train_end, horizon, mode=model_mode, routes=load_routing_table()
+        )
 
     if result is None:
         st.error("No data available for this selection.")
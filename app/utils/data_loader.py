@@ -1,12 +1,23 @@
 import pandas as pd
 import streamlit as st
 import os
+import sys
+
+# Add project root to sys.path to allow importing from src
+current_dir = os.path.dirname(os.path.abspath(__file__))
+project_root = os.path.abspath(os.path.join(current_dir, '..', '..'))
+if project_root not in sys.path:
+    sys.path.append(project_root)
+
+from src.data.storage import read_canon
+from src.baselines.routing import WEEKLY_CANON_PATH, load_routing, read_routing_meta
 
 @st.cache_data
-def load_weekly_data():
+def load_weekly_data(columns=None, stores=None, families=None):
     """
     Loads the canonical weekly data from parquet.
     Cached by Streamlit to avoid reloading on every interaction.
+    columns / stores / families are pushed down to the partitioned dataset.
     """
     # Adjust path assuming running from root directory
     data_path = 'data/processed/weekly_canon.parquet'
@@ -15,7 +26,7 @@ def load_weekly_data():
         st.error(f"Data file not found at: {data_path}")
         return pd.DataFrame()
         
-    df = pd.read_parquet(data_path)
+    df = read_canon(data_path, columns=columns, stores=stores, families=families)
     
     # Ensure proper types
     if 'week_start' in df.columns:
@@ -23,6 +34,28 @@ def load_weekly_data():
     
     return df
 
+def _dataset_signature(path):
+    """(files, latest mtime) of a partitioned dataset: changes when any partition is rewritten."""
+    files = [os.path.join(root, f) for root, _, names in os.walk(path) for f in names]
+    return len(files), max((os.stat(f).st_mtime_ns for f in files), default=0)
+
+def load_routing_table():
+    """
+    Demand class of every series at every cutoff week (data/processed/dim_routing.parquet).
+    The table is only read here: it is rebuilt by the routing stage of scripts/preprocessing.py.
+    None if it is missing or was computed on an older weekly_canon (the model then classifies
+    the series itself). Cached per version of both files.
+    """
+    meta = read_routing_meta()
+    if meta is None or not os.path.exists(WEEKLY_CANON_PATH):
+        return None
+    return _routing_table(meta['data_version'], _dataset_signature(WEEKLY_CANON_PATH))
+
+@st.cache_data
+def _routing_table(routing_version, weekly_signature):
+    # Arguments are the cache key only
+    return load_routing()
+
 @st.cache_data
 def get_hierarchy(df):
     """
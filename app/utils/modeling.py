@@ -10,8 +10,16 @@ if project_root not in sys.path:
 
 from src.baselines.optimized import PiecewiseHybrid
 from src.baselines.models import SeasonalNaive, MovingAverage
+from src.data.keys import series_labels
+from src.baselines.routing import lookup_routes
 
-def run_hybrid_forecast(df, store_nbr, family, train_end_date, horizon=8, mode='backtest'):
+def series_id_for(df, store_nbr, family):
+    """(store_nbr, family) -> series_id using the per-series label table (one row per series)."""
+    labels = series_labels(df)
+    hit = labels[(labels['store_nbr'] == store_nbr) & (labels['family'].astype(str) == str(family))]
+    return int(hit['series_id'].iloc[0]) if len(hit) else -1
+
+def run_hybrid_forecast(df, store_nbr, family, train_end_date, horizon=8, mode='backtest', routes=None):
     """
     Runs the PiecewiseHybrid model for a specific store/family slice.
     
@@ -22,12 +30,19 @@ def run_hybrid_forecast(df, store_nbr, family, train_end_date, horizon=8, mode='
         train_end_date (pd.Timestamp): The cutoff date for training (ignored in forecast mode)
         horizon (int): Number of weeks to predict
         mode (str): 'backtest' or 'forecast'
+        routes (pd.DataFrame): routing table (src/baselines/routing.py); the series' demand class
+            at the training cutoff is read there instead of being recomputed
         
     Returns:
         dict: containing 'forecast' (DataFrame), 'metrics' (dict), 'diagnostics' (dict)
     """
-    # 1. Filter Data
-    mask = (df['store_nbr'] == store_nbr) & (df['family'] == family)
+    # 1. Filter Data (on the integer series key when the data carries it)
+    sid = -1
+    if 'series_id' in df.columns:
+        sid = series_id_for(df, store_nbr, family)
+        mask = df['series_id'].to_numpy() == sid
+    else:
+        mask = (df['store_nbr'] == store_nbr) & (df['family'] == family)
     series_df = df[mask].copy().sort_values('week_start')
     
     if series_df.empty:
@@ -50,7 +65,10 @@ def run_hybrid_forecast(df, store_nbr, family, train_end_date, horizon=8, mode='
     
     # Predict into the future (relative to the training set)
     # The models are designed to predict 'horizon' weeks from the end of training data
-    forecast_df = model.predict(horizon)
+    route = None
+    if routes is not None and sid >= 0:
+        route = lookup_routes(routes, train_data['week_start'].max(), series_ids=[sid])
+    forecast_df = model.predict(horizon, routes=route)
     
     # Robustness: Handle legacy or cached model output naming
     if 'sales_pred' in forecast_df.columns:
@@ -16,7 +16,7 @@ def main():
     train_file = raw_data / "train.csv"
     
     if not train_file.exists():
-        print("\n[1/3] Téléchargement des données depuis Kaggle...")
+        print("\n[1/2] Téléchargement des données depuis Kaggle...")
         print("Assurez-vous d'avoir configuré Kaggle CLI (pip install kaggle)")
         print("Commande à exécuter manuellement :")
         print("  kaggle competitions download -c store-sales-time-series-forecasting")
@@ -25,21 +25,13 @@ def main():
         print("  https://www.kaggle.com/competitions/store-sales-time-series-forecasting/data")
         return
     
-    print("\n[2/3] Traitement des données (Preprocessing)...")
-    result = subprocess.run([sys.executable, "scripts/preprocessing.py"], 
+    print("\n[2/2] Traitement des données + Data Warehouse (pipeline par étapes, avec cache)...")
+    result = subprocess.run([sys.executable, "scripts/preprocessing.py", "--warehouse"],
                           capture_output=True, text=True)
     if result.returncode != 0:
-        print(f"ERREUR: {result.stderr}")
+        print(f"ERREUR: {result.stdout[-2000:]}{result.stderr}")
         return
-    print("OK - Fichiers Parquet générés")
-    
-    print("\n[3/3] Construction de la base de données (Data Warehouse)...")
-    result = subprocess.run([sys.executable, "scripts/build_warehouse.py"], 
-                          capture_output=True, text=True)
-    if result.returncode != 0:
-        print(f"ERREUR: {result.stderr}")
-        return
-    print("OK - retail.sqlite créé")
+    print("OK - Fichiers Parquet générés, retail.sqlite créé")
     
     print("\n" + "=" * 60)
     print("SETUP TERMINÉ AVEC SUCCÈS")
@@ -0,0 +1,93 @@
+import argparse
+import sys
+import time
+from pathlib import Path
+
+import pandas as pd
+
+# Add project root to path so we can import from src
+PROJECT_ROOT = Path(__file__).resolve().parent.parent
+sys.path.append(str(PROJECT_ROOT))
+
+from src.data.storage import read_canon
+from src.baselines.parallel import ShardedModel
+from src.baselines.registry import MODELS
+
+WEEKLY_CANON_PATH = PROJECT_ROOT / "data" / "processed" / "weekly_canon.parquet"
+
+
+def _best_of(func, repeat):
+    best, out = float("inf"), None
+    for _ in range(repeat):
+        t0 = time.perf_counter()
+        out = func()
+        best = min(best, time.perf_counter() - t0)
+    return best, out
+
+
+def benchmark(df, horizon=8, repeat=3, models=None) -> pd.DataFrame:
+    """Best-of-`repeat` fit / predict wall time of each baseline over the whole panel."""
+    rows = []
+    for name in models or MODELS:
+        fit_s, model = _best_of(lambda: MODELS[name]().fit(df), repeat)
+        predict_s, forecast = _best_of(lambda: model.predict(horizon), repeat)
+        rows.append({
+            "model": name,
+            "fit_ms": round(fit_s * 1000, 1),
+            "predict_ms": round(predict_s * 1000, 1),
+            "forecast_rows": len(forecast),
+        })
+    return pd.DataFrame(rows)
+
+
+def scaling(df, workers, horizon=8, repeat=3, models=None) -> pd.DataFrame:
+    """
+    Best-of-`repeat` wall time of predict_parallel (fit + predict over series shards) for
+    each worker count, with the speedup over one worker. Only the sharded baselines.
+    """
+    rows = []
+    for name in models or MODELS:
+        if not issubclass(MODELS[name], ShardedModel):
+            continue
+        base = None
+        for n in workers:
+            seconds, _ = _best_of(lambda: MODELS[name]().predict_parallel(df, horizon, workers=n), repeat)
+            base = base or seconds
+            rows.append({"model": name, "workers": n, "wall_ms": round(seconds * 1000, 1), "speedup": round(base / seconds, 2)})
+    return pd.DataFrame(rows)
+
+
+def replicate_panel(df, copies) -> pd.DataFrame:
+    """The panel repeated `copies` times as distinct series (larger synthetic panels for scaling runs)."""
+    if copies <= 1:
+        return df
+    n_ids = int(df["series_id"].max()) + 1
+    n_stores = int(df["store_nbr"].max())
+    frames = [df.assign(series_id=df["series_id"] + k * n_ids, store_nbr=df["store_nbr"] + k * n_stores) for k in range(copies)]
+    return pd.concat(frames, ignore_index=True)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Fit / predict time of the weekly baselines over the full panel")
+    parser.add_argument("--path", type=Path, default=WEEKLY_CANON_PATH, help="weekly_canon dataset")
+    parser.add_argument("--horizon", type=int, default=8, help="forecast horizon (weeks)")
+    parser.add_argument("--repeat", type=int, default=3, help="runs per measure (best kept)")
+    parser.add_argument("--models", nargs="+", choices=list(MODELS), default=None)
+    parser.add_argument("--workers", nargs="+", type=int, default=None,
+                        help="process counts for a scaling run of the sharded baselines (e.g. 1 2 4 8)")
+    parser.add_argument("--replicate", type=int, default=1, help="repeat the panel as new series N times")
+    args = parser.parse_args()
+
+    df = read_canon(args.path)
+    df = df[df["is_train_day"] > 0]  # history only
+    df = replicate_panel(df, args.replicate)
+    n_series = df.groupby(["store_nbr", "family"], observed=True).ngroups
+    print(f"Panel: {len(df):,} rows, {n_series:,} series, {df['week_start'].nunique()} weeks")
+    if args.workers:
+        print(scaling(df, args.workers, horizon=args.horizon, repeat=args.repeat, models=args.models).to_string(index=False))
+    else:
+        print(benchmark(df, horizon=args.horizon, repeat=args.repeat, models=args.models).to_string(index=False))
+
+
+if __name__ == "__main__":
+    main()
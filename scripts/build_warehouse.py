@@ -1,11 +1,17 @@
 import sqlite3
+import sys
 import pandas as pd
 from pathlib import Path
 
+sys.path.append(str(Path(__file__).resolve().parent.parent))
+from src.data.storage import iter_canon_batches
+from src.data.validation import TableProfile, write_quality_report
+
 # Paths
 DB_PATH = "data/retail.sqlite"
 
 DATA_DIR = Path("data/processed")
+QUALITY_REPORT_PATH = DATA_DIR / "_quality.json"
 
 def build_warehouse():
     print(f"BUILDING WAREHOUSE: {DB_PATH}")
@@ -31,38 +37,59 @@ def build_warehouse():
     con.commit()
     print("Schema applied successfully.")
     
+    # Data-quality profiles of the loaded tables, computed on the batches as they stream in
+    profiles = []
+
     # helper
-    def load_parquet_to_sql(parquet_path: Path, table_name: str, rename_map: dict = None, drop_cols: list = None):
+    def load_parquet_to_sql(
+        parquet_path: Path, table_name: str, rename_map: dict = None, drop_cols: list = None, profile: TableProfile = None
+    ):
         if not parquet_path.exists():
             print(f"Skipping {table_name}: File not found.")
             return
 
         print(f"Loading {table_name} from {parquet_path.name}...")
-        df = pd.read_parquet(parquet_path)
-        
-        # Datetime conversion for SQLite (Text)
-        for col in df.select_dtypes(include=['datetime64[ns]']).columns:
-            df[col] = df[col].dt.strftime('%Y-%m-%d')
-            
-        if rename_map:
-            df = df.rename(columns=rename_map)
-            
-        if drop_cols:
-            df = df.drop(columns=[c for c in drop_cols if c in df.columns], errors='ignore')
-            
-        # Append to table
-        try:
-            # We use 'append' because table exists from schema.
-            # However, pandas might fail if schema mismatch. 
-            # Best practice: strict insertion or using if_exists='append'
-            df.to_sql(table_name, con, if_exists='append', index=False)
-            print(f"Loaded {len(df):,} rows into {table_name}.")
-        except Exception as e:
-            print(f"ERROR loading {table_name}: {e}")
+        # Partitioned facts are streamed one partition at a time; plain files come as one batch
+        if parquet_path.is_dir():
+            batches = iter_canon_batches(parquet_path)
+        else:
+            batches = [pd.read_parquet(parquet_path)]
+
+        n_rows = 0
+        for df in batches:
+            if profile is not None:
+                profile.update(df)
+            # Datetime conversion for SQLite (Text)
+            for col in df.select_dtypes(include=['datetime64']).columns:
+                df[col] = df[col].dt.strftime('%Y-%m-%d')
+                
+            if rename_map:
+                df = df.rename(columns=rename_map)
+                
+            if drop_cols:
+                df = df.drop(columns=[c for c in drop_cols if c in df.columns], errors='ignore')
+                
+            # Append to table
+            try:
+                # We use 'append' because table exists from schema.
+                # However, pandas might fail if schema mismatch. 
+                # Best practice: strict insertion or using if_exists='append'
+                df.to_sql(table_name, con, if_exists='append', index=False)
+                n_rows += len(df)
+            except Exception as e:
+                print(f"ERROR loading {table_name}: {e}")
+                return
+        print(f"Loaded {n_rows:,} rows into {table_name}.")
+        if profile is not None:
+            profiles.append(profile.summary())
 
     # 2. Load Dimensions
-    load_parquet_to_sql(DATA_DIR / "dim_store.parquet", "dim_store")
-    load_parquet_to_sql(DATA_DIR / "dim_family.parquet", "dim_family")
+    load_parquet_to_sql(DATA_DIR / "dim_store.parquet", "dim_store", profile=TableProfile("dim_store", key=["store_nbr"]))
+    load_parquet_to_sql(DATA_DIR / "dim_family.parquet", "dim_family", profile=TableProfile("dim_family", key=["family_id"]))
+    load_parquet_to_sql(
+        DATA_DIR / "dim_series.parquet", "dim_series", drop_cols=["family"],
+        profile=TableProfile("dim_series", key=["series_id"]),
+    )
     load_parquet_to_sql(DATA_DIR / "dim_calendar.parquet", "dim_date")
 
     # DIM_WEEK (Derived)
@@ -88,9 +115,11 @@ def build_warehouse():
         "dcoilwtico": "dcoilwtico_filled",
         "set": "set_type"
     }
-    # Drop columns not in schema (id + denormalized store columns + extra flags + denormalized calendar)
+    # Drop columns not in schema (id + series labels + denormalized store columns + extra flags + denormalized calendar)
+    # Facts are keyed on series_id only; labels come back through dim_series / v_sales_daily.
     extra_daily = [
         "id", 
+        "store_nbr", "family", "family_id",
         "city", "state", "type", "cluster", 
         "is_bridge", "is_transfer_type", "n_holidays", "n_events",
         "day_of_week", "year", "month", "day", "quarter", "is_weekend",
@@ -100,7 +129,10 @@ def build_warehouse():
         "is_train_day", "is_test_day"
     ]
     # Check what else is in daily_canon: is_bridge, is_transfer_type, n_holidays, n_events are in process but not in daily schema
-    load_parquet_to_sql(DATA_DIR / "daily_canon.parquet", "fact_sales_daily", rename_map=daily_map, drop_cols=extra_daily)
+    load_parquet_to_sql(
+        DATA_DIR / "daily_canon.parquet", "fact_sales_daily", rename_map=daily_map, drop_cols=extra_daily,
+        profile=TableProfile("daily_canon", key=["series_id", "date"], date_col="date"),
+    )
     
     # Mapping for weekly
     weekly_map = {
@@ -118,9 +150,18 @@ def build_warehouse():
         "is_test_day": "is_test_day_count"
     }
     # Drop columns not in schema
-    extra_weekly = ["transactions_missing", "is_bridge", "is_transfer_type"] 
+    extra_weekly = ["transactions_missing", "is_bridge", "is_transfer_type", "store_nbr", "family", "family_id"] 
     # Also check if other columns need dropping. The error complained about is_bridge.
-    load_parquet_to_sql(DATA_DIR / "weekly_canon.parquet", "fact_sales_weekly", rename_map=weekly_map, drop_cols=extra_weekly)
+    load_parquet_to_sql(
+        DATA_DIR / "weekly_canon.parquet", "fact_sales_weekly", rename_map=weekly_map, drop_cols=extra_weekly,
+        profile=TableProfile("weekly_canon", key=["series_id", "week_start"], date_col="week_start", date_step=7),
+    )
+
+    # 5. Demand-class routing table (segmentation dimension of the metrics)
+    load_parquet_to_sql(
+        DATA_DIR / "dim_routing.parquet", "dim_routing",
+        profile=TableProfile("dim_routing", key=["series_id", "cutoff"], date_col="cutoff", date_step=7),
+    )
 
     # Verification
     print("\n--- Verification ---")
@@ -131,6 +172,7 @@ def build_warehouse():
     print(f"Row Count Weekly: {c_weekly:,}")
     
     con.close()
+    write_quality_report(QUALITY_REPORT_PATH, profiles)
     print("\nWarehouse built successfully!")
 
 if __name__ == "__main__":
@@ -0,0 +1,58 @@
+import argparse
+import sys
+from pathlib import Path
+
+import pandas as pd
+
+# Add project root to path so we can import from src
+PROJECT_ROOT = Path(__file__).resolve().parent.parent
+sys.path.append(str(PROJECT_ROOT))
+
+from src.data.storage import read_canon
+from src.data.save_results import register_run, save_forecasts
+from src.baselines.quantiles import EmpiricalQuantiles, forecast_rows
+from src.baselines.registry import MODELS
+
+WEEKLY_CANON_PATH = PROJECT_ROOT / "data" / "processed" / "weekly_canon.parquet"
+
+
+def quantile_forecast(df, model="PiecewiseHybrid", horizon=8, n_origins=26, min_obs=8) -> pd.DataFrame:
+    """
+    Point forecast of a baseline at the end of df plus its empirical residual quantiles
+    (rolling-origin backtest, src/baselines/quantiles.py), in the fact_forecasts_weekly layout.
+    """
+    quantiles = EmpiricalQuantiles(MODELS[model], horizon=horizon, n_origins=n_origins, min_obs=min_obs).fit(df)
+    forecast = MODELS[model]().fit(df).predict(horizon)
+    return forecast_rows(quantiles.apply(forecast))
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Probabilistic (P10/P50/P90) forecasts of a weekly baseline")
+    parser.add_argument("--path", type=Path, default=WEEKLY_CANON_PATH, help="weekly_canon dataset")
+    parser.add_argument("--model", choices=list(MODELS), default="PiecewiseHybrid")
+    parser.add_argument("--horizon", type=int, default=8, help="forecast horizon (weeks)")
+    parser.add_argument("--origins", type=int, default=26, help="backtest origins for the residuals")
+    parser.add_argument("--min-obs", type=int, default=8, help="residuals needed for a series / step interval")
+    parser.add_argument("--dry-run", action="store_true", help="print the forecasts without saving them")
+    args = parser.parse_args()
+
+    df = read_canon(args.path)
+    df = df[df["is_train_day"] > 0]  # history only
+    rows = quantile_forecast(df, args.model, args.horizon, args.origins, args.min_obs)
+    print(rows.head(args.horizon).to_string(index=False))
+    if args.dry_run:
+        return
+
+    end = df["week_start"].max().isocalendar()
+    run_id = register_run(
+        end.year * 100 + end.week, args.model,
+        {"quantiles": "empirical_residuals", "origins": args.origins, "min_obs": args.min_obs},
+        horizon=args.horizon,
+    )
+    if run_id is None:
+        sys.exit("ERROR: run not registered in dim_runs, forecasts not saved")
+    save_forecasts(rows, run_id)
+
+
+if __name__ == "__main__":
+    main()
@@ -1,4 +1,5 @@
 from __future__ import annotations
+import argparse
 import sys
 from pathlib import Path
 
@@ -6,38 +7,141 @@ from pathlib import Path
 PROJECT_ROOT = Path(__file__).resolve().parent.parent
 sys.path.append(str(PROJECT_ROOT))
 
-from src.data.make_dataset import generate_sales_dataset
+from src.data.pipeline import Stage, run_pipeline
+from src.data.make_dataset import (
+    RAW_DATA_DIR,
+    STAGING_DATA_DIR,
+    PROCESSED_DATA_DIR,
+    generate_sales_dataset,
+    generate_dimensions,
+    generate_holiday_bridge,
+)
 from src.data.make_calendar import generate_calendar_dataset
+from src.baselines.routing import ROUTING_PATH, refresh_routing
+
+STAMP_DIR = STAGING_DATA_DIR / "_stages"
+DATA_SRC = PROJECT_ROOT / "src" / "data"
+
+# Code each stage depends on (its cache key changes when one of these files changes)
+SALES_CODE = [DATA_SRC / f for f in (
+    "make_dataset.py", "load.py", "process.py", "holidays.py", "keys.py",
+    "storage.py", "incremental.py", "validation.py", "schema.py", "calendar_features.py",
+)]
+DIMENSION_CODE = [DATA_SRC / f for f in ("make_dataset.py", "load.py", "keys.py")]
+BRIDGE_CODE = [DATA_SRC / f for f in ("make_dataset.py", "load.py", "holidays.py")]
+ROUTING_CODE = [PROJECT_ROOT / "src" / "baselines" / f for f in ("routing.py", "panel.py")]
+
+
+def raw(name: str) -> Path:
+    return RAW_DATA_DIR / name
+
+
+def build_stages(
+    streaming: bool = False,
+    incremental: bool = False,
+    warehouse: bool = False,
+    shards: int = 1,
+    max_memory: float | None = None,
+) -> list[Stage]:
+    """
+    calendar / holiday_bridge / dimensions / sales do not depend on each other and run
+    concurrently; the routing table follows sales, the warehouse load (optional) waits
+    for all of them.
+    shards > 1 splits the sales stage by store over its own pool of `shards` workers.
+    max_memory (MB) builds the sales stage in blocks that fit the budget.
+    """
+    stages = [
+        Stage(
+            "calendar",
+            generate_calendar_dataset,
+            outputs=[PROCESSED_DATA_DIR / "dim_calendar.parquet"],
+        ),
+        Stage(
+            "holiday_bridge",
+            generate_holiday_bridge,
+            inputs=[raw("holidays_events.csv"), raw("stores.csv")],
+            outputs=[PROCESSED_DATA_DIR / "bridge_event_store_day.parquet"],
+            code=BRIDGE_CODE,
+        ),
+        Stage(
+            "dimensions",
+            generate_dimensions,
+            inputs=[raw("stores.csv"), raw("train.csv"), raw("test.csv")],
+            outputs=[PROCESSED_DATA_DIR / f"{d}.parquet" for d in ("dim_store", "dim_family", "dim_series")],
+            code=DIMENSION_CODE,
+        ),
+        Stage(
+            "sales",
+            generate_sales_dataset,
+            inputs=[raw(f) for f in (
+                "train.csv", "test.csv", "stores.csv", "oil.csv", "holidays_events.csv", "transactions.csv",
+            )],
+            outputs=[PROCESSED_DATA_DIR / "daily_canon.parquet", PROCESSED_DATA_DIR / "weekly_canon.parquet"],
+            code=SALES_CODE,
+            kwargs={
+                "streaming": streaming, "incremental": incremental, "exports": False,
+                "workers": shards, "max_memory": max_memory,
+            },
+        ),
+        Stage(
+            "routing",
+            refresh_routing,
+            inputs=[PROCESSED_DATA_DIR / "weekly_canon.parquet"],
+            outputs=[ROUTING_PATH],
+            deps=["sales"],
+            code=ROUTING_CODE,
+        ),
+    ]
+    if warehouse:
+        from scripts.build_warehouse import build_warehouse
+
+        stages.append(Stage(
+            "warehouse",
+            build_warehouse,
+            inputs=[p for s in stages for p in s.outputs] + sorted(Path("sql").glob("*.sql")),
+            outputs=[Path("data/retail.sqlite")],
+            deps=[s.name for s in stages],
+        ))
+    return stages
+
 
 def main():
+    parser = argparse.ArgumentParser(description="Preprocessing pipeline (cached stage DAG)")
+    parser.add_argument("--streaming", action="store_true", help="chunked Arrow ingestion of the raw CSVs")
+    parser.add_argument("--incremental", action="store_true", help="only rebuild the weeks after the watermark")
+    parser.add_argument("--warehouse", action="store_true", help="also (re)build data/retail.sqlite")
+    parser.add_argument("--force", action="store_true", help="ignore the stage cache")
+    parser.add_argument("--workers", type=int, default=None, help="process pool size (1 = sequential)")
+    parser.add_argument("--shards", type=int, default=1, help="store-sharded sales build on N processes")
+    parser.add_argument("--max-memory", type=float, default=None, help="memory budget (MB) of the sales build")
+    args = parser.parse_args()
+
     print("---------------------------------------------------")
     print("STARTING PREPROCESSING PIPELINE")
     print("---------------------------------------------------")
-    
-    # 1. Generate Sales Data (Daily & Weekly)
-    print("\n[Step 1/2] Generating Sales Datasets (Daily Grid & Weekly Agg)")
-    try:
-        generate_sales_dataset()
-        print("PASS: Sales datasets generated successfully.")
-    except Exception as e:
-        print(f"ERROR: generating sales datasets: {e}")
-        sys.exit(1)
-        
-    # 2. Generate Calendar Dimension
-    print("\n[Step 2/2] Generating Calendar Dimension")
+
+    stages = build_stages(
+        streaming=args.streaming,
+        incremental=args.incremental,
+        warehouse=args.warehouse,
+        shards=args.shards,
+        max_memory=args.max_memory,
+    )
     try:
-        generate_calendar_dataset()
-        print("PASS: Calendar dimension generated successfully.")
+        run_pipeline(stages, STAMP_DIR, max_workers=args.workers, force=args.force)
     except Exception as e:
-        print(f"ERROR: generating calendar: {e}")
+        print(f"ERROR: {e}")
         sys.exit(1)
-        
+
     print("\n---------------------------------------------------")
-    print("PIPELINE COMPLETED SUCCESSFULLY") 
+    print("PIPELINE COMPLETED SUCCESSFULLY")
     print("Output Files:")
     print("- data/processed/weekly_canon.parquet (Source of Truth)")
     print("- data/processed/dim_calendar.parquet (Reference)")
     print("- data/processed/daily_canon.parquet (Backup)")
+    print("- data/processed/dim_store|dim_family|dim_series.parquet, bridge_event_store_day.parquet")
+    if args.warehouse:
+        print("- data/retail.sqlite")
     print("---------------------------------------------------")
 
 if __name__ == "__main__":
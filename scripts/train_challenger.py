@@ -6,58 +6,26 @@ import os
 
 # Add root to path for imports
 sys.path.append('.')
-from src.features.features import RetailFeatureEngineer, create_lags
+from src.features.streaming import quantize_pools, write_pool_files
 
 def train_and_evaluate():
-    print("--- 1. Loading Data ---")
+    print("--- 1+2+3. Streaming Features into Pools (Validation: Aug 2017) ---")
+    # Features read from the feature store (recomputed only when daily_canon or the feature
+    # code changed) a few stores at a time; per batch: rows without sales / sales_lag_28
+    # dropped, non-feature columns dropped, categoricals coded. Batches go to TSV files.
     try:
-        df = pd.read_parquet('data/processed/daily_canon.parquet')
-        df = df.sort_values(by=['store_nbr', 'family', 'date']).reset_index(drop=True)
+        pools = write_pool_files(split_date='2017-08-01', lags=[7, 14, 28], required=['sales_lag_28'], verbose=True)
     except Exception as e:
         print(f"Error loading data: {e}")
         return
+    # CatBoost quantizes the TSV files from disk
+    try:
+        pools = quantize_pools()
+    except Exception as e:
+        print(f"Error quantizing pools: {e}")
+        return
 
-    print("--- 2. Feature Engineering ---")
-    # Lags
-    df_features = create_lags(df, lags=[7, 14, 28])
-    
-    # Custom Features
-    engineer = RetailFeatureEngineer()
-    df_features = engineer.transform(df_features)
-    
-    # Drop NaNs from Lags
-    df_features = df_features.dropna(subset=['sales_lag_28'])
-    
-    # CRITICAL FIX: Tweedie fails on NaN target. Ensure 'sales' is clean.
-    # Sales shouldn't be NaN in train set, but let's be safe.
-    df_features = df_features.dropna(subset=['sales']) 
-    
-    print(f"Data ready: {df_features.shape}")
-
-    print("--- 3. Splitting Data (Validation: Aug 2017) ---")
-    split_date = '2017-08-01'
-    mask_train = df_features['date'] < split_date
-    mask_val = (df_features['date'] >= split_date) & (df_features['is_train_day'] == 1)
-
-    X = df_features.drop(columns=['sales', 'date', 'id', 'set', 'transactions', 'transactions_missing'])
-    y = df_features['sales']
-
-    # Identify Categoricals
-    # Note: In the notebook we listed these. CatBoost needs indices or names.
-    cat_cols = ['store_nbr', 'family', 'city', 'state', 'type', 'cluster']
-    # Ensure they exist
-    cat_features = [c for c in cat_cols if c in X.columns]
-    
-    # Fill Nans in categorical if any (parquet shouldn't have them but for safety)
-    for c in cat_features:
-        X[c] = X[c].astype(str)
-
-    X_train = X[mask_train]
-    y_train = y[mask_train]
-    X_val = X[mask_val]
-    y_val = y[mask_val]
-
-    print(f"Train samples: {len(X_train)}, Val samples: {len(X_val)}")
+    print(f"Train samples: {pools['rows']['train']}, Val samples: {pools['rows']['val']}")
 
     print("--- 4. Training CatBoost ---")
     model = CatBoostRegressor(
@@ -71,13 +39,16 @@ def train_and_evaluate():
         allow_writing_files=False # Keep it clean
     )
 
-    train_pool = Pool(X_train, y_train, cat_features=cat_features)
-    val_pool = Pool(X_val, y_val, cat_features=cat_features)
+    # Quantized pools: one byte per feature value in memory, val on the train borders
+    train_pool = Pool('quantized://' + pools['quantized']['train'])
+    val_pool = Pool('quantized://' + pools['quantized']['val'])
 
     model.fit(train_pool, eval_set=val_pool, early_stopping_rounds=50)
 
     print("--- 5. Evaluation ---")
-    preds = model.predict(X_val)
+    # Predictions on the quantized validation pool (same bins as the raw values)
+    y_val = np.asarray(val_pool.get_label(), dtype=float)
+    preds = model.predict(val_pool)
     preds = np.maximum(preds, 0)
     
     # WAPE
@@ -86,7 +57,7 @@ def train_and_evaluate():
     
     # Feature Importance
     importances = model.get_feature_importance()
-    feature_names = X_train.columns
+    feature_names = pools['features']
     
     fi = pd.DataFrame({'feature': feature_names, 'importance': importances})
     fi = fi.sort_values(by='importance', ascending=False).head(15)
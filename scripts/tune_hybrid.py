@@ -0,0 +1,45 @@
+import argparse
+import json
+import sys
+from pathlib import Path
+
+# Add project root to path so we can import from src
+PROJECT_ROOT = Path(__file__).resolve().parent.parent
+sys.path.append(str(PROJECT_ROOT))
+
+from src.data.storage import read_canon
+from src.data.save_results import register_run
+from src.baselines.tuning import ADI_CUTOFFS, CV2_CUTOFFS, SN_WEIGHTS, WINDOWS, best_config, component_tensors
+
+WEEKLY_CANON_PATH = PROJECT_ROOT / "data" / "processed" / "weekly_canon.parquet"
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Grid search of the PiecewiseHybrid blend weights, MA window and ADI/CV2 cutoffs")
+    parser.add_argument("--path", type=Path, default=WEEKLY_CANON_PATH, help="weekly_canon dataset")
+    parser.add_argument("--horizon", type=int, default=8, help="forecast horizon (weeks)")
+    parser.add_argument("--origins", type=int, default=12, help="backtest folds (rolling origins)")
+    parser.add_argument("--step", type=int, default=4, help="weeks between origins")
+    parser.add_argument("--windows", nargs="+", type=int, default=list(WINDOWS))
+    parser.add_argument("--weights", nargs="+", type=float, default=list(SN_WEIGHTS), help="SN weights to try")
+    parser.add_argument("--adi", nargs="+", type=float, default=list(ADI_CUTOFFS), help="ADI cutoffs to try")
+    parser.add_argument("--cv2", nargs="+", type=float, default=list(CV2_CUTOFFS), help="CV2 cutoffs to try")
+    parser.add_argument("--dry-run", action="store_true", help="print the best configuration without registering a run")
+    args = parser.parse_args()
+
+    df = read_canon(args.path)
+    df = df[df["is_train_day"] > 0]  # history only
+    tensors = component_tensors(df, args.windows, args.horizon, args.origins, args.step)
+    result = best_config(tensors, args.weights, args.adi, args.cv2)
+    print(json.dumps(result, indent=2))
+    if args.dry_run:
+        return
+
+    end = df["week_start"].max().isocalendar()
+    run_id = register_run(end.year * 100 + end.week, "PiecewiseHybrid", result, horizon=args.horizon)
+    if run_id is None:
+        sys.exit("ERROR: the best configuration was not registered in dim_runs")
+
+
+if __name__ == "__main__":
+    main()
@@ -8,7 +8,19 @@ CREATE TABLE dim_store (
     cluster INTEGER
 );
 -- DIM_FAMILY
-CREATE TABLE dim_family (family TEXT PRIMARY KEY);
+CREATE TABLE dim_family (
+    family_id INTEGER PRIMARY KEY,
+    family TEXT UNIQUE
+);
+-- DIM_SERIES (Grain: Store + Family, integer key used by every fact table)
+CREATE TABLE dim_series (
+    series_id INTEGER PRIMARY KEY,
+    store_nbr INTEGER,
+    family_id INTEGER,
+    UNIQUE (store_nbr, family_id),
+    FOREIGN KEY (store_nbr) REFERENCES dim_store(store_nbr),
+    FOREIGN KEY (family_id) REFERENCES dim_family(family_id)
+);
 -- DIM_DATE (Grain: Daily)
 CREATE TABLE dim_date (
     date TEXT PRIMARY KEY,
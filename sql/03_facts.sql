@@ -1,9 +1,8 @@
 -- 3. FACTS
--- FACT_SALES_DAILY (Grain: Date + Store + Family)
+-- FACT_SALES_DAILY (Grain: Date + Series)
 CREATE TABLE fact_sales_daily (
     date TEXT,
-    store_nbr INTEGER,
-    family TEXT,
+    series_id INTEGER,
     set_type TEXT,
     -- 'train' or 'test'
     sales REAL,
@@ -15,17 +14,15 @@ CREATE TABLE fact_sales_daily (
     is_holiday INTEGER,
     is_event INTEGER,
     is_workday INTEGER,
-    PRIMARY KEY (date, store_nbr, family),
-    FOREIGN KEY (store_nbr) REFERENCES dim_store(store_nbr),
-    FOREIGN KEY (family) REFERENCES dim_family(family),
+    PRIMARY KEY (date, series_id),
+    FOREIGN KEY (series_id) REFERENCES dim_series(series_id),
     FOREIGN KEY (date) REFERENCES dim_date(date)
 );
 -- FACT_SALES_WEEKLY (The Source of Truth)
 CREATE TABLE fact_sales_weekly (
     week_start TEXT,
     year_week INTEGER,
-    store_nbr INTEGER,
-    family TEXT,
+    series_id INTEGER,
     -- Metrics
     sales_sum REAL,
     onpromotion_sum REAL,
@@ -45,8 +42,7 @@ CREATE TABLE fact_sales_weekly (
     is_future INTEGER,
     -- 1 if week touches future (sales_sum is unknown/null)
     -- 0/1
-    PRIMARY KEY (year_week, store_nbr, family),
+    PRIMARY KEY (year_week, series_id),
     FOREIGN KEY (year_week) REFERENCES dim_week(year_week),
-    FOREIGN KEY (store_nbr) REFERENCES dim_store(store_nbr),
-    FOREIGN KEY (family) REFERENCES dim_family(family)
+    FOREIGN KEY (series_id) REFERENCES dim_series(series_id)
 );
\ No newline at end of file
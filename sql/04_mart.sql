@@ -12,32 +12,43 @@ CREATE TABLE dim_runs (
     -- 'prophet', 'xgb', ...
     params_json TEXT
 );
+-- DIM_ROUTING (Demand class of each series at each cutoff week, see src/baselines/routing.py)
+-- Segmentation dimension: join on series_id + cutoff = week_start_date of a run's train_end_year_week
+CREATE TABLE dim_routing (
+    series_id INTEGER,
+    cutoff TEXT,
+    -- week_start of the last training week
+    demand_type TEXT,
+    -- 'smooth', 'erratic', 'intermittent', 'lumpy'
+    adi REAL,
+    cv2 REAL,
+    PRIMARY KEY (series_id, cutoff),
+    FOREIGN KEY (series_id) REFERENCES dim_series(series_id)
+);
 -- FACT_FORECASTS_WEEKLY
 CREATE TABLE fact_forecasts_weekly (
     run_id TEXT,
     year_week INTEGER,
-    store_nbr INTEGER,
-    family TEXT,
+    series_id INTEGER,
     horizon_step INTEGER,
     -- 1 to 8
     yhat_mean REAL,
     yhat_p10 REAL,
     yhat_p50 REAL,
     yhat_p90 REAL,
-    PRIMARY KEY (run_id, year_week, store_nbr, family),
+    PRIMARY KEY (run_id, year_week, series_id),
     FOREIGN KEY (run_id) REFERENCES dim_runs(run_id)
 );
 -- FACT_INVENTORY_DECISIONS_WEEKLY
 CREATE TABLE fact_inventory_decisions_weekly (
     run_id TEXT,
     year_week INTEGER,
-    store_nbr INTEGER,
-    family TEXT,
+    series_id INTEGER,
     order_qty REAL,
     safety_stock REAL,
     service_level REAL,
     policy TEXT,
-    PRIMARY KEY (run_id, year_week, store_nbr, family)
+    PRIMARY KEY (run_id, year_week, series_id)
 );
 -- FACT_BACKTEST_METRICS
 CREATE TABLE fact_backtest_metrics (
@@ -55,8 +66,7 @@ CREATE TABLE fact_backtest_metrics (
 CREATE TABLE fact_drift_weekly (
     run_id TEXT,
     year_week INTEGER,
-    store_nbr INTEGER,
-    family TEXT,
+    series_id INTEGER,
     drift_score REAL,
     flag_alert INTEGER
 );
\ No newline at end of file
@@ -0,0 +1,15 @@
+-- 5. VIEWS (labels back on top of the integer-keyed facts)
+CREATE VIEW v_sales_daily AS
+SELECT f.*,
+    s.store_nbr,
+    fam.family
+FROM fact_sales_daily f
+    JOIN dim_series s ON s.series_id = f.series_id
+    JOIN dim_family fam ON fam.family_id = s.family_id;
+CREATE VIEW v_sales_weekly AS
+SELECT f.*,
+    s.store_nbr,
+    fam.family
+FROM fact_sales_weekly f
+    JOIN dim_series s ON s.series_id = f.series_id
+    JOIN dim_family fam ON fam.family_id = s.family_id;
\ No newline at end of file
@@ -0,0 +1,117 @@
+import numpy as np
+import pandas as pd
+
+# Batched intermittent-demand engine.
+# Croston / SBA / TSB smoothing of every series at once: the recursion walks the time
+# axis of the (series x weeks) matrix, and each step is a masked update of the state
+# vectors (one entry per series). The final state is returned, so the recursion can be
+# resumed on new weeks instead of replayed from the start.
+#
+# Per period, for a series that has started (first non-NaN week seen; NaN weeks after
+# that count as zero demand):
+#   q += 1                                  periods since the last demand
+#   demand y > 0, first one:  z = y, p = q  (p = periods from the series start)
+#   demand y > 0, later ones: z = a*y + (1-a)*z, p = a*q + (1-a)*p
+#   TSB: b = 1/p at the first demand, then b += beta * (1[y > 0] - b) every period
+#   after a demand q = 0
+# legacy_interval (default) keeps the original CrostonSBA loop: only weeks with a row count
+# in q, and after the first demand q continues from p instead of restarting (the leading
+# weeks are counted again in the next interval). legacy_interval=False restarts it.
+# Forecast per period: croston z/p, sba (1 - a/2) z/p, tsb b*z (0 before any demand).
+
+METHODS = ('croston', 'sba', 'tsb')
+
+
+class CrostonState:
+    """Final smoothing state of each series (arrays aligned with the matrix rows)."""
+    def __init__(self, n_series):
+        self.z = np.zeros(n_series)                   # smoothed demand size
+        self.p = np.zeros(n_series)                   # smoothed inter-demand interval
+        self.b = np.zeros(n_series)                   # smoothed demand probability (TSB)
+        self.q = np.zeros(n_series)                   # periods since the last demand
+        self.alive = np.zeros(n_series, dtype=bool)   # first non-NaN period seen
+        self.demand = np.zeros(n_series, dtype=bool)  # first demand seen
+
+    def __len__(self):
+        return len(self.z)
+
+    def take(self, rows):
+        """State of a subset of series (rows = positions)."""
+        out = CrostonState(0)
+        for k, v in vars(self).items():
+            setattr(out, k, v[rows].copy())
+        return out
+
+    def to_frame(self):
+        return pd.DataFrame(vars(self))
+
+    def to_arrays(self):
+        return dict(vars(self))
+
+    @classmethod
+    def from_arrays(cls, arrays):
+        out = cls(0)
+        for k in vars(out):
+            setattr(out, k, arrays[k])
+        return out
+
+
+def per_series(value, n_series, name='alpha'):
+    """Scalar or one value per series -> float64 array of length n_series."""
+    value = np.asarray(value, dtype=np.float64)
+    if value.ndim == 0:
+        return np.full(n_series, float(value))
+    if value.shape != (n_series,):
+        raise ValueError(f"{name} must be a scalar or have one value per series ({n_series})")
+    return value
+
+
+def croston_run(Y, alpha=0.1, beta=None, state=None, legacy_interval=True):
+    """
+    Advances the smoothing over the columns of Y (series x periods, NaN = no observation)
+    for all series at once, from `state` (None: a fresh start). alpha / beta (TSB demand
+    probability, default alpha): scalar or one value per series. legacy_interval: interval
+    counter of the original CrostonSBA (see above). Returns the final state.
+    """
+    Y = np.asarray(Y, dtype=np.float64)
+    n_series = Y.shape[0]
+    a = per_series(alpha, n_series, 'alpha')
+    bt = a if beta is None else per_series(beta, n_series, 'beta')
+    s = CrostonState(n_series) if state is None else state.take(np.arange(n_series))
+    if len(s) != n_series:
+        raise ValueError(f"state has {len(s)} series, Y has {n_series}")
+
+    for t in range(Y.shape[1]):
+        y = Y[:, t]
+        observed = ~np.isnan(y)
+        s.alive |= observed
+        s.q += observed if legacy_interval else s.alive
+        d = y > 0
+        again = d & s.demand
+        first = d & ~s.demand
+        # TSB probability: every period after the first demand
+        s.b = np.where(s.demand, s.b + bt * (d - s.b), s.b)
+        s.z = np.where(again, a * y + (1 - a) * s.z, s.z)
+        s.p = np.where(again, a * s.q + (1 - a) * s.p, s.p)
+        s.z[first] = y[first]
+        s.p[first] = s.q[first]
+        s.b[first] = 1.0 / s.q[first]
+        s.demand |= d
+        s.q[d] = 0
+        if legacy_interval:
+            s.q[first] = s.p[first] - 1
+    return s
+
+
+def croston_forecast(state, method='sba', alpha=0.1):
+    """Flat per-period forecast of each series from its state."""
+    if method not in METHODS:
+        raise ValueError(f"Unknown method '{method}' (known: {list(METHODS)})")
+    if method == 'tsb':
+        return np.where(state.demand, state.b * state.z, 0.0)
+    with np.errstate(invalid='ignore', divide='ignore'):
+        rate = np.where(state.demand, state.z / state.p, 0.0)
+    if method == 'sba':
+        # SBA Correction factor (1 - alpha/2)
+        rate = (1 - per_series(alpha, len(state)) / 2) * rate
+    return rate
@@ -1,6 +1,21 @@
 import pandas as pd
 import numpy as np
 from abc import ABC, abstractmethod
+from src.data.keys import series_labels
+from src.baselines.intermittent import METHODS, CrostonState, croston_forecast, croston_run, per_series
+from src.baselines.panel import weekly_panel
+from src.baselines.parallel import ShardedModel
+from src.baselines.state import OnlineModel, SeriesState, new_weeks, week_columns
+
+def label_cols(df):
+    """Series identifiers carried to the forecast output (series_id first when available)."""
+    return [c for c in ['series_id', 'store_nbr', 'family'] if c in df.columns]
+
+def attach_labels(values, df):
+    """values is keyed on series_key(df); adds the store_nbr/family labels when grouping on series_id."""
+    if 'series_id' in values.columns and len(label_cols(df)) > 1:
+        return series_labels(df)[label_cols(df)].merge(values, on='series_id', how='right')
+    return values
 
 class BaseForecastModel(ABC):
     @abstractmethod
@@ -13,6 +28,18 @@ class BaseForecastModel(ABC):
         """Predict for next horizon steps."""
         pass
 
+def flat_horizon(values, last_date, horizon_weeks):
+    """
+    Constant forecast over the horizon: values (labels + 'yhat_flat', one row per series)
+    broadcast to one row per step and series, step-major.
+    """
+    dates = last_date + pd.to_timedelta(7 * np.arange(1, horizon_weeks + 1), unit='D')
+    rows = np.tile(np.arange(len(values)), horizon_weeks)
+    final = values.iloc[rows].reset_index(drop=True)
+    final['forecast_date'] = np.repeat(dates, len(values))
+    final.rename(columns={'yhat_flat': 'yhat'}, inplace=True)
+    return final[['forecast_date'] + label_cols(final) + ['yhat']]
+
 class SeasonalNaive(BaseForecastModel):
     """
     Predicts future values based on values from 'season_length' periods ago.
@@ -21,83 +48,46 @@ class SeasonalNaive(BaseForecastModel):
     def __init__(self, season_length=52, target_col='sales'):
         self.season_length = season_length
         self.target_col = target_col
-        self.history = None
+        self.panel = None
 
     def fit(self, df):
         """
-        df must have 'year_week', 'store_nbr', 'family', and target_col.
-        We just store the history needed for lookback.
+        df must have 'week_start', 'series_id' (or 'store_nbr', 'family'), and target_col.
+        We just store the history as a (series x week) matrix for the lookback.
         """
-        self.history = df.copy()
-        # Sort to ensure correct shift
-        self.history = self.history.sort_values(by=['store_nbr', 'family', 'week_start'])
+        self.panel = weekly_panel(df, self.target_col, skipna=False)
+        self.labels = attach_labels(self.panel.index, df)
         return self
 
     def predict(self, horizon_weeks, future_dates=None):
         """
         Generates forecast for horizon_weeks.
         Returns DataFrame with keys + 'yhat'.
+        Forecast(T+k) = Actual(T+k - season_length), T = last week of the history; series
+        without a row for that past week get no forecast row for the step.
         """
-        # In a real efficient implementation, we would do a join.
-        # Here we take the last season_length weeks from history and project them forward.
-        
-        # This implementation assumes we are forecasting for *existing* series.
-        # We shift the entire history by season_length weeks forward.
-        
-        forecasts = []
-        
-        # We iterate per group for clarity (can be vectorized for speed later)
-        # But actually, vectorized shift is better.
-        
-        # Vectorized Approach:
-        # Take the slice of history that corresponds to [End - season_length, End]
-        # And map it to [End, End + season_length] (roughly)
-        
-        # Simplest Seasonal Naive Logic for "Next 8 weeks":
-        # Find the values from (Now - 52 weeks) to (Now - 52 + 8 weeks)
-        
-        # Let's assume 'week_start' is datetime
-        last_date = self.history['week_start'].max()
-        # Dates we need to fetch from history:
-        # [last_date - 52 weeks + 1 week, ... last_date - 52 weeks + 8 weeks]
-        # Wait, Seasonal Naive usually means: Forecast(T+1) = Actual(T+1 - 52)
-        
-        # Let's implement looking up specific past dates.
-        # This requires the history to be indexed by date preferably.
-        
-        h_indexed = self.history.set_index(['store_nbr', 'family', 'week_start'])[self.target_col]
-        
-        # Identify target dates
-        # If future_dates is provided (list of dates), use valid dates.
-        # Otherwise generate 8 weeks after last_date.
-        
-        # For simplicity in this baseline class:
-        # We perform a "Shift 52 weeks" on the history and keep only rows that land in the future horizon.
-        
-        df_shifted = self.history.copy()
-        df_shifted['pred_week_start'] = df_shifted['week_start'] + pd.to_timedelta(self.season_length, unit='W')
-        
-        # Filter only predictions that are in the future (after last history date)
-        future_start = last_date + pd.to_timedelta(1, unit='D') # Roughly
-        
-        forecast = df_shifted[df_shifted['pred_week_start'] > last_date].copy()
-        
-        # Limit to horizon
-        limit_date = last_date + pd.to_timedelta(horizon_weeks * 7 + 1, unit='D')
-        forecast = forecast[forecast['pred_week_start'] <= limit_date]
-        
-        # Rename cols
-        forecast = forecast.rename(columns={
-            'pred_week_start': 'forecast_date',
-            self.target_col: 'yhat'
-        })
-        
-        return forecast[['forecast_date', 'store_nbr', 'family', 'yhat']]
-
-class MovingAverage(BaseForecastModel):
+        weeks = self.panel.weeks
+        last_date = weeks.max()
+        season = pd.to_timedelta(self.season_length, unit='W')
+        targets = last_date + pd.to_timedelta(np.arange(1, horizon_weeks + 1), unit='W')
+        # Positional lookback: column of each target week's past week (-1: not in the history)
+        cols = weeks.get_indexer(targets - season)
+        steps = np.flatnonzero(cols >= 0)
+        cols = cols[steps]
+
+        present = self.panel.present[:, cols]
+        series, step = np.nonzero(present)  # series-major, like a history sorted on key + week
+        forecast = self.labels.iloc[series].reset_index(drop=True)
+        forecast.insert(0, 'forecast_date', targets[steps][step])
+        forecast['yhat'] = self.panel.values[:, cols][series, step]
+        return forecast[['forecast_date'] + label_cols(forecast) + ['yhat']]
+
+class MovingAverage(OnlineModel, BaseForecastModel):
     """
     Predicts future values based on average of last 'window' periods.
     Formula: Y(t) = Mean(Y(t-1)...Y(t-window))
+    State (state_): the last 'window' rows of each series (NaN-padded); update(new_week)
+    shifts them, partial_fit / save_state / load_state as in OnlineModel.
     """
     def __init__(self, window=4, target_col='sales'):
         self.window = window
@@ -105,110 +95,156 @@ class MovingAverage(BaseForecastModel):
         self.last_values = None
 
     def fit(self, df):
-        # Compute the mean of the last 'window' weeks per series
-        # We assume df is sorted
-        # Group by store/family, take last window rows, mean
-        
-        grouped = df.sort_values('week_start').groupby(['store_nbr', 'family'], observed=True)
-        
-        # Calculate the mean of the last N observations
-        self.last_values = grouped[self.target_col].apply(
-            lambda x: x.tail(self.window).mean()
-        ).reset_index()
-        
-        self.last_values.rename(columns={self.target_col: 'yhat_flat'}, inplace=True)
-        self.last_date = df['week_start'].max()
+        # Last 'window' rows of each series, read off the (series x week) matrix
+        panel = weekly_panel(df, self.target_col, skipna=False)
+        rows_from_end = np.cumsum(panel.present[:, ::-1], axis=1)[:, ::-1]
+        tail = np.full((panel.shape[0], self.window), np.nan)
+        for k in range(1, self.window + 1):
+            hit = panel.present & (rows_from_end == k)
+            has = hit.any(axis=1)
+            tail[has, self.window - k] = panel.values[has, hit[has].argmax(axis=1)]
+
+        self.state_ = SeriesState(
+            attach_labels(panel.index, df), {'tail': tail},
+            {'params': self._params(), 'last_week': str(panel.weeks.max()) if len(panel.weeks) else None},
+        )
+        self._state_changed()
         return self
 
+    def update(self, new_week):
+        """Absorbs the weeks of new_week after the last absorbed one (a series' row shifts its window)."""
+        panel, new_week = new_weeks(new_week, self.state_.meta['last_week'], self.target_col, skipna=False)
+        for week, values, present in week_columns(self.state_, panel, attach_labels(panel.index, new_week), {'tail': np.nan}):
+            tail = self.state_.arrays['tail']
+            tail[present, :-1] = tail[present, 1:]
+            tail[present, -1] = values[present]
+            self.state_.meta['last_week'] = str(week)
+        self._state_changed()
+        return self
+
+    def _state_changed(self):
+        # Mean of the window, NaN sales skipped
+        tail = self.state_.arrays['tail']
+        seen = ~np.isnan(tail)
+        with np.errstate(invalid='ignore', divide='ignore'):
+            mean = np.where(seen, tail, 0.0).sum(axis=1) / seen.sum(axis=1)
+        self.last_values = self.state_.index.assign(yhat_flat=mean)
+        self.last_date = pd.Timestamp(self.state_.meta['last_week'])
+
     def predict(self, horizon_weeks):
         # Flat forecast: same value for all horizon steps
-        # We need to replicate the row for each horizon step
-        
-        dates = [self.last_date + pd.to_timedelta((i+1)*7, unit='D') for i in range(horizon_weeks)]
-        
-        forecasts = []
-        for d in dates:
-            temp = self.last_values.copy()
-            temp['forecast_date'] = d
-            forecasts.append(temp)
-            
-        final_df = pd.concat(forecasts)
-        final_df.rename(columns={'yhat_flat': 'yhat'}, inplace=True)
-        
-        return final_df[['forecast_date', 'store_nbr', 'family', 'yhat']]
-
-class CrostonSBA(BaseForecastModel):
+        return flat_horizon(self.last_values, self.last_date, horizon_weeks)
+
+class IntermittentDemand(OnlineModel, ShardedModel, BaseForecastModel):
     """
-    Croston method with Syntetos-Boylan Approximation (SBA).
-    Good for intermittent demand.
-    Formula: Y_hat = 0.95 * (Z / P)
+    Croston-family methods for intermittent demand (see src/baselines/intermittent.py),
+    run on all series at once over the (series x weeks) matrix.
+    method: 'croston' (Z / P), 'sba' (Croston * (1 - alpha/2)) or 'tsb' (B * Z)
     Where Z = Smoothed non-zero demand size
           P = Smoothed inter-demand interval
+          B = Smoothed demand probability (TSB)
+    alpha / beta: scalar, one value per series in key order, or a Series indexed by series_id
+    (or by (store_nbr, family)).
+    legacy_interval: interval counter of the original CrostonSBA (default, same forecasts);
+    False restarts it after the first demand.
+    State (state_): the final smoothing state and parameters of each series; update(new_week)
+    resumes the recursion, partial_fit / save_state / load_state as in OnlineModel.
+    predict_parallel(df, horizon, workers) = fit(df).predict(horizon) over series shards on a
+    process pool (src/baselines/parallel.py).
     """
-    def __init__(self, alpha=0.1, target_col='sales'):
+    def __init__(self, method='sba', alpha=0.1, beta=None, target_col='sales', legacy_interval=True):
+        self.method = method
         self.alpha = alpha
+        self.beta = beta
+        self.legacy_interval = legacy_interval
         self.target_col = target_col
         self.forecasts = None
         self.last_date = None
 
+    @staticmethod
+    def _aligned(value, index):
+        if isinstance(value, pd.Series):
+            keys = pd.MultiIndex.from_frame(index) if index.shape[1] > 1 else pd.Index(index.iloc[:, 0])
+            value = value.reindex(keys)
+            if value.isna().any():
+                raise ValueError(f"{value.isna().sum()} series have no smoothing parameter")
+            return value.to_numpy(dtype=np.float64)
+        return value
+
+    def _parameters(self, index):
+        """(alpha, beta) arrays of the series of index (beta defaults to alpha)."""
+        if self.alpha is None:
+            raise ValueError("alpha of new series unknown (model loaded with per-series alpha)")
+        alpha = per_series(self._aligned(self.alpha, index), len(index), 'alpha')
+        beta = alpha if self.beta is None else per_series(self._aligned(self.beta, index), len(index), 'beta')
+        return alpha, beta
+
     def fit(self, df):
-        # Implementation of simple static Croston (not updating every step for horizon, just last state)
-        # Group by series
-        # We need to compute Z and P at the end of history
-        
-        def calculate_croston(series):
-            # values: numpy array of demand
-            values = series.values
-            n = len(values)
-            
-            # Initialization
-            # First non-zero
-            first_nz_idx = np.argmax(values > 0)
-            if values[first_nz_idx] == 0: # All zeros
-                return 0.0
-            
-            z = values[first_nz_idx]
-            p = 1 + first_nz_idx
-            q = p # time since last demand
-            
-            # Smoothing parameters (same for size and interval)
-            a = self.alpha
-            
-            # Iterate
-            for i in range(first_nz_idx + 1, n):
-                y = values[i]
-                if y > 0:
-                    z = a * y + (1 - a) * z
-                    p = a * q + (1 - a) * p
-                    q = 1
-                else:
-                    q += 1
-            
-            # SBA Correction factor (1 - alpha/2)
-            forecast = (1 - a/2) * (z / p)
-            return forecast
-
-        self.last_date = df['week_start'].max()
-        grouped = df.sort_values('week_start').groupby(['store_nbr', 'family'], observed=True)[self.target_col]
-        
-        # Apply croston to each group
-        # Note: This apply is slow for 1800 series in pure python loop, but okay for baseline prototype
-        # Optim: Vectorize or use numba later if needed. 
-        self.forecasts = grouped.apply(calculate_croston).reset_index(name='yhat_flat')
-        
+        if self.method not in METHODS:
+            raise ValueError(f"Unknown method '{self.method}' (known: {list(METHODS)})")
+        panel = weekly_panel(df, self.target_col)
+        alpha, beta = self._parameters(panel.index)
+
+        smoothing = croston_run(panel.values, alpha=alpha, beta=beta, legacy_interval=self.legacy_interval)
+        self.state_ = SeriesState(
+            attach_labels(panel.index, df), {**smoothing.to_arrays(), 'alpha': alpha, 'beta': beta},
+            {'params': self._params(), 'last_week': str(panel.weeks.max()) if len(panel.weeks) else None},
+        )
+        self._state_changed()
+        return self
+
+    def update(self, new_week):
+        """Absorbs the weeks of new_week after the last absorbed one: one recursion step per week."""
+        panel, new_week = new_weeks(new_week, self.state_.meta['last_week'], self.target_col)
+        fill = {'z': 0.0, 'p': 0.0, 'b': 0.0, 'q': 0.0, 'alive': False, 'demand': False, 'alpha': np.nan, 'beta': np.nan}
+        for week, values, present in week_columns(self.state_, panel, attach_labels(panel.index, new_week), fill):
+            arrays = self.state_.arrays
+            new = np.isnan(arrays['alpha'])
+            if new.any():
+                arrays['alpha'][new], arrays['beta'][new] = self._parameters(self.state_.index.loc[new, self.state_.keys])
+            smoothing = croston_run(values[:, None], arrays['alpha'], arrays['beta'], CrostonState.from_arrays(arrays), self.legacy_interval)
+            arrays.update(smoothing.to_arrays())
+            self.state_.meta['last_week'] = str(week)
+        self._state_changed()
         return self
 
+    def _state_changed(self):
+        arrays = self.state_.arrays
+        rate = croston_forecast(CrostonState.from_arrays(arrays), self.method, arrays['alpha'])
+        self.forecasts = self.state_.index.assign(yhat_flat=rate)
+        self.last_date = pd.Timestamp(self.state_.meta['last_week'])
+
     def predict(self, horizon_weeks):
         # Croston produces a constant forecast rate
-        dates = [self.last_date + pd.to_timedelta((i+1)*7, unit='D') for i in range(horizon_weeks)]
-        
-        results = []
-        for d in dates:
-            temp = self.forecasts.copy()
-            temp['forecast_date'] = d
-            results.append(temp)
-            
-        final = pd.concat(results)
-        final.rename(columns={'yhat_flat': 'yhat'}, inplace=True)
-        return final[['forecast_date', 'store_nbr', 'family', 'yhat']]
+        return flat_horizon(self.forecasts, self.last_date, horizon_weeks)
+
+    # Sharded kernel (ShardedModel): smoothing + rate of a range of series
+    def _shard_panel(self, df):
+        if self.method not in METHODS:
+            raise ValueError(f"Unknown method '{self.method}' (known: {list(METHODS)})")
+        return weekly_panel(df, self.target_col)
+
+    def _shard_inputs(self, panel):
+        alpha, beta = self._parameters(panel.index)
+        return {'alpha': alpha, 'beta': beta}
+
+    def _shard_outputs(self, n_series, horizon):
+        return {'yhat_flat': ((n_series,), np.float64)}
 
+    def _shard_forecast(self, inputs, n_weeks, horizon):
+        smoothing = croston_run(inputs['values'], alpha=inputs['alpha'], beta=inputs['beta'], legacy_interval=self.legacy_interval)
+        return {'yhat_flat': croston_forecast(smoothing, self.method, inputs['alpha'])}
+
+    def _shard_frame(self, panel, df, outputs, horizon):
+        rates = attach_labels(panel.index, df).assign(yhat_flat=outputs['yhat_flat'])
+        return flat_horizon(rates, panel.weeks.max(), horizon)
+
+
+class CrostonSBA(IntermittentDemand):
+    """
+    Croston method with Syntetos-Boylan Approximation (SBA).
+    Good for intermittent demand.
+    Formula: Y_hat = (1 - alpha/2) * (Z / P)
+    """
+    def __init__(self, alpha=0.1, target_col='sales', legacy_interval=True):
+        super().__init__(method='sba', alpha=alpha, target_col=target_col, legacy_interval=legacy_interval)
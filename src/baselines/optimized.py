@@ -1,8 +1,20 @@
 import numpy as np
 import pandas as pd
 from sklearn.base import BaseEstimator, RegressorMixin
+from src.data.keys import series_labels
+from src.baselines.panel import weekly_panel
+from src.baselines.parallel import ShardedModel
+from src.baselines.routing import ADI_CUTOFF, CV2_CUTOFF, DEMAND_TYPES, classify
+from src.baselines.state import OnlineModel, SeriesState, new_weeks, week_columns
 
-class PiecewiseHybrid(BaseEstimator, RegressorMixin):
+def blend(pred_ma, pred_sn, sn_weight):
+    """sn_weight * SN + (1 - sn_weight) * MA; weights 0 / 1 take one component as is (a NaN in the other is ignored)."""
+    return np.where(
+        sn_weight == 0, pred_ma,
+        np.where(sn_weight == 1, pred_sn, sn_weight * pred_sn + (1 - sn_weight) * pred_ma)
+    )
+
+class PiecewiseHybrid(OnlineModel, ShardedModel, BaseEstimator, RegressorMixin):
     """
     Optimized Piecewise Hybrid Baseline ("The Winner").
     
@@ -10,126 +22,189 @@ class PiecewiseHybrid(BaseEstimator, RegressorMixin):
     - Intermittent / Lumpy (ADI/CV2) -> MA(4)
     - Erratic -> 0.5 * SN(52) + 0.5 * MA(4)
     - Smooth -> 0.3 * SN(52) + 0.7 * MA(4)
+    sn_<class>: weight of SN(season_len) in the blend of a demand class (MA gets the rest);
+    adi_cutoff / cv2_cutoff: classification thresholds. Defaults are the audited values
+    above; src/baselines/tuning.py searches them.
+
+    State (state_): the last max(season_len, ma_window) weeks of each series and its ADI/CV2
+    counters (weeks seen, non-zero weeks, mean and sum of squared deviations of the non-zero
+    demands). update(new_week) folds a week in, partial_fit / save_state / load_state as in
+    OnlineModel. predict_parallel(df, horizon, workers) = fit(df).predict(horizon) over series
+    shards on a process pool (src/baselines/parallel.py).
     """
     
-    def __init__(self, ma_window=4, season_len=52):
+    def __init__(self, ma_window=4, season_len=52, sn_smooth=0.3, sn_erratic=0.5, sn_intermittent=0.0,
+                 sn_lumpy=0.0, adi_cutoff=ADI_CUTOFF, cv2_cutoff=CV2_CUTOFF):
         self.ma_window = ma_window
         self.season_len = season_len
+        self.sn_smooth = sn_smooth
+        self.sn_erratic = sn_erratic
+        self.sn_intermittent = sn_intermittent
+        self.sn_lumpy = sn_lumpy
+        self.adi_cutoff = adi_cutoff
+        self.cv2_cutoff = cv2_cutoff
         self.demand_types_ = {}
         # Safe init for Streamlit app
         self.demand_type = "Unknown"
         self.adi = 0.0
         self.cv2 = 0.0
+
+    def _fit_arrays(self, Y):
+        """State arrays of the rows of the (series x weeks) matrix Y: window + ADI/CV2 counters."""
+        n_weeks = Y.shape[1]
+        n = np.sum(~np.isnan(Y), axis=1)
+        pos = Y > 0
+        nz = np.sum(pos, axis=1)
+        mean = np.where(pos, Y, 0.0).sum(axis=1) / np.maximum(nz, 1)
+        m2 = np.where(pos, (Y - mean[:, None]) ** 2, 0.0).sum(axis=1)
+
+        keep = max(self.season_len, self.ma_window)
+        recent = np.full((Y.shape[0], keep), np.nan)
+        k = min(keep, n_weeks)
+        recent[:, keep - k:] = Y[:, n_weeks - k:]
+        return {'recent': recent, 'n': n, 'nz': nz, 'mean': mean, 'm2': m2}
+
+    def _labels(self, panel, df):
+        index_df = panel.index
+        if 'series_id' in index_df.columns:
+            index_df = index_df.merge(series_labels(df), on='series_id', how='left')
+        return index_df
         
     def fit(self, X, y=None):
         """
         X should be a dataframe with ['store_nbr', 'family', 'week_start', 'sales']
-        OR a pivot table (series in rows, time in cols).
-        For simplicity in this robust version, we prefer fitting on the whole panel structure.
+        (or 'series_id' instead of the labels).
+        The whole panel is reduced to the state the forecasts need.
+        """
+        if not isinstance(X, pd.DataFrame) or 'sales' not in X.columns:
+            raise ValueError("Input dataframe must have 'sales' column.")
+        panel = weekly_panel(X)
+        n_weeks = panel.shape[1]
+        self.state_ = SeriesState(
+            self._labels(panel, X),
+            self._fit_arrays(panel.values),
+            {'params': self._params(), 'n_weeks': n_weeks, 'last_week': str(panel.weeks[-1]) if n_weeks else None},
+        )
+        return self
+
+    def update(self, new_week):
+        """
+        Absorbs the weeks of new_week after the last absorbed one: every series' window
+        shifts by one week (NaN if it has no row) and its counters take the new value.
         """
-        if isinstance(X, pd.DataFrame):
-            if 'sales' in X.columns:
-                 self.df_history = X.copy()
-            else:
-                raise ValueError("Input dataframe must have 'sales' column.")
+        panel, new_week = new_weeks(new_week, self.state_.meta['last_week'])
+        fill = {'recent': np.nan, 'n': 0, 'nz': 0, 'mean': 0.0, 'm2': 0.0}
+        for week, values, present in week_columns(self.state_, panel, self._labels(panel, new_week), fill):
+            a = self.state_.arrays
+            a['recent'][:, :-1] = a['recent'][:, 1:]
+            a['recent'][:, -1] = values
+            a['n'] += ~np.isnan(values)
+            # Welford update of the non-zero demands' mean / squared deviations
+            pos = values > 0
+            a['nz'][pos] += 1
+            delta = values[pos] - a['mean'][pos]
+            a['mean'][pos] += delta / a['nz'][pos]
+            a['m2'][pos] += delta * (values[pos] - a['mean'][pos])
+            self.state_.meta['n_weeks'] += 1
+            self.state_.meta['last_week'] = str(week)
         return self
+
+    def _state_changed(self):
+        pass # predict reads state_ directly
         
-    def predict(self, horizon=8):
+    def predict(self, horizon=8, routes=None):
         """
-        Generates forecast for the next 'horizon' weeks for all series in df_history.
+        Generates forecast for the next 'horizon' weeks for all series of the state.
         Returns DataFrame with keys.
+        Classification, MA, SN and the routing are array operations over all series at once.
+        routes: rows of the routing table (series_id, demand_type, adi, cv2) at this cutoff,
+        e.g. lookup_routes(refresh_routing(), cutoff); series without a route are classified
+        from their counters (routes are ignored when the model's thresholds are not the
+        routing table's). The class of every series is kept in routes_.
         """
-        df = self.df_history.copy()
-        
-        df['week_start'] = pd.to_datetime(df['week_start'])
-        df = df.sort_values('week_start')
-        
-        panel = df.pivot_table(
-            index=["store_nbr", "family"],
-            columns="week_start",
-            values="sales",
-            aggfunc="sum",
-            observed=True
-        ).sort_index(axis=1)
-        
-        history_vals = panel.to_numpy() # Shape (n_series, n_weeks)
-        index_df = panel.index.to_frame(index=False)
-        
-        start_date = panel.columns[-1]
-        future_dates = [start_date + pd.Timedelta(weeks=i+1) for i in range(horizon)]
-        
-        all_forecasts = []
-        
-        for i in range(history_vals.shape[0]):
-            y = history_vals[i, :]
-            
-            dtype, adi, cv2 = self._classify(y)
-            self.demand_types_[i] = dtype
-            
-            # Store last instance stats for single-series inspection (App usage)
-            self.demand_type = dtype
-            self.adi = adi
-            self.cv2 = cv2
-            
-            pred_ma = self._moving_avg(y, h=horizon, window=self.ma_window)
-            pred_sn = self._seasonal_naive(y, h=horizon, season_len=self.season_len)
-            
-            if dtype in ["intermittent", "lumpy"]:
-                final = pred_ma
-            elif dtype == "erratic":
-                final = 0.5 * pred_sn + 0.5 * pred_ma
-            else: # smooth
-                final = 0.3 * pred_sn + 0.7 * pred_ma
-                
-            store = index_df.iloc[i]['store_nbr']
-            fam = index_df.iloc[i]['family']
-            
-            for step, val in enumerate(final):
-                all_forecasts.append({
-                    "date": future_dates[step],
-                    "store_nbr": store,
-                    "family": fam,
-                    "yhat": max(0.0, val),
-                    "demand_type": dtype
-                })
-                
-        return pd.DataFrame(all_forecasts)
-
-    def _classify(self, y):
-        """ADI/CV2 Classification. Returns (dtype, adi, cv2)"""
-        y = y[~np.isnan(y)]
-        n = len(y)
-        nz = np.sum(y > 0)
-        
-        if nz == 0: return "intermittent", 0.0, 0.0
-        
-        adi = n / nz
-        ynz = y[y > 0]
-        mu = ynz.mean()
-        # CV2 = Variance / Mean^2
-        if mu == 0: return "intermittent", adi, 0.0
-        cv2 = ynz.var(ddof=0) / (mu ** 2)
-        
-        if adi < 1.32 and cv2 < 0.49: return "smooth", adi, cv2
-        if adi < 1.32 and cv2 >= 0.49: return "erratic", adi, cv2
-        if adi >= 1.32 and cv2 < 0.49: return "intermittent", adi, cv2
-        return "lumpy", adi, cv2
+        state = self.state_
+        index_df = state.index
+        n_series = len(state)
+        if n_series == 0:
+            return pd.DataFrame(columns=['date'] + list(index_df.columns) + ['yhat', 'demand_type'])
+        a, n_weeks = state.arrays, state.meta['n_weeks']
+
+        dtype, adi, cv2 = self._classify(a['n'], a['nz'], a['mean'], a['m2'])
+        default_cutoffs = (self.adi_cutoff, self.cv2_cutoff) == (ADI_CUTOFF, CV2_CUTOFF)
+        if routes is not None and default_cutoffs and 'series_id' in index_df.columns:
+            hit = routes.drop_duplicates('series_id').set_index('series_id').reindex(index_df['series_id'])
+            found = hit['demand_type'].notna().to_numpy()
+            dtype[found] = hit['demand_type'].astype(object).to_numpy()[found]
+            adi = np.where(found, hit['adi'].to_numpy(dtype=np.float64), adi)
+            cv2 = np.where(found, hit['cv2'].to_numpy(dtype=np.float64), cv2)
+        self.routes_ = index_df.assign(demand_type=dtype, adi=adi, cv2=cv2)
+        self.demand_types_ = dict(enumerate(dtype))
+        # Store last instance stats for single-series inspection (App usage)
+        self.demand_type = dtype[-1]
+        self.adi = float(adi[-1])
+        self.cv2 = float(cv2[-1])
+
+        final = self._route(a['recent'], n_weeks, horizon, dtype)
+        return self._frame(index_df, final, dtype, state.meta['last_week'], horizon)
+
+    def _route(self, recent, n_weeks, horizon, dtype):
+        """(series x horizon) forecasts: MA / SN blend of each series' window by its class."""
+        pred_ma = self._moving_avg(recent, n_weeks, h=horizon, window=self.ma_window)
+        pred_sn = self._seasonal_naive(recent, n_weeks, h=horizon, season_len=self.season_len)
+
+        sn_weight = self.sn_weights()[pd.Categorical(dtype, categories=DEMAND_TYPES).codes]
+        final = blend(pred_ma, pred_sn, sn_weight[:, None])
+        return np.where(final > 0, final, 0.0) # NaN -> 0
+
+    def _frame(self, index_df, final, dtype, last_week, horizon):
+        start_date = pd.Timestamp(last_week)
+        future_dates = start_date + pd.to_timedelta(np.arange(1, horizon + 1), unit='W')
+
+        # One row per series and step, series-major
+        n_series = len(index_df)
+        out = index_df.iloc[np.repeat(np.arange(n_series), horizon)].reset_index(drop=True)
+        out.insert(0, 'date', np.tile(future_dates, n_series))
+        out['yhat'] = final.reshape(-1)
+        out['demand_type'] = np.repeat(dtype, horizon)
+        return out
+
+    # Sharded kernel (ShardedModel): fit + predict of a range of series
+    def _shard_panel(self, df):
+        return weekly_panel(df)
+
+    def _shard_outputs(self, n_series, horizon):
+        return {'yhat': ((n_series, horizon), np.float64), 'demand_type': ((n_series,), np.int8)}
+
+    def _shard_forecast(self, inputs, n_weeks, horizon):
+        a = self._fit_arrays(inputs['values'])
+        dtype = self._classify(a['n'], a['nz'], a['mean'], a['m2'])[0]
+        return {
+            'yhat': self._route(a['recent'], n_weeks, horizon, dtype),
+            'demand_type': pd.Categorical(dtype, categories=DEMAND_TYPES).codes,
+        }
 
-    def _moving_avg(self, y, h, window):
-        if len(y) == 0: return np.zeros(h)
-        w = min(window, len(y))
-        val = np.mean(y[-w:])
-        return np.full(h, val)
+    def _shard_frame(self, panel, df, outputs, horizon):
+        dtype = np.array(DEMAND_TYPES, dtype=object)[outputs['demand_type']]
+        return self._frame(self._labels(panel, df), outputs['yhat'], dtype, str(panel.weeks[-1]), horizon)
 
-    def _seasonal_naive(self, y, h, season_len):
-        n = len(y)
-        if n < season_len:
-            return np.full(h, y[-1] if n > 0 else 0.0)
-            
+    def sn_weights(self):
+        """SN weight of each demand class, in DEMAND_TYPES order."""
+        return np.array([getattr(self, f"sn_{c}") for c in DEMAND_TYPES], dtype=np.float64)
 
-        start_idx = n - season_len
-        end_idx = start_idx + h
+    def _classify(self, n, nz, mean, m2):
+        """ADI/CV2 Classification of every series from its counters (NaN weeks ignored), see routing.classify."""
+        return classify(n, nz, mean, m2, self.adi_cutoff, self.cv2_cutoff)
 
-        vals = y[start_idx : end_idx]
+    def _moving_avg(self, recent, n_weeks, h, window):
+        """Mean of the last `window` weeks (NaN if one of them is missing), repeated h times."""
+        if n_weeks == 0: return np.zeros((recent.shape[0], h))
+        w = min(window, n_weeks)
+        val = recent[:, -w:].mean(axis=1)
+        return np.repeat(val[:, None], h, axis=1)
 
-        return vals
+    def _seasonal_naive(self, recent, n_weeks, h, season_len):
+        """Values one season before each horizon step (the last season repeats past h > season_len)."""
+        if n_weeks < season_len:
+            last = recent[:, -1] if n_weeks > 0 else np.zeros(recent.shape[0])
+            return np.repeat(last[:, None], h, axis=1)
+        return recent[:, recent.shape[1] - season_len + np.arange(h) % season_len]
@@ -0,0 +1,70 @@
+import numpy as np
+import pandas as pd
+from src.data.keys import series_key
+
+# Weekly (series x weeks) matrix shared by the baselines.
+# Same cells as df.pivot_table(index=series_key(df), columns='week_start', values=target,
+# aggfunc='sum', observed=True): series in key order, only the weeks present in df,
+# NaN where a series has no row for a week. Built with one factorization of the keys
+# and one bincount instead of a pivot.
+
+
+class WeeklyPanel:
+    """
+    index: one row per series (its key columns), in the order of the matrix rows
+    weeks: sorted DatetimeIndex of the matrix columns
+    values: float64 (n_series, n_weeks) matrix of the target
+    present: bool matrix, True where the series has a row for the week
+    """
+    def __init__(self, index, weeks, values, present):
+        self.index = index
+        self.weeks = weeks
+        self.values = values
+        self.present = present
+
+    @property
+    def shape(self):
+        return self.values.shape
+
+
+def weekly_panel(df, target_col='sales', date_col='week_start', skipna=True):
+    """skipna=False: a cell with a NaN target stays NaN (the row's value when the key is unique)."""
+    keys = series_key(df)
+    groups = df.groupby(keys, observed=True, sort=True)
+    series = groups.ngroup().to_numpy()
+    index = groups.size().index.to_frame(index=False)
+
+    dates = df[date_col]
+    if not pd.api.types.is_datetime64_any_dtype(dates.dtype):
+        dates = pd.to_datetime(dates)
+    ok = (series >= 0) & dates.notna().to_numpy()
+    weeks, week = np.unique(dates.to_numpy()[ok], return_inverse=True)
+    series = series[ok]
+
+    n_series, n_weeks = len(index), len(weeks)
+    cell = series.astype(np.int64) * n_weeks + week
+    y = df[target_col].to_numpy(dtype=np.float64, na_value=np.nan)[ok]
+    # sum skips NaN (a cell whose rows are all NaN sums to 0, like groupby sum); no row -> NaN
+    sums = np.bincount(cell, weights=np.nan_to_num(y, nan=0.0), minlength=n_series * n_weeks)
+    rows = np.bincount(cell, minlength=n_series * n_weeks)
+    present = rows > 0
+    values = np.where(present, sums, np.nan)
+    if not skipna:
+        nans = np.bincount(cell, weights=np.isnan(y), minlength=n_series * n_weeks)
+        values[nans > 0] = np.nan
+    shape = (n_series, n_weeks)
+    return WeeklyPanel(index, pd.DatetimeIndex(weeks), values.reshape(shape), present.reshape(shape))
+
+
+def rolling_origins(n_weeks, horizon=8, n_origins=26, step=1, min_train_weeks=52):
+    """
+    Column positions of the backtest origins of a panel with n_weeks weeks: the last
+    n_origins weeks (step apart) that leave a full horizon of actuals after them and at
+    least min_train_weeks weeks of history up to them.
+    """
+    last = n_weeks - 1 - horizon
+    positions = last - step * np.arange(n_origins)[::-1]
+    positions = positions[positions >= min_train_weeks - 1]
+    if len(positions) == 0:
+        raise ValueError(f"Not enough history ({n_weeks} weeks) for a backtest (min_train_weeks={min_train_weeks}, h={horizon})")
+    return positions
@@ -0,0 +1,112 @@
+import os
+import tempfile
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from pathlib import Path
+import numpy as np
+
+# Process-pool execution of the baselines over series shards.
+# The (series x weeks) matrix and the per-series inputs are written once to memory-mapped
+# .npy files in a scratch directory; the workers map them read-only and only receive the
+# file paths and a row range, so no DataFrame is pickled. Each worker fits / forecasts its
+# rows with the model's array kernel and writes the result into preallocated memory-mapped
+# outputs, which the parent turns into the usual forecast frame.
+#
+# A model runs in parallel when it implements the ShardedModel hooks; all series of a
+# model are independent, so the result is the one of fit(df).predict(horizon).
+
+SHARDS_PER_WORKER = 4
+
+
+class ShardedModel:
+    """
+    Hooks for parallel_forecast (all arrays have one row per series, in panel order):
+      _shard_panel(df)                         -> WeeklyPanel of the history
+      _shard_inputs(panel)                     -> extra per-series input arrays (name -> array)
+      _shard_outputs(n_series, horizon)        -> name -> (shape, dtype) of the outputs
+      _shard_forecast(inputs, n_weeks, horizon) -> name -> output rows of inputs' series
+                                                  (inputs['values']: their matrix rows)
+      _shard_frame(panel, df, outputs, horizon) -> forecast frame, as predict returns it
+    The workers get a copy of the model rebuilt from its init parameters (_params, see
+    OnlineModel): no fitted state is pickled.
+    """
+    def _shard_inputs(self, panel):
+        return {}
+
+    def _kernel(self):
+        return type(self)(**self._params())
+
+    def predict_parallel(self, df, horizon=8, workers=None, **kwargs):
+        return parallel_forecast(self, df, horizon, workers, **kwargs)
+
+
+class SharedArrays:
+    """Arrays in .npy files of `directory`, mapped in memory (paths() is what the workers get)."""
+    def __init__(self, directory):
+        self.directory = Path(directory)
+        self.arrays = {}
+
+    def create(self, name, shape, dtype, values=None):
+        array = np.lib.format.open_memmap(self.directory / f"{name}.npy", mode='w+', dtype=dtype, shape=shape)
+        if values is not None:
+            array[...] = values
+            array.flush()
+        self.arrays[name] = array
+        return array
+
+    def paths(self):
+        return {name: str(self.directory / f"{name}.npy") for name in self.arrays}
+
+
+def _run_shard(model, inputs, outputs, lo, hi, n_weeks, horizon):
+    """Worker: forecasts rows [lo, hi) from the mapped inputs into the mapped outputs."""
+    rows = {name: np.load(path, mmap_mode='r')[lo:hi] for name, path in inputs.items()}
+    result = model._shard_forecast(rows, n_weeks, horizon)
+    for name, path in outputs.items():
+        out = np.load(path, mmap_mode='r+')
+        out[lo:hi] = result[name]
+        out.flush()
+    return hi - lo
+
+
+def shard_ranges(n_series, n_shards):
+    """[lo, hi) row ranges of n_shards (at most n_series) contiguous, near-equal shards."""
+    bounds = np.linspace(0, n_series, min(max(n_shards, 1), max(n_series, 1)) + 1).astype(np.int64)
+    return [(int(lo), int(hi)) for lo, hi in zip(bounds[:-1], bounds[1:]) if hi > lo]
+
+
+def parallel_forecast(model, df, horizon=8, workers=None, shards=None, scratch_dir=None):
+    """
+    fit(df).predict(horizon) of a ShardedModel, series shards on a pool of `workers`
+    processes (None: all cores; 1: in-process). shards: number of row ranges (default
+    SHARDS_PER_WORKER per worker). scratch_dir: where the memory-mapped files go (default:
+    the system temp dir; /dev/shm keeps them in RAM).
+    """
+    if not isinstance(model, ShardedModel):
+        raise TypeError(f"{type(model).__name__} has no sharded kernel")
+    workers = workers or os.cpu_count() or 1
+    panel = model._shard_panel(df)
+    n_series, n_weeks = panel.shape
+    if n_weeks == 0:
+        raise ValueError("parallel_forecast needs at least one week of history")
+    ranges = shard_ranges(n_series, shards or workers * SHARDS_PER_WORKER)
+
+    with tempfile.TemporaryDirectory(prefix='shards-', dir=scratch_dir) as tmp:
+        inputs, outputs = SharedArrays(tmp), SharedArrays(tmp)
+        inputs.create('values', panel.values.shape, np.float64, panel.values)
+        for name, values in model._shard_inputs(panel).items():
+            inputs.create(name, values.shape, values.dtype, values)
+        for name, (shape, dtype) in model._shard_outputs(n_series, horizon).items():
+            outputs.create(name, shape, dtype)
+
+        kernel, args = model._kernel(), (inputs.paths(), outputs.paths())
+        if workers <= 1:
+            for lo, hi in ranges:
+                _run_shard(kernel, *args, lo, hi, n_weeks, horizon)
+        else:
+            with ProcessPoolExecutor(max_workers=workers) as pool:
+                running = [pool.submit(_run_shard, kernel, *args, lo, hi, n_weeks, horizon) for lo, hi in ranges]
+                for f in as_completed(running):
+                    f.result()
+        gathered = {name: np.array(array) for name, array in outputs.arrays.items()}
+        del inputs, outputs  # unmap before the directory goes
+    return model._shard_frame(panel, df, gathered, horizon)
@@ -0,0 +1,157 @@
+import warnings
+import numpy as np
+import pandas as pd
+from src.data.keys import series_key
+from src.baselines.panel import rolling_origins, weekly_panel
+from src.baselines.state import OnlineModel
+
+# Empirical residual quantiles (conformal-style intervals) for the baselines.
+# The model is backtested from rolling origins (the last n_origins weeks that leave a full
+# horizon of actuals, `step` weeks apart): at each origin it forecasts `horizon` weeks
+# and the errors land in a (series x origins x steps) residual array. Per series and
+# horizon step, the quantiles of its residuals are offsets added to the point forecast:
+#   yhat_pXX = max(yhat + quantile_XX(actual - yhat), 0)
+# Series / steps with fewer than min_obs residuals get no interval (NaN).
+
+QUANTILES = (0.1, 0.5, 0.9)
+
+
+def quantile_column(q):
+    return f"yhat_p{round(q * 100)}"
+
+
+def _date_col(forecast):
+    return 'date' if 'date' in forecast.columns else 'forecast_date'
+
+
+def _rows(index, forecast):
+    """Row of index (series key columns) of each forecast row (-1: unknown series)."""
+    keys = series_key(index)
+    if len(keys) == 1:
+        return pd.Index(index[keys[0]]).get_indexer(forecast[keys[0]])
+    labels = [index[k].astype(str) if k == 'family' else index[k] for k in keys]
+    wanted = [forecast[k].astype(str) if k == 'family' else forecast[k] for k in keys]
+    return pd.MultiIndex.from_arrays(labels).get_indexer(pd.MultiIndex.from_arrays(wanted))
+
+
+def forecast_steps(forecast, origin):
+    """Horizon step (1 = week after origin) of each forecast row."""
+    delta = pd.to_datetime(forecast[_date_col(forecast)]) - pd.Timestamp(origin)
+    return (delta // pd.Timedelta(weeks=1)).to_numpy(dtype=np.int64)
+
+
+def forecast_matrix(forecast, index, origin, horizon):
+    """yhat of a forecast as a (series x steps) matrix aligned with index, NaN where it has no row."""
+    out = np.full((len(index), horizon), np.nan)
+    rows = _rows(index, forecast)
+    steps = forecast_steps(forecast, origin) - 1
+    ok = (rows >= 0) & (steps >= 0) & (steps < horizon)
+    out[rows[ok], steps[ok]] = forecast['yhat'].to_numpy(dtype=np.float64)[ok]
+    return out
+
+
+def backtest_residuals(model_factory, df, horizon=8, n_origins=26, step=1, min_train_weeks=52, target_col='sales'):
+    """
+    Rolling-origin residuals (actual - forecast) of a baseline for all series at once.
+    model_factory() -> unfitted model; online models (OnlineModel) are fitted at the first
+    origin and then updated with the weeks up to each next origin instead of refitted.
+    Returns (panel, origins, residuals) with residuals of shape (n_series, n_origins, horizon)
+    aligned with panel.index, NaN where the series has no actual or no forecast.
+    """
+    panel = weekly_panel(df, target_col)
+    origins = panel.weeks[rolling_origins(len(panel.weeks), horizon, n_origins, step, min_train_weeks)]
+
+    weeks = pd.to_datetime(df['week_start'])
+    residuals = np.full((len(panel.index), len(origins), horizon), np.nan)
+    model, previous = None, None
+    for o, origin in enumerate(origins):
+        if isinstance(model, OnlineModel):
+            model.update(df[(weeks > previous).to_numpy() & (weeks <= origin).to_numpy()])
+        else:
+            model = model_factory().fit(df[(weeks <= origin).to_numpy()])
+        forecast = model.predict(horizon)
+        previous = origin
+
+        targets = origin + pd.to_timedelta(np.arange(1, horizon + 1), unit='W')
+        cols = panel.weeks.get_indexer(targets)
+        actual = np.where(cols >= 0, panel.values[:, np.maximum(cols, 0)], np.nan)
+        residuals[:, o, :] = actual - forecast_matrix(forecast, panel.index, origin, horizon)
+    return panel, origins, residuals
+
+
+def residual_quantiles(residuals, quantiles=QUANTILES, min_obs=8):
+    """
+    Quantiles of the residuals over the origins axis: (n_quantiles, n_series, horizon)
+    offsets, NaN where a series / step has fewer than min_obs residuals. Also returns the
+    residual counts (n_series, horizon).
+    """
+    n_obs = np.sum(~np.isnan(residuals), axis=1)
+    with warnings.catch_warnings():
+        warnings.simplefilter('ignore', RuntimeWarning)  # all-NaN slices
+        offsets = np.nanquantile(residuals, quantiles, axis=1)
+    offsets[:, n_obs < min_obs] = np.nan
+    return offsets, n_obs
+
+
+class EmpiricalQuantiles:
+    """
+    Quantile layer over a point baseline: fit backtests model_factory on df and keeps the
+    per-series, per-step residual quantiles; apply adds the yhat_pXX columns to a forecast
+    of that model made at the end of df.
+    """
+    def __init__(self, model_factory, quantiles=QUANTILES, horizon=8, n_origins=26, step=1, min_obs=8, target_col='sales'):
+        self.model_factory = model_factory
+        self.quantiles = tuple(quantiles)
+        self.horizon = horizon
+        self.n_origins = n_origins
+        self.step = step
+        self.min_obs = min_obs
+        self.target_col = target_col
+
+    def fit(self, df):
+        panel, self.origins_, residuals = backtest_residuals(
+            self.model_factory, df, self.horizon, self.n_origins, self.step, target_col=self.target_col
+        )
+        self.index_ = panel.index
+        self.offsets_, self.n_obs_ = residual_quantiles(residuals, self.quantiles, self.min_obs)
+        return self
+
+    def apply(self, forecast, origin=None):
+        """
+        forecast: point forecast (labels, 'date' or 'forecast_date', 'yhat') made at origin
+        (default: the week before its first date). Returns a copy with one column per quantile.
+        """
+        if origin is None:
+            origin = pd.to_datetime(forecast[_date_col(forecast)]).min() - pd.Timedelta(weeks=1)
+        rows = _rows(self.index_, forecast)
+        steps = forecast_steps(forecast, origin) - 1
+        ok = (rows >= 0) & (steps >= 0) & (steps < self.horizon)
+        yhat = forecast['yhat'].to_numpy(dtype=np.float64)
+
+        out = forecast.copy()
+        for k, q in enumerate(self.quantiles):
+            offset = np.full(len(forecast), np.nan)
+            offset[ok] = self.offsets_[k, rows[ok], steps[ok]]
+            out[quantile_column(q)] = np.maximum(yhat + offset, 0.0)  # NaN stays NaN
+        return out
+
+
+def forecast_rows(forecast, origin=None):
+    """
+    A forecast with quantile columns in the fact_forecasts_weekly layout (year_week,
+    series_id, horizon_step, yhat_mean, yhat_p10, yhat_p50, yhat_p90), for
+    save_results.save_forecasts.
+    """
+    dates = pd.to_datetime(forecast[_date_col(forecast)])
+    if origin is None:
+        origin = dates.min() - pd.Timedelta(weeks=1)
+    iso = dates.dt.isocalendar()
+    out = forecast[[c for c in ['series_id', 'store_nbr', 'family'] if c in forecast.columns]].copy()
+    out.insert(0, 'year_week', (iso['year'] * 100 + iso['week']).astype('int32').to_numpy())
+    out['horizon_step'] = forecast_steps(forecast, origin).astype('int16')
+    out['yhat_mean'] = forecast['yhat'].to_numpy()
+    for c in [quantile_column(q) for q in QUANTILES]:
+        out[c] = forecast[c].to_numpy() if c in forecast.columns else np.nan
+    if 'series_id' in out.columns:
+        out = out.drop(columns=[c for c in ['store_nbr', 'family'] if c in out.columns])
+    return out.reset_index(drop=True)
@@ -0,0 +1,10 @@
+from src.baselines.models import SeasonalNaive, MovingAverage, CrostonSBA
+from src.baselines.optimized import PiecewiseHybrid
+
+# Weekly baselines by name (scripts' --model / --models choices)
+MODELS = {
+    'SeasonalNaive': SeasonalNaive,
+    'MovingAverage': MovingAverage,
+    'CrostonSBA': CrostonSBA,
+    'PiecewiseHybrid': PiecewiseHybrid,
+}
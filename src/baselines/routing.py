@@ -0,0 +1,151 @@
+import hashlib
+import json
+from pathlib import Path
+import numpy as np
+import pandas as pd
+from src.baselines.panel import weekly_panel
+from src.data.storage import read_canon
+
+# Demand-classification routing table.
+# The ADI / CV2 class of a series at a cutoff week only depends on its history up to that
+# week, so it is computed once for every (series_id, cutoff) in bulk, from cumulative
+# counters along the weeks of the (series x weeks) matrix, and persisted as
+# data/processed/dim_routing.parquet. The table is rebuilt when weekly_canon changes
+# (data version = hash of its keys and sales). PiecewiseHybrid.predict and the Forecast
+# Inspector read routes there instead of reclassifying; in the warehouse it is the
+# dim_routing segmentation dimension (join on series_id + cutoff = training end week).
+
+ROUTING_PATH = Path("data/processed/dim_routing.parquet")
+WEEKLY_CANON_PATH = Path("data/processed/weekly_canon.parquet")
+DEMAND_TYPES = ['smooth', 'erratic', 'intermittent', 'lumpy']
+ADI_CUTOFF = 1.32
+CV2_CUTOFF = 0.49
+
+
+def classify(n, nz, mean, m2, adi_cutoff=ADI_CUTOFF, cv2_cutoff=CV2_CUTOFF):
+    """
+    ADI/CV2 Classification from per-series counters: weeks seen (n), non-zero weeks (nz),
+    mean and sum of squared deviations (m2) of the non-zero demands.
+    Returns (dtype, adi, cv2) arrays (the cutoffs broadcast against the counters).
+    """
+    has = nz > 0
+    safe_nz = np.maximum(nz, 1)
+
+    adi = np.where(has, n / safe_nz, 0.0)
+    # CV2 = Variance / Mean^2 of the non-zero demands
+    var = m2 / safe_nz
+    with np.errstate(invalid='ignore', divide='ignore'):
+        cv2 = np.where(has, var / mean ** 2, 0.0)
+
+    dtype = np.select(
+        [~has, (adi < adi_cutoff) & (cv2 < cv2_cutoff), adi < adi_cutoff, cv2 < cv2_cutoff],
+        ["intermittent", "smooth", "erratic", "intermittent"],
+        default="lumpy",
+    ).astype(object)
+    return dtype, adi, cv2
+
+
+def routing_table(df, cutoffs=None):
+    """
+    (series_id, cutoff, demand_type, adi, cv2) of every series at every cutoff week (None:
+    each week of df), the class PiecewiseHybrid gives the series fitted on its rows with
+    week_start <= cutoff. Series without a row up to a cutoff have no route there.
+    """
+    if 'series_id' not in df.columns:
+        raise ValueError("routing_table needs series_id")
+    panel = weekly_panel(df)
+    Y = panel.values
+    weeks = panel.weeks if cutoffs is None else pd.DatetimeIndex(pd.to_datetime(cutoffs))
+    cols = panel.weeks.get_indexer(weeks)
+    if (cols < 0).any():
+        raise ValueError(f"cutoffs not in the weeks of df: {list(weeks[cols < 0].date)}")
+
+    pos = Y > 0
+    n = np.cumsum(~np.isnan(Y), axis=1)[:, cols]
+    nz = np.cumsum(pos, axis=1)[:, cols]
+    rows = np.cumsum(panel.present, axis=1)[:, cols]
+    # Running sums of the non-zero demands around each series' overall mean (keeps the
+    # sum of squares small: no cancellation in m2)
+    center = np.where(pos, Y, 0.0).sum(axis=1, keepdims=True) / np.maximum(pos.sum(axis=1, keepdims=True), 1)
+    dev = np.where(pos, Y - center, 0.0)
+    s1 = np.cumsum(dev, axis=1)[:, cols]
+    s2 = np.cumsum(dev * dev, axis=1)[:, cols]
+    safe_nz = np.maximum(nz, 1)
+    mean = center + s1 / safe_nz
+    m2 = np.maximum(s2 - s1 * s1 / safe_nz, 0.0)
+
+    dtype, adi, cv2 = classify(n.ravel(), nz.ravel(), mean.ravel(), m2.ravel())
+    keep = rows.ravel() > 0
+    table = pd.DataFrame({
+        'series_id': np.repeat(panel.index['series_id'].to_numpy(), len(cols))[keep],
+        'cutoff': np.tile(weeks.to_numpy(), len(panel.index))[keep],
+        'demand_type': pd.Categorical(dtype[keep], categories=DEMAND_TYPES),
+        'adi': adi[keep],
+        'cv2': cv2[keep],
+    })
+    return table.sort_values(['series_id', 'cutoff'], kind='stable').reset_index(drop=True)
+
+
+def data_version(df):
+    """sha256 of the (series_id, week_start, sales) columns the routes are computed from (+ the class thresholds)."""
+    h = hashlib.sha256(json.dumps([ADI_CUTOFF, CV2_CUTOFF]).encode())
+    for c in ['series_id', 'week_start', 'sales']:
+        h.update(np.ascontiguousarray(df[c].to_numpy()).tobytes())
+    return h.hexdigest()[:16]
+
+
+def _meta_path(path):
+    return Path(path).with_suffix('.json')
+
+
+def read_routing_meta(path=ROUTING_PATH):
+    """Metadata of the persisted routing table (data_version, rows), None if there is none."""
+    meta_path = _meta_path(path)
+    if not (Path(path).exists() and meta_path.exists()):
+        return None
+    return json.loads(meta_path.read_text())
+
+
+def _weekly_version(weekly_path):
+    return data_version(read_canon(weekly_path, columns=['series_id', 'week_start', 'sales']))
+
+
+def load_routing(weekly_path=WEEKLY_CANON_PATH, path=ROUTING_PATH):
+    """
+    The persisted routing table if it was computed on the current weekly_canon, else None.
+    Read-only: rebuilding is left to refresh_routing (routing stage of the preprocessing).
+    """
+    meta = read_routing_meta(path)
+    if meta is None or meta.get('data_version') != _weekly_version(weekly_path):
+        return None
+    return pd.read_parquet(path)
+
+
+def refresh_routing(weekly_path=WEEKLY_CANON_PATH, path=ROUTING_PATH):
+    """
+    The routing table of weekly_canon, from `path` when it was computed on the current
+    data version, otherwise recomputed for every week and saved.
+    """
+    weekly = read_canon(weekly_path, columns=['series_id', 'week_start', 'sales'])
+    version = data_version(weekly)
+    meta = read_routing_meta(path)
+    if meta is not None and meta.get('data_version') == version:
+        return pd.read_parquet(path)
+
+    table = routing_table(weekly)
+    Path(path).parent.mkdir(parents=True, exist_ok=True)
+    table.to_parquet(path, index=False)
+    _meta_path(path).write_text(json.dumps({'data_version': version, 'rows': len(table)}, indent=2))
+    print(f"Routing table: {len(table):,} routes ({table['series_id'].nunique():,} series) -> {path}")
+    return table
+
+
+def lookup_routes(table, cutoff, series_ids=None):
+    """Route of each series at `cutoff` (its last cutoff week <= cutoff), one row per series_id."""
+    routes = table[table['cutoff'] <= pd.Timestamp(cutoff)]
+    if series_ids is not None:
+        routes = routes[routes['series_id'].isin(series_ids)]
+    # rows are sorted on (series_id, cutoff): the last one of each series
+    last = routes['series_id'].to_numpy()
+    keep = np.append(last[1:] != last[:-1], True) if len(last) else np.zeros(0, dtype=bool)
+    return routes[keep].reset_index(drop=True)
@@ -0,0 +1,133 @@
+import inspect
+import json
+from pathlib import Path
+import numpy as np
+import pandas as pd
+from src.baselines.panel import weekly_panel
+
+# Online state of the baselines.
+# Each model reduces its history to a few numbers per series (a window of recent weeks,
+# the Croston triple, the ADI/CV2 counters). SeriesState keeps those arrays row-aligned
+# with the series key table, absorbs new series, and is persisted as one numpy archive
+# per model (key / label columns + state arrays + JSON metadata), so a new week is folded
+# in with O(series) work instead of a refit on the whole history.
+
+STATE_DIR = Path("data/state")
+META_KEY = '_meta'
+INDEX_PREFIX = 'index__'
+
+
+class SeriesState:
+    """
+    index: one row per series, its key columns (series_id, or store_nbr + family) and labels
+    arrays: name -> array whose first axis follows the index rows
+    meta: JSON-serializable scalars (model parameters, last absorbed week, ...)
+    """
+    def __init__(self, index, arrays=None, meta=None):
+        self.index = index.reset_index(drop=True)
+        self.arrays = dict(arrays or {})
+        self.meta = dict(meta or {})
+
+    @property
+    def keys(self):
+        return ['series_id'] if 'series_id' in self.index.columns else ['store_nbr', 'family']
+
+    def __len__(self):
+        return len(self.index)
+
+    def add_series(self, index, fill):
+        """
+        Rows of `index`'s series in the state. Series not seen yet are added (arrays filled
+        with fill[name]) and the rows are kept sorted on the key, like a panel of the
+        full history. Returns the row of each series of `index`.
+        """
+        keys = self.keys
+        known = index[keys].merge(self.index[keys].assign(_row=np.arange(len(self))), on=keys, how='left')
+        new = known['_row'].isna().to_numpy()
+        if new.any():
+            added = index.loc[new, [c for c in self.index.columns if c in index.columns]]
+            self.index = pd.concat([self.index, added], ignore_index=True)
+            for name, values in self.arrays.items():
+                pad = np.full((int(new.sum()),) + values.shape[1:], fill[name], dtype=values.dtype)
+                self.arrays[name] = np.concatenate([values, pad])
+            order = self.index.sort_values(keys, kind='stable').index.to_numpy()
+            self.index = self.index.iloc[order].reset_index(drop=True)
+            self.arrays = {name: values[order] for name, values in self.arrays.items()}
+            return self.add_series(index, fill)
+        return known['_row'].to_numpy(dtype=np.int64)
+
+    def save(self, path):
+        path = Path(path)
+        path.parent.mkdir(parents=True, exist_ok=True)
+        columns = {INDEX_PREFIX + c: self.index[c].to_numpy(dtype=str if c == 'family' else None) for c in self.index.columns}
+        tmp = path.with_suffix('.tmp.npz')
+        np.savez(tmp, **columns, **self.arrays, **{META_KEY: np.array(json.dumps(self.meta, default=str))})
+        tmp.replace(path)
+        return path
+
+    @classmethod
+    def load(cls, path):
+        with np.load(path, allow_pickle=False) as archive:
+            meta = json.loads(str(archive[META_KEY]))
+            index = pd.DataFrame({k[len(INDEX_PREFIX):]: archive[k] for k in archive.files if k.startswith(INDEX_PREFIX)})
+            arrays = {k: archive[k] for k in archive.files if k != META_KEY and not k.startswith(INDEX_PREFIX)}
+        if 'family' in index.columns:
+            index['family'] = index['family'].astype('category')
+        return cls(index, arrays, meta)
+
+
+def new_weeks(df, after, target_col='sales', skipna=True):
+    """Weekly panel of the rows of df after the week `after` (None: all of them)."""
+    if after is not None:
+        df = df[pd.to_datetime(df['week_start']) > pd.Timestamp(after)]
+    return weekly_panel(df, target_col, skipna=skipna), df
+
+
+def week_columns(state, panel, labels, fill):
+    """
+    Yields (week, values, present) for each week of `panel`, aligned with the state rows
+    (series without a row that week: NaN / False). labels: key + label columns of the
+    panel's series; new series are added to the state first.
+    """
+    rows = state.add_series(labels, fill)
+    for j, week in enumerate(panel.weeks):
+        values = np.full(len(state), np.nan)
+        present = np.zeros(len(state), dtype=bool)
+        values[rows] = panel.values[:, j]
+        present[rows] = panel.present[:, j]
+        yield week, values, present
+
+
+class OnlineModel:
+    """
+    partial_fit / update / persistence for a model whose fit reduces the history to state_
+    (a SeriesState). Subclasses implement fit, update(new_week) and _state_changed (refresh
+    the fitted attributes from state_), and keep _params() in state_.meta['params'].
+    """
+    state_ = None
+
+    def _params(self):
+        """Init parameters to rebuild the model from its state (non-scalars: None, their values are state arrays)."""
+        names = [n for n in inspect.signature(type(self).__init__).parameters if n != 'self']
+        params = {}
+        for n in names:
+            value = getattr(self, n)
+            if isinstance(value, np.generic):
+                value = value.item()
+            params[n] = value if value is None or isinstance(value, (str, bool, int, float)) else None
+        return params
+
+    def partial_fit(self, df):
+        """fit on the first call, then absorb the weeks of df after the last absorbed one."""
+        return self.fit(df) if self.state_ is None else self.update(df)
+
+    def save_state(self, path=None):
+        return self.state_.save(path or STATE_DIR / f"{type(self).__name__}.npz")
+
+    @classmethod
+    def load_state(cls, path=None):
+        state = SeriesState.load(path or STATE_DIR / f"{cls.__name__}.npz")
+        model = cls(**state.meta['params'])
+        model.state_ = state
+        model._state_changed()
+        return model
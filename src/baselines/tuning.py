@@ -0,0 +1,168 @@
+import itertools
+import numpy as np
+import pandas as pd
+from src.baselines.optimized import PiecewiseHybrid, blend
+from src.baselines.panel import rolling_origins, weekly_panel
+from src.baselines.routing import ADI_CUTOFF, CV2_CUTOFF, DEMAND_TYPES, classify
+
+# Tensorized hyperparameter search for PiecewiseHybrid.
+# The hybrid's forecast is a per-class blend of two components: MA(ma_window) and
+# SN(season_len). Both are computed once per backtest fold (rolling origins) for every
+# candidate window and stacked as (fold x series x horizon) tensors, with the actuals and
+# the ADI/CV2 counters of each series at each fold. Every candidate (window, SN weight)
+# is then scored with broadcast arithmetic, and the classes of every threshold pair come
+# from one broadcast classification. Classes are scored separately (a series' class only
+# selects its blend), so the best weight of each class is an argmin per
+# (thresholds, window, class) of the absolute errors summed over folds and series.
+
+WINDOWS = (2, 3, 4, 6, 8, 12)
+SN_WEIGHTS = tuple(np.round(np.linspace(0.0, 1.0, 11), 2))
+ADI_CUTOFFS = (1.2, ADI_CUTOFF, 1.5)
+CV2_CUTOFFS = (0.4, CV2_CUTOFF, 0.6)
+
+
+def component_tensors(df, windows=WINDOWS, horizon=8, n_origins=12, step=4, season_len=52, min_train_weeks=52,
+                      extra_windows=(PiecewiseHybrid().ma_window,)):
+    """
+    Components of the hybrid at each rolling origin, fitted on the weeks up to it:
+      ma: (n_ma_windows, n_folds, n_series, horizon), one MA per ma_windows entry: the
+          searched windows, then extra_windows not among them (e.g. the default model's,
+          scored but never selected)
+      sn / actual: (n_folds, n_series, horizon)
+      n, nz, mean, m2: (n_folds, n_series) ADI/CV2 counters
+      scored: (n_folds, n_series) the series has history at the fold (the model forecasts it)
+    actual is NaN where the series has no row for the target week.
+    """
+    windows = tuple(windows)
+    ma_windows = windows + tuple(w for w in dict.fromkeys(extra_windows) if w not in windows)
+    panel = weekly_panel(df)
+    Y = panel.values
+    positions = rolling_origins(len(panel.weeks), horizon, n_origins, step, min_train_weeks)
+    model = PiecewiseHybrid(ma_window=max(ma_windows), season_len=season_len)
+
+    n_series, n_folds = Y.shape[0], len(positions)
+    out = {
+        'origins': panel.weeks[positions],
+        'windows': windows,
+        'ma_windows': ma_windows,
+        'season_len': season_len,
+        'ma': np.empty((len(ma_windows), n_folds, n_series, horizon)),
+        'sn': np.empty((n_folds, n_series, horizon)),
+        'actual': np.full((n_folds, n_series, horizon), np.nan),
+        'scored': np.empty((n_folds, n_series), dtype=bool),
+    }
+    for name in ['n', 'nz', 'mean', 'm2']:
+        out[name] = np.empty((n_folds, n_series))
+
+    for f, o in enumerate(positions):
+        n_weeks = o + 1
+        a = model._fit_arrays(Y[:, :n_weeks])
+        for i, w in enumerate(ma_windows):
+            out['ma'][i, f] = model._moving_avg(a['recent'], n_weeks, h=horizon, window=w)
+        out['sn'][f] = model._seasonal_naive(a['recent'], n_weeks, h=horizon, season_len=season_len)
+        for name in ['n', 'nz', 'mean', 'm2']:
+            out[name][f] = a[name]
+        out['scored'][f] = panel.present[:, :n_weeks].any(axis=1)
+
+        targets = panel.weeks[o] + np.arange(1, horizon + 1) * np.timedelta64(7, 'D')
+        cols = panel.weeks.get_indexer(targets)
+        out['actual'][f][:, cols >= 0] = Y[:, cols[cols >= 0]]
+    return out
+
+
+def class_codes(tensors, adi_cutoffs, cv2_cutoffs):
+    """(n_thresholds, n_folds, n_series) DEMAND_TYPES codes for each (adi, cv2) cutoff pair."""
+    pairs = np.array(list(itertools.product(adi_cutoffs, cv2_cutoffs)), dtype=np.float64)
+    dtype, _, _ = classify(
+        tensors['n'], tensors['nz'], tensors['mean'], tensors['m2'],
+        pairs[:, 0, None, None], pairs[:, 1, None, None],
+    )
+    codes = pd.Categorical(dtype.ravel(), categories=DEMAND_TYPES).codes.reshape(dtype.shape)
+    return pairs, codes
+
+
+def _abs_errors(ma, sn, actual, mask, sn_weights):
+    """(n_weights, n_folds, n_series) absolute errors of the blends, summed over the horizon."""
+    w = np.asarray(sn_weights, dtype=np.float64)[:, None, None, None]
+    final = blend(ma[None], sn[None], w)
+    final = np.where(final > 0, final, 0.0)  # NaN -> 0, as predict
+    return np.where(mask, np.abs(actual - final), 0.0).sum(axis=-1)
+
+
+def search(tensors, sn_weights=SN_WEIGHTS, adi_cutoffs=ADI_CUTOFFS, cv2_cutoffs=CV2_CUTOFFS, windows=None):
+    """
+    Scores every (adi_cutoff, cv2_cutoff, ma_window, SN weight per class) combination
+    (windows: default the searched ones, any of tensors['ma_windows']).
+    Returns (errors, volume, counts, pairs): errors (n_thresholds, n_windows, n_weights,
+    n_classes) absolute errors, volume / counts (n_thresholds, n_classes) sum of |actual|
+    and number of scored (fold, series) per class.
+    """
+    windows = tensors['windows'] if windows is None else windows
+    missing = [w for w in windows if w not in tensors['ma_windows']]
+    if missing:
+        raise ValueError(f"MA windows {missing} not in the tensors (ma_windows: {list(tensors['ma_windows'])})")
+    ma = tensors['ma'][[tensors['ma_windows'].index(w) for w in windows]]
+    actual = tensors['actual']
+    mask = ~np.isnan(actual) & tensors['scored'][..., None]
+    actual = np.where(mask, actual, 0.0)
+    pairs, codes = class_codes(tensors, adi_cutoffs, cv2_cutoffs)
+    onehot = (codes[..., None] == np.arange(len(DEMAND_TYPES))) & tensors['scored'][None, ..., None]
+    onehot = onehot.astype(np.float64)  # (n_thresholds, n_folds, n_series, n_classes)
+
+    errors = np.stack([
+        np.einsum('kfs,tfsc->tkc', _abs_errors(m, tensors['sn'], actual, mask, sn_weights), onehot)
+        for m in ma
+    ], axis=1)
+    volume = np.einsum('fs,tfsc->tc', np.abs(actual).sum(axis=-1), onehot)
+    counts = onehot.sum(axis=(1, 2))
+    return errors, volume, counts, pairs
+
+
+def best_config(tensors, sn_weights=SN_WEIGHTS, adi_cutoffs=ADI_CUTOFFS, cv2_cutoffs=CV2_CUTOFFS, default=None):
+    """
+    Best hybrid configuration over the grid (lowest total absolute error = WAPE over all
+    scored cells). Classes without any series keep the default model's weight.
+    Returns the params_json payload: model_params (PiecewiseHybrid init kwargs), per-class
+    SN weight / WAPE / observations, and the WAPE of the default configuration.
+    """
+    default = default or PiecewiseHybrid()
+    sn_weights = np.asarray(sn_weights, dtype=np.float64)
+    errors, volume, counts, pairs = search(tensors, sn_weights, adi_cutoffs, cv2_cutoffs)
+
+    best_k = errors.argmin(axis=2)                          # (thresholds, windows, classes)
+    best_err = np.take_along_axis(errors, best_k[:, :, None], axis=2)[:, :, 0]
+    t, w = np.unravel_index(best_err.sum(axis=-1).argmin(), best_err.shape[:2])
+    weights = np.where(counts[t] > 0, sn_weights[best_k[t, w]], default.sn_weights())
+
+    params = {
+        'ma_window': int(tensors['windows'][w]),
+        'season_len': int(tensors['season_len']),
+        **{f"sn_{c}": float(weights[i]) for i, c in enumerate(DEMAND_TYPES)},
+        'adi_cutoff': float(pairs[t, 0]),
+        'cv2_cutoff': float(pairs[t, 1]),
+    }
+    with np.errstate(invalid='ignore', divide='ignore'):
+        class_wape = best_err[t, w] / volume[t]
+    return {
+        'model_params': params,
+        'classes': {
+            c: {'sn_weight': params[f"sn_{c}"], 'wape': None if np.isnan(class_wape[i]) else float(class_wape[i]), 'n_obs': int(counts[t, i])}
+            for i, c in enumerate(DEMAND_TYPES)
+        },
+        'wape': float(best_err[t, w].sum() / volume[t].sum()),
+        'default_wape': score(tensors, default),
+        'folds': len(tensors['origins']),
+        'origins': [str(d.date()) for d in tensors['origins'][[0, -1]]],
+        'grid': {
+            'ma_window': list(tensors['windows']), 'sn_weight': sn_weights.tolist(),
+            'adi_cutoff': list(adi_cutoffs), 'cv2_cutoff': list(cv2_cutoffs),
+        },
+    }
+
+
+def score(tensors, model):
+    """WAPE of one PiecewiseHybrid configuration on the tensors (its ma_window must be one of tensors['ma_windows'])."""
+    errors, volume, _, _ = search(tensors, model.sn_weights(), [model.adi_cutoff], [model.cv2_cutoff], [model.ma_window])
+    # class c of the grid uses weight c: the configuration's own blend
+    own = errors[0, 0, np.arange(len(DEMAND_TYPES)), np.arange(len(DEMAND_TYPES))]
+    return float(own.sum() / volume[0].sum())
@@ -0,0 +1,82 @@
+from __future__ import annotations
+from functools import lru_cache
+import numpy as np
+import pandas as pd
+
+# Calendar feature service.
+# Every date-derived column (dim_calendar, daily_canon calendar features, feature
+# engineering flags) is computed once per distinct date in a small calendar table and
+# broadcast onto fact rows by integer day offset: row value = table[col][date - start].
+# A multi-million-row frame only spans ~1,700 dates, so no per-row .dt accessor runs.
+
+EARTHQUAKE_START = pd.Timestamp("2016-04-16")
+EARTHQUAKE_END = pd.Timestamp("2016-05-31")  # Approx 1.5 months shock
+
+
+@lru_cache(maxsize=8)
+def _calendar_table(start: pd.Timestamp, end: pd.Timestamp) -> pd.DataFrame:
+    dates = pd.date_range(start, end, freq="D")
+    cal = pd.DataFrame({"date": dates})
+    dt = cal["date"].dt
+
+    cal["date_str"] = dt.strftime("%Y-%m-%d")
+    cal["year"] = dt.year.astype("int32")
+    cal["month"] = dt.month.astype("int8")
+    cal["day"] = dt.day.astype("int8")
+    cal["quarter"] = dt.quarter.astype("int8")
+    cal["day_of_week"] = dt.dayofweek.astype("int8")  # 0=Mon, 6=Sun
+    cal["is_weekend"] = (cal["day_of_week"] >= 5).astype("int8")
+
+    iso = dt.isocalendar()
+    cal["iso_year"] = iso.year.astype("int32")
+    cal["iso_week"] = iso.week.astype("int8")
+    cal["year_week"] = (cal["iso_year"] * 100 + cal["iso_week"]).astype("int32")
+
+    # Payday proxy: 15th or last day of month
+    cal["is_month_end"] = dt.is_month_end.astype("int8")
+    cal["is_payday_15"] = (cal["day"] == 15).astype("int8")
+    cal["is_payday_proxy"] = ((cal["day"] == 15) | (cal["is_month_end"] == 1)).astype("int8")
+    # Days until next payday (15th, then ~30th); 0 from the 30th on
+    day = cal["day"].to_numpy(dtype=np.int64)
+    cal["days_to_payday"] = np.where(day < 15, 15 - day, np.where(day < 30, 30 - day, 0)).astype("int8")
+
+    # Week Start/End (Strict Monday Start)
+    cal["week_start_date"] = cal["date"] - pd.to_timedelta(cal["day_of_week"], unit="D")
+    cal["week_end_date"] = cal["week_start_date"] + pd.Timedelta(days=6)
+
+    cal["is_earthquake_period"] = cal["date"].between(EARTHQUAKE_START, EARTHQUAKE_END).astype("int8")
+    return cal
+
+
+def calendar_table(start_date, end_date) -> pd.DataFrame:
+    """One row per date in [start_date, end_date] with every date-derived column (cached)."""
+    return _calendar_table(pd.Timestamp(start_date).normalize(), pd.Timestamp(end_date).normalize())
+
+
+def day_numbers(dates) -> np.ndarray:
+    """Days since epoch (int64) of a datetime column/array; NaT is not supported."""
+    values = np.asarray(dates.to_numpy() if hasattr(dates, "to_numpy") else dates)
+    if np.isnat(values).any():
+        raise ValueError("calendar features: dates contain NaT")
+    return values.astype("datetime64[D]").astype(np.int64)
+
+
+def broadcast_calendar(dates, columns: dict) -> dict:
+    """
+    Calendar columns for row-aligned `dates`, as {name: array}.
+    columns maps a calendar_table column to the dtype wanted on the rows (None keeps the
+    table dtype); the cast is done on the per-date table, before the take.
+    """
+    days = day_numbers(dates)
+    first = days.min() if len(days) else 0
+    last = days.max() if len(days) else 0
+    epoch = np.datetime64(0, "D")
+    table = calendar_table(epoch + first, epoch + last)
+    offsets = days - first
+    out = {}
+    for c, dtype in columns.items():
+        per_date = table[c].to_numpy()
+        if dtype is not None:
+            per_date = per_date.astype(dtype)
+        out[c] = per_date[offsets]
+    return out
@@ -0,0 +1,172 @@
+from __future__ import annotations
+import hashlib
+from pathlib import Path
+import numpy as np
+import pandas as pd
+
+# Holiday/event features at the (date, store) grain, same semantics as
+# process_holidays_store_aware: National -> every store, Regional -> stores of the state,
+# Local -> stores of the city; transferred=True rows are ignored.
+FLAG_TYPES = {
+    "is_holiday": "Holiday",
+    "is_event": "Event",
+    "is_workday": "Work Day",
+    "is_bridge": "Bridge",
+    "is_transfer_type": "Transfer",
+}
+COUNT_COLS = {"n_holidays": "is_holiday", "n_events": "is_event"}
+HOLIDAY_COLS = list(FLAG_TYPES) + list(COUNT_COLS)
+
+
+class HolidayCalendar:
+    """
+    Dense (date x store) holiday matrices, built once and read by array lookup.
+
+    flags[col] is an int8 array of shape (n_dates, n_stores); dates start at `start`
+    with a 1-day step, stores follow `store_nbrs` (sorted). `n_entries` counts the
+    holiday rows hitting each cell (used to rebuild the sparse bridge table).
+    """
+
+    def __init__(self, start: pd.Timestamp, store_nbrs: np.ndarray, flags: dict, n_entries: np.ndarray):
+        self.start = pd.Timestamp(start)
+        self.store_nbrs = np.asarray(store_nbrs)
+        self.flags = flags
+        self.n_entries = n_entries
+        self._store_pos = np.full(int(self.store_nbrs.max()) + 1 if len(self.store_nbrs) else 1, -1, dtype=np.int64)
+        self._store_pos[self.store_nbrs] = np.arange(len(self.store_nbrs))
+
+    @property
+    def n_dates(self) -> int:
+        return self.n_entries.shape[0]
+
+    def lookup(self, dates, store_nbr) -> dict:
+        """Holiday columns (int8) for row-aligned date / store_nbr arrays. Cells outside the calendar are 0."""
+        dates = np.asarray(dates, dtype="datetime64[ns]")
+        store_nbr = np.asarray(store_nbr, dtype=np.int64)
+        d_idx = (dates - self.start.to_datetime64()) // np.timedelta64(1, "D")
+        in_store = (store_nbr >= 0) & (store_nbr < len(self._store_pos))
+        s_idx = np.where(in_store, self._store_pos[np.where(in_store, store_nbr, 0)], -1)
+        valid = (d_idx >= 0) & (d_idx < self.n_dates) & (s_idx >= 0)
+        flat = np.where(valid, d_idx * len(self.store_nbrs) + s_idx, 0)
+
+        out = {}
+        for col in HOLIDAY_COLS:
+            vals = self.flags[col].ravel()[flat]
+            out[col] = np.where(valid, vals, 0).astype("int8")
+        return out
+
+    def to_bridge(self) -> pd.DataFrame:
+        """Sparse (date, store_nbr) table: one row per cell hit by at least one holiday row."""
+        d_idx, s_idx = np.nonzero(self.n_entries)
+        out = pd.DataFrame({
+            "date": self.start + pd.to_timedelta(d_idx, unit="D"),
+            "store_nbr": self.store_nbrs[s_idx].astype("int16"),
+        })
+        for col in HOLIDAY_COLS:
+            out[col] = self.flags[col][d_idx, s_idx]
+        return out
+
+    def save(self, path: Path) -> None:
+        path.parent.mkdir(parents=True, exist_ok=True)
+        np.savez_compressed(
+            path,
+            start=np.array([self.start.to_datetime64()]),
+            store_nbrs=self.store_nbrs,
+            n_entries=self.n_entries,
+            **{f"flag_{c}": self.flags[c] for c in HOLIDAY_COLS},
+        )
+
+    @classmethod
+    def load(cls, path: Path) -> "HolidayCalendar":
+        with np.load(path) as z:
+            flags = {c: z[f"flag_{c}"] for c in HOLIDAY_COLS}
+            return cls(pd.Timestamp(z["start"][0]), z["store_nbrs"], flags, z["n_entries"])
+
+
+def build_holiday_calendar(
+    holidays: pd.DataFrame, stores: pd.DataFrame, start_date: pd.Timestamp, end_date: pd.Timestamp
+) -> HolidayCalendar:
+    """
+    Scatters every (non transferred) holiday row onto the stores it applies to.
+    The locale -> stores mapping uses a store index per city/state, so no cross join
+    and no merge: each holiday row just contributes its store index array.
+    """
+    print("Building holiday calendar (date x store)...")
+    hol = holidays[holidays["transferred"] == False]  # noqa: E712 (same filter as process_holidays_store_aware)
+
+    store_nbrs = np.sort(stores["store_nbr"].to_numpy())
+    st = stores.set_index("store_nbr").loc[store_nbrs]
+    all_idx = np.arange(len(store_nbrs))
+    by_state = {k: np.asarray(v) for k, v in pd.Series(all_idx).groupby(st["state"].to_numpy()).groups.items()}
+    by_city = {k: np.asarray(v) for k, v in pd.Series(all_idx).groupby(st["city"].to_numpy()).groups.items()}
+    empty = np.array([], dtype=np.int64)
+
+    # Calendar range covers the grid and every holiday row (the bridge keeps all of them)
+    start = min(pd.Timestamp(start_date), hol["date"].min()) if len(hol) else pd.Timestamp(start_date)
+    end = max(pd.Timestamp(end_date), hol["date"].max()) if len(hol) else pd.Timestamp(end_date)
+    n_dates = (end - start).days + 1
+    n_stores = len(store_nbrs)
+
+    # One store index array per holiday row, flattened into (date_idx, store_idx, row) triplets
+    locale = hol["locale"].to_numpy()
+    name = hol["locale_name"].to_numpy()
+    targets = [
+        all_idx if loc == "National"
+        else by_state.get(nm, empty) if loc == "Regional"
+        else by_city.get(nm, empty) if loc == "Local"
+        else empty
+        for loc, nm in zip(locale, name)
+    ]
+    sizes = np.array([len(t) for t in targets], dtype=np.int64)
+    s_idx = np.concatenate(targets) if len(targets) else empty
+    row = np.repeat(np.arange(len(hol)), sizes)
+    d_idx = ((hol["date"].to_numpy() - start.to_datetime64()) // np.timedelta64(1, "D"))[row]
+    flat = d_idx * n_stores + s_idx
+
+    n_entries = np.zeros(n_dates * n_stores, dtype=np.int16)
+    np.add.at(n_entries, flat, 1)
+
+    types = hol["type"].to_numpy()[row]
+    flags = {}
+    for col, typ in FLAG_TYPES.items():
+        hit = flat[types == typ]
+        counts = np.zeros(n_dates * n_stores, dtype=np.int16)
+        np.add.at(counts, hit, 1)
+        flags[col] = (counts > 0).astype("int8").reshape(n_dates, n_stores)
+        for count_col, src in COUNT_COLS.items():
+            if src == col:
+                flags[count_col] = counts.astype("int8").reshape(n_dates, n_stores)
+
+    return HolidayCalendar(start, store_nbrs, flags, n_entries.reshape(n_dates, n_stores))
+
+
+def calendar_cache_key(holidays_path: Path, stores_path: Path, start_date, end_date) -> str:
+    h = hashlib.sha256()
+    for p in (holidays_path, stores_path):
+        h.update(Path(p).read_bytes())
+    h.update(f"{pd.Timestamp(start_date).date()}|{pd.Timestamp(end_date).date()}".encode())
+    return h.hexdigest()[:16]
+
+
+def load_holiday_calendar(
+    holidays: pd.DataFrame,
+    stores: pd.DataFrame,
+    start_date: pd.Timestamp,
+    end_date: pd.Timestamp,
+    raw_data_dir: Path,
+    cache_dir: Path | None = None,
+) -> HolidayCalendar:
+    """
+    Returns the holiday calendar, from cache_dir when the holidays/stores files and the
+    date range are unchanged (key = hash of both files + range), else builds and caches it.
+    """
+    if cache_dir is None:
+        return build_holiday_calendar(holidays, stores, start_date, end_date)
+    key = calendar_cache_key(raw_data_dir / "holidays_events.csv", raw_data_dir / "stores.csv", start_date, end_date)
+    path = Path(cache_dir) / f"holiday_calendar_{key}.npz"
+    if path.exists():
+        print(f"Holiday calendar: cache hit ({path.name})")
+        return HolidayCalendar.load(path)
+    cal = build_holiday_calendar(holidays, stores, start_date, end_date)
+    cal.save(path)
+    return cal
@@ -0,0 +1,69 @@
+from __future__ import annotations
+import hashlib
+import json
+from pathlib import Path
+import numpy as np
+import pandas as pd
+from .storage import read_canon, write_canon
+
+WATERMARK_VERSION = 2  # bump when the canon schema changes (forces a full rebuild)
+
+
+def file_fingerprint(path: Path) -> str:
+    """sha256 of a (small) raw file. Used for inputs that are restated, not appended (stores, holidays)."""
+    h = hashlib.sha256()
+    with open(path, "rb") as f:
+        for block in iter(lambda: f.read(1 << 20), b""):
+            h.update(block)
+    return h.hexdigest()
+
+
+def prefix_fingerprint(df: pd.DataFrame, upto: pd.Timestamp, value_cols: list[str]) -> dict:
+    """
+    Cheap summary of the rows with date <= upto (row count + column sums).
+    If an append-only input gets restated in the past, the summary changes and the
+    incremental run falls back to a full rebuild.
+    """
+    mask = (df["date"] <= upto).to_numpy()
+    out = {"rows": int(mask.sum())}
+    for c in value_cols:
+        out[c] = round(float(np.nansum(df[c].to_numpy(dtype="float64")[mask])), 4)
+    return out
+
+
+def read_watermark(path: Path) -> dict | None:
+    if not path.exists():
+        return None
+    with open(path) as f:
+        wm = json.load(f)
+    if wm.get("version") != WATERMARK_VERSION:
+        return None
+    return wm
+
+
+def write_watermark(path: Path, payload: dict) -> None:
+    payload = {"version": WATERMARK_VERSION, **payload}
+    tmp = path.with_suffix(".tmp")
+    with open(tmp, "w") as f:
+        json.dump(payload, f, indent=2, default=str)
+    tmp.replace(path)
+
+
+def week_floor(ts: pd.Timestamp) -> pd.Timestamp:
+    """Monday of the week containing ts (same convention as make_weekly)."""
+    ts = pd.Timestamp(ts).normalize()
+    return ts - pd.Timedelta(days=ts.dayofweek)
+
+
+def replace_tail(path: Path, new: pd.DataFrame, boundary: pd.Timestamp, stores: list | None = None) -> pd.DataFrame:
+    """
+    Replaces everything from `boundary` onwards in a partitioned canon dataset with `new`.
+    Only the year partitions at/after the boundary are read back and rewritten
+    (restricted to `stores` when given, e.g. one shard of a sharded build).
+    Returns the rewritten slice.
+    """
+    year_start = pd.Timestamp(year=boundary.year, month=1, day=1)
+    kept = read_canon(path, stores=stores, start=year_start, end=boundary - pd.Timedelta(days=1))
+    out = pd.concat([kept, new[kept.columns]], ignore_index=True) if len(kept) else new
+    write_canon(out, path, replace_partitions=True)
+    return out
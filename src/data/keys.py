@@ -0,0 +1,141 @@
+from __future__ import annotations
+from pathlib import Path
+import numpy as np
+import pandas as pd
+
+# Integer surrogate keys for the series grain.
+# family_id (int16) and series_id (int32) are assigned once in preprocessing and
+# persisted in dim_family / dim_series; later runs keep existing ids and only append
+# new families/series, so ids are stable across rebuilds.
+FAMILY_ID_DTYPE = "int16"
+SERIES_ID_DTYPE = "int32"
+
+
+def _load_dim(path: Path, required: list[str]) -> pd.DataFrame | None:
+    if path is None or not Path(path).exists():
+        return None
+    dim = pd.read_parquet(path)
+    if not set(required).issubset(dim.columns):
+        return None  # legacy dimension without ids
+    return dim
+
+
+def build_dim_family(families, previous: pd.DataFrame | None = None) -> pd.DataFrame:
+    """(family_id, family). Existing ids are kept, new families get max+1 in sorted order."""
+    families = sorted({str(f) for f in families})
+    if previous is None or previous.empty:
+        known = pd.DataFrame({"family_id": pd.Series(dtype=FAMILY_ID_DTYPE), "family": pd.Series(dtype=object)})
+    else:
+        known = previous[["family_id", "family"]].copy()
+    known["family"] = known["family"].astype(str)
+    new = [f for f in families if f not in set(known["family"])]
+    start = int(known["family_id"].max()) + 1 if len(known) else 0
+    added = pd.DataFrame({"family_id": np.arange(start, start + len(new)), "family": new})
+    dim = pd.concat([known, added], ignore_index=True)
+    dim["family_id"] = dim["family_id"].astype(FAMILY_ID_DTYPE)
+    return dim.sort_values("family_id").reset_index(drop=True)
+
+
+def build_dim_series(stores, dim_family: pd.DataFrame, previous: pd.DataFrame | None = None) -> pd.DataFrame:
+    """
+    (series_id, store_nbr, family_id, family) for every store x family of the grid.
+    On a fresh build series_id follows the (store_nbr, family) sort order.
+    """
+    stores = np.sort(np.unique(np.asarray(stores, dtype=np.int64)))
+    fam = dim_family.sort_values("family")
+    grid = pd.DataFrame({
+        "store_nbr": np.repeat(stores, len(fam)).astype("int16"),
+        "family_id": np.tile(fam["family_id"].to_numpy(), len(stores)).astype(FAMILY_ID_DTYPE),
+    })
+    if previous is None or previous.empty:
+        grid.insert(0, "series_id", np.arange(len(grid), dtype=SERIES_ID_DTYPE))
+        dim = grid
+    else:
+        known = previous[["series_id", "store_nbr", "family_id"]]
+        merged = grid.merge(known, on=["store_nbr", "family_id"], how="left")
+        missing = merged["series_id"].isna().to_numpy()
+        if missing.any():
+            start = int(known["series_id"].max()) + 1
+            merged["series_id"] = merged["series_id"].astype("float64")
+            merged.loc[missing, "series_id"] = np.arange(start, start + missing.sum())
+        # Keep series that are no longer in the grid: ids are never reused
+        gone = known[~known["series_id"].isin(merged["series_id"])]
+        dim = pd.concat([merged, gone], ignore_index=True)
+    dim["series_id"] = dim["series_id"].astype(SERIES_ID_DTYPE)
+    dim["store_nbr"] = dim["store_nbr"].astype("int16")
+    dim["family_id"] = dim["family_id"].astype(FAMILY_ID_DTYPE)
+    dim = dim.merge(dim_family[["family_id", "family"]], on="family_id", how="left")
+    return dim[["series_id", "store_nbr", "family_id", "family"]].sort_values("series_id").reset_index(drop=True)
+
+
+def load_or_build_dims(stores, families, dim_dir: Path) -> tuple[pd.DataFrame, pd.DataFrame]:
+    """Extends the persisted dim_family / dim_series in dim_dir (if any) with the current grid."""
+    prev_family = _load_dim(Path(dim_dir) / "dim_family.parquet", ["family_id", "family"])
+    prev_series = _load_dim(Path(dim_dir) / "dim_series.parquet", ["series_id", "store_nbr", "family_id"])
+    dim_family = build_dim_family(families, prev_family)
+    if prev_family is None:
+        prev_series = None  # ids of an id-less family dimension cannot be trusted
+    dim_series = build_dim_series(stores, dim_family, prev_series)
+    return dim_family, dim_series
+
+
+def save_dims(dim_family: pd.DataFrame, dim_series: pd.DataFrame, dim_dir: Path) -> None:
+    """
+    Writes dim_family / dim_series atomically (tmp file + rename): the sales and the
+    dimension stages may run side by side and both read the previous dimensions.
+    """
+    for name, dim in (("dim_family", dim_family), ("dim_series", dim_series)):
+        path = Path(dim_dir) / f"{name}.parquet"
+        tmp = path.with_suffix(".tmp")
+        dim.to_parquet(tmp, index=False)
+        tmp.replace(path)
+
+
+def family_codes(family: pd.Series, dim_family: pd.DataFrame) -> np.ndarray:
+    """family labels -> family_id, via the category codes when possible (no string hashing per row)."""
+    lookup = pd.Series(dim_family["family_id"].to_numpy(), index=dim_family["family"].astype(str))
+    if isinstance(family.dtype, pd.CategoricalDtype):
+        per_cat = lookup.reindex(family.cat.categories.astype(str)).to_numpy()
+        codes = family.cat.codes.to_numpy()
+        out = np.where(codes >= 0, per_cat[np.maximum(codes, 0)], np.nan)
+    else:
+        out = lookup.reindex(family.astype(str)).to_numpy()
+    if np.isnan(out.astype("float64")).any():
+        raise ValueError("family_codes: families missing from dim_family")
+    return out.astype(FAMILY_ID_DTYPE)
+
+
+def attach_keys(df: pd.DataFrame, dim_family: pd.DataFrame, dim_series: pd.DataFrame) -> pd.DataFrame:
+    """
+    Adds series_id (int32, before store_nbr) and family_id (int16, after family) in place.
+    series_id comes from a dense (store_nbr, family_id) lookup table, not a merge.
+    """
+    fam_id = family_codes(df["family"], dim_family)
+    lut = np.full(
+        (int(dim_series["store_nbr"].max()) + 1, int(dim_family["family_id"].max()) + 1), -1, dtype=np.int64
+    )
+    lut[dim_series["store_nbr"].to_numpy(), dim_series["family_id"].to_numpy()] = dim_series["series_id"].to_numpy()
+    store = df["store_nbr"].to_numpy()
+    if store.max() >= lut.shape[0]:
+        raise ValueError("attach_keys: store_nbr missing from dim_series")
+    sid = lut[store, fam_id]
+    if (sid < 0).any():
+        raise ValueError("attach_keys: (store_nbr, family) pairs missing from dim_series")
+
+    pos = df.columns.get_loc("store_nbr")
+    df.insert(pos, "series_id", sid.astype(SERIES_ID_DTYPE))
+    df.insert(df.columns.get_loc("family") + 1, "family_id", fam_id)
+    return df
+
+
+def series_labels(df: pd.DataFrame) -> pd.DataFrame:
+    """One row per series_id with its store_nbr / family labels (first occurrence)."""
+    sid = df["series_id"].to_numpy()
+    _, first = np.unique(sid, return_index=True)
+    cols = [c for c in ["series_id", "store_nbr", "family", "family_id"] if c in df.columns]
+    return df[cols].iloc[np.sort(first)].sort_values("series_id").reset_index(drop=True)
+
+
+def series_key(df: pd.DataFrame) -> list[str]:
+    """Grouping key for series-level operations: series_id when available, else the label pair."""
+    return ["series_id"] if "series_id" in df.columns else ["store_nbr", "family"]
@@ -1,13 +1,226 @@
 from __future__ import annotations
 from pathlib import Path
 import pandas as pd
+import pyarrow as pa
+import pyarrow.csv as pacsv
+import pyarrow.parquet as pq
 from .validation import require_columns, assert_unique_key
+from .profiling import track_stage
 
-def load_raw_data(raw_data_dir: Path):
+# Raw file contracts shared by the in-memory and the streaming loaders.
+# "types" are pinned Arrow types (everything else is inferred per block).
+RAW_FILES = {
+    "train": {
+        "file": "train.csv",
+        "required": ["date", "store_nbr", "family", "sales", "onpromotion"],
+        "key": ["date", "store_nbr", "family"],
+        "types": {"date": pa.timestamp("ns"), "store_nbr": pa.int16(), "onpromotion": pa.int16(),
+                  "family": pa.string(), "sales": pa.float64(), "id": pa.int64()},
+        "categories": ["family"],
+    },
+    "test": {
+        "file": "test.csv",
+        "required": ["date", "store_nbr", "family", "onpromotion"],
+        "key": ["date", "store_nbr", "family"],
+        "types": {"date": pa.timestamp("ns"), "store_nbr": pa.int16(), "onpromotion": pa.int16(),
+                  "family": pa.string(), "id": pa.int64()},
+        "categories": ["family"],
+    },
+    "stores": {
+        "file": "stores.csv",
+        "required": ["store_nbr", "city", "state", "type", "cluster"],
+        "key": ["store_nbr"],
+        "types": {"store_nbr": pa.int16(), "cluster": pa.int16(),
+                  "city": pa.string(), "state": pa.string(), "type": pa.string()},
+        "categories": [],
+    },
+    "oil": {
+        "file": "oil.csv",
+        "required": ["date", "dcoilwtico"],
+        "key": ["date"],
+        "types": {"date": pa.timestamp("ns"), "dcoilwtico": pa.float64()},
+        "categories": [],
+    },
+    "holidays": {
+        "file": "holidays_events.csv",
+        "required": ["date", "type", "locale", "locale_name", "description", "transferred"],
+        "key": None,  # several events can share a date
+        "types": {"date": pa.timestamp("ns"), "transferred": pa.bool_(),
+                  "type": pa.string(), "locale": pa.string(),
+                  "locale_name": pa.string(), "description": pa.string()},
+        "categories": [],
+    },
+    "transactions": {
+        "file": "transactions.csv",
+        "required": ["date", "store_nbr", "transactions"],
+        "key": ["date", "store_nbr"],
+        "types": {"date": pa.timestamp("ns"), "store_nbr": pa.int16(), "transactions": pa.float64()},
+        "categories": [],
+    },
+}
+
+DEFAULT_BLOCK_SIZE = 16 << 20  # 16 MB of CSV text per chunk
+
+
+def stream_csv_to_parquet(
+    csv_path: Path,
+    parquet_path: Path,
+    name: str,
+    required: list[str],
+    key: list[str] | None = None,
+    types: dict | None = None,
+    categories: list[str] | None = None,
+    block_size: int = DEFAULT_BLOCK_SIZE,
+) -> dict:
+    """
+    Reads a raw CSV in bounded blocks with the Arrow CSV reader and writes a typed,
+    deduplicated parquet file (one row group per block).
+
+    Dedup keeps the first occurrence of each key. Raw Favorita files are written in date
+    order, so only the keys of the last open date have to be carried across blocks; this
+    keeps memory bounded by (block size + one day of keys) whatever the file size.
+    Files that are not date-ordered are rejected instead of being silently half-deduplicated.
+    """
+    types = types or {}
+    categories = categories or []
+    parquet_path.parent.mkdir(parents=True, exist_ok=True)
+
+    header = pacsv.open_csv(csv_path, read_options=pacsv.ReadOptions(block_size=1 << 16)).schema.names
+    convert = pacsv.ConvertOptions(column_types={c: t for c, t in types.items() if c in header})
+    reader = pacsv.open_csv(
+        csv_path,
+        read_options=pacsv.ReadOptions(block_size=block_size),
+        convert_options=convert,
+    )
+
+    writer = None
+    n_in = n_out = n_dup = 0
+    open_date = None
+    open_keys = None  # MultiIndex of keys already written for open_date
+
+    with track_stage(f"stage {name}") as stats:
+        try:
+            for batch in reader:
+                chunk = batch.to_pandas()
+                n_in += len(chunk)
+
+                # Per-chunk schema checks + compact dtypes
+                require_columns(chunk, required, name)
+                for c, t in types.items():
+                    if c in chunk.columns and pa.types.is_integer(t) and chunk[c].isna().any():
+                        raise ValueError(f"{name}: nulls in integer column '{c}'")
+                for c in categories:
+                    chunk[c] = chunk[c].astype("category")
+
+                if key:
+                    dup = chunk.duplicated(key).to_numpy().copy()
+                    if "date" in key:
+                        chunk_min = chunk["date"].min()
+                        if open_date is not None and chunk_min < open_date:
+                            raise ValueError(
+                                f"{name}: streaming dedup needs date-ordered input "
+                                f"(found {chunk_min.date()} after {open_date.date()})"
+                            )
+                        if open_keys is not None:
+                            on_open = (chunk["date"] == open_date).to_numpy()
+                            if on_open.any():
+                                seen = pd.MultiIndex.from_frame(chunk.loc[on_open, key].astype(object)).isin(open_keys)
+                                dup[on_open] |= seen
+                    if dup.any():
+                        n_dup += int(dup.sum())
+                        chunk = chunk[~dup]
+
+                    if "date" in key and len(chunk):
+                        last = chunk["date"].max()
+                        last_keys = pd.MultiIndex.from_frame(chunk.loc[chunk["date"] == last, key].astype(object))
+                        if open_keys is not None and last == open_date:
+                            last_keys = open_keys.append(last_keys)
+                        open_date, open_keys = last, last_keys
+
+                table = pa.Table.from_pandas(chunk, preserve_index=False)
+                if writer is None:
+                    schema = table.schema
+                    writer = pq.ParquetWriter(parquet_path, schema, compression="zstd")
+                writer.write_table(table.cast(schema))
+                n_out += len(chunk)
+        finally:
+            if writer is not None:
+                writer.close()
+        stats["rows"] = n_in
+
+    if key and "date" not in key:
+        # Small lookup tables (stores): no date ordering to lean on, check globally.
+        assert_unique_key(pd.read_parquet(parquet_path, columns=key), key, name)
+
+    if n_dup:
+        print(f"{name}: dropped {n_dup:,} duplicated rows on key={key}")
+    return {"name": name, "rows_in": n_in, "rows_out": n_out, "duplicates": n_dup, **stats}
+
+
+def stage_raw_data(raw_data_dir: Path, staging_dir: Path, block_size: int = DEFAULT_BLOCK_SIZE) -> pd.DataFrame:
+    """
+    Streams every raw CSV into a typed parquet staging dataset (<staging_dir>/<name>.parquet).
+    Returns the per-file report (rows, rows/sec, peak memory).
+    """
+    print(f"Streaming raw CSV files into {staging_dir} (block_size={block_size / 2**20:.0f} MB)...")
+    reports = []
+    for name, spec in RAW_FILES.items():
+        reports.append(
+            stream_csv_to_parquet(
+                raw_data_dir / spec["file"],
+                staging_dir / f"{name}.parquet",
+                name,
+                spec["required"],
+                key=spec["key"],
+                types=spec["types"],
+                categories=spec["categories"],
+                block_size=block_size,
+            )
+        )
+    report = pd.DataFrame(reports)[
+        ["name", "rows_in", "rows_out", "duplicates", "seconds", "rows_per_sec", "peak_rss_mb"]
+    ]
+    print(report.to_string(index=False))
+    return report
+
+
+def read_raw_columns(raw_data_dir: Path, name: str, columns: list[str]) -> pd.DataFrame:
+    """
+    Reads only `columns` of one raw CSV (typed as in RAW_FILES). Used by the stages that
+    need a couple of keys (e.g. the dimension exports) without loading the whole file.
+    """
+    spec = RAW_FILES[name]
+    missing = [c for c in columns if c not in spec["required"]]
+    if missing:
+        raise ValueError(f"{name}: {missing} are not part of the raw contract")
+    table = pacsv.read_csv(
+        Path(raw_data_dir) / spec["file"],
+        convert_options=pacsv.ConvertOptions(
+            include_columns=columns,
+            column_types={c: t for c, t in spec["types"].items() if c in columns},
+        ),
+    )
+    return table.to_pandas()
+
+
+def load_raw_data(raw_data_dir: Path, streaming: bool = False, staging_dir: Path | None = None,
+                  block_size: int = DEFAULT_BLOCK_SIZE):
     """
     Loads train, test, stores, oil, holidays, transactions from raw csvs.
     Returns tuple of DataFrames.
+
+    streaming=True goes through stage_raw_data() first (bounded-memory chunked read,
+    per-chunk checks, dedup) and then reads the typed parquet staging files back.
     """
+    if streaming:
+        staging_dir = Path(staging_dir) if staging_dir is not None else Path(raw_data_dir).parent / "staging"
+        stage_raw_data(Path(raw_data_dir), staging_dir, block_size=block_size)
+        frames = [pd.read_parquet(staging_dir / f"{name}.parquet") for name in RAW_FILES]
+        train, test, stores, oil, holidays, transactions = frames
+        print(f"train: {train.shape}  | test: {test.shape}")
+        print(f"stores: {stores.shape} | oil: {oil.shape} | holidays: {holidays.shape} | transactions: {transactions.shape}")
+        return train, test, stores, oil, holidays, transactions
+
     print("Loading raw CSV files...")
 
     train = pd.read_csv(
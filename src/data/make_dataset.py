@@ -1,5 +1,6 @@
 from __future__ import annotations
 import sys
+from concurrent.futures import FIRST_COMPLETED, ProcessPoolExecutor, as_completed, wait
 from pathlib import Path
 import pandas as pd
 import numpy as np
@@ -7,96 +8,120 @@ import numpy as np
 # Ensure src modules are found
 sys.path.append(str(Path(__file__).resolve().parent.parent.parent))
 
-from src.data.load import load_raw_data
+from src.data.load import RAW_FILES, load_raw_data, read_raw_columns
 from src.data.process import (
     process_oil,
-    process_holidays_store_aware,
-    build_daily_grid,
+    build_daily_cube,
     build_calendar_features,
+    merge_lookup,
     make_weekly
 )
-from src.data.validation import assert_unique_key
+from src.data.validation import assert_unique_key, profile_table, write_quality_report
+from src.data.storage import read_canon, write_canon, clear_canon
+from src.data.schema import apply_schema, schema_report
+from src.data.profiling import track_stage, current_rss_mb
+from src.data.keys import load_or_build_dims, attach_keys, save_dims
+from src.data.holidays import load_holiday_calendar
+from src.data.incremental import (
+    file_fingerprint,
+    prefix_fingerprint,
+    read_watermark,
+    write_watermark,
+    week_floor,
+    replace_tail,
+)
 
 RAW_DATA_DIR = Path("data/raw")
+STAGING_DATA_DIR = Path("data/staging")
 PROCESSED_DATA_DIR = Path("data/processed")
 PROCESSED_DATA_DIR.mkdir(parents=True, exist_ok=True)
+WATERMARK_PATH = PROCESSED_DATA_DIR / "_watermark.json"
+QUALITY_REPORT_PATH = PROCESSED_DATA_DIR / "_quality.json"
 
-def generate_sales_dataset():
-    # 1. Load Data
-    train, test, stores, oil, holidays, transactions = load_raw_data(RAW_DATA_DIR)
+HOLIDAY_CACHE_DIR = STAGING_DATA_DIR / "holiday_cache"
+SHARDS_PER_WORKER = 2  # a few more shards than workers evens out the tail of the pool
+# Peak working set per daily grid row of a block (grid + merges + weekly + parquet write),
+# measured on the Favorita columns; used to size blocks under max_memory.
+BLOCK_ROW_BYTES = 512
 
-    # 2. Determine global date range
-    start_date = min(train["date"].min(), test["date"].min())
-    end_date = max(train["date"].max(), test["date"].max())
-    print(f"Global date range: {start_date} to {end_date}")
+WEEKLY_AGG_RULES = {
+    "sales": "sum",
+    "onpromotion": "sum",
+    "dcoilwtico": "mean",
+    "transactions": "sum",
+    "transactions_missing": "max",
+    "is_holiday": "max",
+    "is_event": "max",
+    "is_workday": "max",
+    "is_bridge": "max",
+    "n_holidays": "sum",
+    "n_events": "sum",
+    "is_payday_proxy": "max",
+    "is_train_day": "sum", # Count of days belonging to history
+    "is_test_day": "sum",  # Count of days belonging to future/kaggle test
+}
 
-    # 3. Process inputs
-    oil_filled = process_oil(oil, start_date, end_date)
-    hol_store = process_holidays_store_aware(holidays, stores)
-    
-    tx = transactions.copy()
-    assert_unique_key(tx, ["date", "store_nbr"], "transactions")
 
+def build_daily_frame(
+    train, test, stores, oil_filled, holiday_cal, tx, start_date, end_date, store_median_tx=None, families=None
+):
+    """
+    Daily grid [start_date, end_date] x store x family with every input merged in.
+    Holiday features are read from holiday_cal (HolidayCalendar) by (date, store) array lookup.
+    store_median_tx (Series indexed by store_nbr) overrides the transactions fill value;
+    by default it is the per-store median over the frame being built.
+    families: family axis of the grid (default: families present in train/test).
+    """
     # 4. Build unified base and grid
     print("Building daily grid...")
-    train2 = train.copy()
-    test2 = test.copy()
-    train2["set"] = "train"
-    test2["set"] = "test"
-    test2["sales"] = np.nan  # Unknown future
-
-    base = pd.concat([train2, test2], ignore_index=True)
-    grid = build_daily_grid(base[["date", "store_nbr", "family"]], start_date, end_date)
+    # One concat (no per-input copies); test rows get sales=NaN (unknown future) from the concat
+    base = pd.concat([train, test], ignore_index=True)
+    base["set"] = np.repeat(np.array(["train", "test"], dtype=object), [len(train), len(test)])
+    # Grid + sales/promotions placed by integer position (no 3-key merge on the big table)
+    df = build_daily_cube(base, start_date, end_date, families=families)
+    del base
 
     # 5. Merge everything
     print("Merging data...")
-    df = grid.merge(base, on=["date", "store_nbr", "family"], how="left")
 
     # Fill basic columns
     df["onpromotion"] = df["onpromotion"].fillna(0).astype("int16")
     df["sales"] = np.where(df["set"].eq("train") & df["sales"].isna(), 0.0, df["sales"])
 
-    # Stores, Oil, Transactions, Holidays
-    df = df.merge(stores, on="store_nbr", how="left")
-    df = df.merge(oil_filled, on="date", how="left")
-    
-    df = df.merge(tx, on=["date", "store_nbr"], how="left")
+    # Stores, Oil, Transactions: left-merge equivalents gathered in place (no copy of the grid per merge)
+    merge_lookup(df, stores, on=["store_nbr"])
+    merge_lookup(df, oil_filled, on=["date"])
+    merge_lookup(df, tx, on=["date", "store_nbr"])
     df["transactions_missing"] = df["transactions"].isna().astype("int8")
-    store_median_tx = df.groupby("store_nbr")["transactions"].transform("median")
+    if store_median_tx is None:
+        store_median_tx = df.groupby("store_nbr")["transactions"].transform("median")
+    else:
+        store_median_tx = df["store_nbr"].map(store_median_tx)
     df["transactions"] = df["transactions"].fillna(store_median_tx)
+    del store_median_tx
     
-    df = df.merge(hol_store, on=["date", "store_nbr"], how="left")
-    
-    # Fill NA after merge
-    for c in ["is_holiday", "is_event", "is_workday", "is_bridge", "is_transfer_type", "n_holidays", "n_events"]:
-        df[c] = df[c].fillna(0).astype("int8")
+    # Holidays: (date, store) lookup in the dense calendar, 0 where nothing applies
+    for c, values in holiday_cal.lookup(df["date"].to_numpy(), df["store_nbr"].to_numpy()).items():
+        df[c] = values
 
     # 6. Feature Engineering
-    df = build_calendar_features(df)
+    build_calendar_features(df, copy=False)
 
-    # 7. Aggregation Weekly
-    print("Aggregating Weekly...")
     # Helper to count days in train vs test
     df["is_train_day"] = (df["set"] == "train").astype("int8")
     df["is_test_day"] = (df["set"] == "test").astype("int8")
+    return df
 
-    agg_rules = {
-        "sales": "sum",
-        "onpromotion": "sum",
-        "dcoilwtico": "mean",
-        "transactions": "sum",
-        "transactions_missing": "max",
-        "is_holiday": "max",
-        "is_event": "max",
-        "is_workday": "max",
-        "is_bridge": "max",
-        "n_holidays": "sum",
-        "n_events": "sum",
-        "is_payday_proxy": "max",
-        "is_train_day": "sum", # Count of days belonging to history
-        "is_test_day": "sum",  # Count of days belonging to future/kaggle test
-    }
-    weekly = make_weekly(df, agg_rules)
+
+def build_weekly_frame(df, engine="reshape"):
+    """
+    Weekly aggregation + history/future flags.
+    engine: "reshape" (dense (week, 7, series) reduction) or "groupby" (reference implementation).
+    """
+    # 7. Aggregation Weekly
+    print(f"Aggregating Weekly ({engine})...")
+    with track_stage(f"weekly {engine}"):
+        weekly = make_weekly(df, WEEKLY_AGG_RULES, engine=engine)
     
     # Validation flag: A week is "clean history" only if it has 7 train days
     # (Or at least 0 test days, to support potential gaps if any, though grid ensures 7 days)
@@ -115,43 +140,431 @@ def generate_sales_dataset():
     # Stats on incomplete weeks
     incomplete_weeks = weekly[weekly["is_test_day"] > 0]["week_start"].unique()
     print(f"Weeks touching Test set: {incomplete_weeks}")
+    return weekly
 
 
+def _watermark_payload(train, oil, transactions, stores_list, families_list, start_date, end_date, store_median_tx):
+    last_train_date = train["date"].max()
+    return {
+        "start_date": str(start_date.date()),
+        "end_date": str(end_date.date()),
+        "last_train_date": str(last_train_date.date()),
+        "inputs": {
+            "stores.csv": file_fingerprint(RAW_DATA_DIR / "stores.csv"),
+            "holidays_events.csv": file_fingerprint(RAW_DATA_DIR / "holidays_events.csv"),
+        },
+        "history": {
+            "train": prefix_fingerprint(train, last_train_date, ["sales", "onpromotion"]),
+            "oil": prefix_fingerprint(oil, last_train_date, ["dcoilwtico"]),
+            "transactions": prefix_fingerprint(transactions, last_train_date, ["transactions"]),
+        },
+        "stores": [int(s) for s in stores_list],
+        "families": [str(f) for f in families_list],
+        "store_median_tx": {str(k): float(v) for k, v in store_median_tx.items()},
+    }
 
-    # 8. Save
-    daily_path = PROCESSED_DATA_DIR / "daily_canon.parquet"
-    weekly_path = PROCESSED_DATA_DIR / "weekly_canon.parquet"
-    
-    # NEW: Export Dimensions & Bridge for SQL Mart
+
+def _incremental_boundary(wm, train, test, oil, transactions, start_date):
+    """
+    Returns the first week_start that must be rebuilt, or None when a full rebuild is needed.
+    Everything before the week containing the first non-history day of the previous run
+    (i.e. its first test day) is kept as-is.
+    """
+    if wm is None:
+        print("Incremental: no watermark found -> full rebuild.")
+        return None
+    if str(start_date.date()) != wm["start_date"]:
+        print("Incremental: start date moved -> full rebuild.")
+        return None
+    for name in ["stores.csv", "holidays_events.csv"]:
+        if file_fingerprint(RAW_DATA_DIR / name) != wm["inputs"][name]:
+            print(f"Incremental: {name} changed -> full rebuild.")
+            return None
+
+    last = pd.Timestamp(wm["last_train_date"])
+    history = {
+        "train": prefix_fingerprint(train, last, ["sales", "onpromotion"]),
+        "oil": prefix_fingerprint(oil, last, ["dcoilwtico"]),
+        "transactions": prefix_fingerprint(transactions, last, ["transactions"]),
+    }
+    if history != wm["history"]:
+        print("Incremental: history up to the watermark was restated -> full rebuild.")
+        return None
+
+    stores_now = set(pd.concat([train["store_nbr"], test["store_nbr"]]).astype(int).unique())
+    families_now = set(pd.concat([train["family"].astype(str), test["family"].astype(str)]).unique())
+    if stores_now != set(wm["stores"]) or families_now != set(wm["families"]):
+        print("Incremental: new stores/families -> full rebuild.")
+        return None
+
+    return week_floor(last + pd.Timedelta(days=1))
+
+
+def _year_partition(path, store, year):
+    """Every row of the (year, store) partition of a canon dataset."""
+    return read_canon(path, stores=[store], start=f"{year}-01-01", end=f"{year}-12-31")
+
+
+def _refill_transactions(daily_path, weekly_path, old_median_tx, store_median_tx, boundary):
+    """
+    Days without a transactions row are filled with their store's median, which moves
+    when new dates arrive. For the stores whose median changed since the watermark, the
+    filled days before boundary are rewritten with the new median, and so are the weekly
+    transactions of their weeks (re-summed from the days, like make_weekly): the kept
+    history then matches a full rebuild. Only the (year, store) partitions holding filled
+    days are read and rewritten. Returns the stores rewritten.
+    """
+    old = pd.Series({int(k): v for k, v in old_median_tx.items()}, dtype="float64").reindex(store_median_tx.index)
+    same = (old == store_median_tx) | (old.isna() & store_median_tx.isna())
+    last_kept = boundary - pd.Timedelta(days=1)
+    refilled = []
+    for store, median in store_median_tx[~same].items():
+        days = read_canon(daily_path, columns=["date", "transactions_missing"], stores=[store], end=last_kept)
+        filled = days.loc[days["transactions_missing"].to_numpy() == 1, "date"]
+        if not len(filled):
+            continue
+        for year in np.unique(filled.dt.year):
+            part = _year_partition(daily_path, store, year)
+            fill = (part["transactions_missing"].to_numpy() == 1) & (part["date"] < boundary).to_numpy()
+            part.loc[fill, "transactions"] = median
+            write_canon(part, daily_path, replace_partitions=True)
+
+        # Weekly sums of the weeks holding a filled day, from the rewritten days
+        weeks = np.unique(filled - pd.to_timedelta(filled.dt.dayofweek, unit="D"))
+        tx = read_canon(daily_path, columns=["series_id", "date", "transactions"], stores=[store], start=weeks[0], end=last_kept)
+        week = (tx["date"] - pd.to_timedelta(tx["date"].dt.dayofweek, unit="D")).to_numpy()
+        series = tx["series_id"].to_numpy()
+        starts = np.flatnonzero(np.r_[True, (series[1:] != series[:-1]) | (week[1:] != week[:-1])])
+        sums = pd.Series(
+            np.add.reduceat(tx["transactions"].to_numpy(), starts),
+            index=pd.MultiIndex.from_arrays([series[starts], week[starts]]),
+        )
+        sums = sums[sums.index.get_level_values(1).isin(weeks)]
+        for year in np.unique(pd.DatetimeIndex(weeks).year):
+            part = _year_partition(weekly_path, store, year)
+            rows = sums.index.get_indexer(pd.MultiIndex.from_arrays([part["series_id"].to_numpy(), part["week_start"].to_numpy()]))
+            part.loc[rows >= 0, "transactions"] = sums.to_numpy()[rows[rows >= 0]]
+            write_canon(part, weekly_path, replace_partitions=True)
+        refilled.append(int(store))
+    return refilled
+
+
+def _save_dimensions(stores: pd.DataFrame, dim_family: pd.DataFrame, dim_series: pd.DataFrame) -> None:
+    # dim_store / dim_family (family_id, family) / dim_series (series_id, store_nbr, family_id, family)
     dim_store_path = PROCESSED_DATA_DIR / "dim_store.parquet"
-    dim_family_path = PROCESSED_DATA_DIR / "dim_family.parquet"
-    bridge_path = PROCESSED_DATA_DIR / "bridge_event_store_day.parquet"
-    
-    # dim_store
     stores.to_parquet(dim_store_path, index=False)
-    
-    # dim_family
-    families = pd.DataFrame({"family": sorted(df["family"].dropna().unique())})
-    families.to_parquet(dim_family_path, index=False)
-    
-    # bridge (hol_store contains the exploded events per store/date)
-    # Ensure we only keep relevant columns
-    bridge_cols = ["date", "store_nbr", "is_holiday", "is_event", "is_workday", 
-                   "is_bridge", "is_transfer_type", "n_holidays", "n_events"]
-    # hol_store might have fewer rows than full grid, but that's fine (sparse bridge)
-    # Actually, let's filter hol_store to be safe
-    existing_cols = [c for c in bridge_cols if c in hol_store.columns]
-    hol_store[existing_cols].to_parquet(bridge_path, index=False)
-
-    # Core Facts
-    df.to_parquet(daily_path, index=False)
-    weekly.to_parquet(weekly_path, index=False)
-    
-    print(f"Saved: {daily_path} ({df.shape})")
-    print(f"Saved: {weekly_path} ({weekly.shape})")
+    save_dims(dim_family, dim_series, PROCESSED_DATA_DIR)
     print(f"Saved: {dim_store_path}")
-    print(f"Saved: {dim_family_path}")
+    print(f"Saved: {PROCESSED_DATA_DIR / 'dim_family.parquet'}")
+    print(f"Saved: {PROCESSED_DATA_DIR / 'dim_series.parquet'}")
+
+
+def _save_bridge(holiday_cal) -> None:
+    # bridge: sparse (date, store) cells with at least one holiday row (hol_store-equivalent)
+    bridge_path = PROCESSED_DATA_DIR / "bridge_event_store_day.parquet"
+    holiday_cal.to_bridge().to_parquet(bridge_path, index=False)
     print(f"Saved: {bridge_path}")
 
 
+def generate_dimensions():
+    """
+    dim_store / dim_family / dim_series straight from the raw key columns (no grid):
+    the grid's series are the store x family pairs of train + test, same ids as
+    generate_sales_dataset assigns.
+    """
+    stores = pd.read_csv(RAW_DATA_DIR / "stores.csv", dtype={"store_nbr": "int16", "cluster": "int16"})
+    keys = [read_raw_columns(RAW_DATA_DIR, name, ["store_nbr", "family"]) for name in ("train", "test")]
+    store_nbrs = np.unique(np.concatenate([k["store_nbr"].to_numpy() for k in keys]))
+    families = np.unique(np.concatenate([k["family"].astype(str).to_numpy() for k in keys]))
+    dim_family, dim_series = load_or_build_dims(store_nbrs, families, PROCESSED_DATA_DIR)
+    _save_dimensions(stores, dim_family, dim_series)
+
+
+def generate_holiday_bridge():
+    """bridge_event_store_day from holidays_events + stores only (the bridge keeps every holiday date)."""
+    holidays = read_raw_columns(RAW_DATA_DIR, "holidays", RAW_FILES["holidays"]["required"])
+    stores = read_raw_columns(RAW_DATA_DIR, "stores", RAW_FILES["stores"]["required"])
+    start, end = holidays["date"].min(), holidays["date"].max()
+    holiday_cal = load_holiday_calendar(holidays, stores, start, end, RAW_DATA_DIR, HOLIDAY_CACHE_DIR)
+    _save_bridge(holiday_cal)
+
 
+def _print_schema_report(df, name):
+    report = schema_report(df, name)
+    changed = report[report["saved"] != 0]
+    total = report.iloc[-1]
+    print(f"{name} dtypes (first block): {total['bytes_before'] / 1e6:,.1f} MB -> {total['bytes_after'] / 1e6:,.1f} MB")
+    print(changed.to_string(index=False))
+
+
+def _build_store_shard(
+    shard_stores, start_date, end_date, train, test, tx, stores, oil_filled, holiday_cal,
+    store_median_tx, families, dim_family, dim_series, weekly_engine, boundary, part_prefix=None,
+    report_dtypes=False,
+):
+    """
+    Daily + weekly frames of a block of stores (optionally a date range of them), written
+    straight to their own year/store partitions. Intermediates are dropped as soon as
+    they are written. Runs in a worker process in the sharded build.
+    part_prefix: write as extra files next to the other date blocks of the same partitions.
+    Frames are compacted to the registry dtypes (schema.py) as soon as they are built;
+    report_dtypes=True prints the bytes saved per column.
+    Returns the block report (rows, seconds and peak RSS per step).
+    """
+    daily_path = PROCESSED_DATA_DIR / "daily_canon.parquet"
+    weekly_path = PROCESSED_DATA_DIR / "weekly_canon.parquet"
+
+    def write(frame, path):
+        if part_prefix is not None:
+            write_canon(frame, path, append=True, part_prefix=part_prefix)
+            return len(frame)
+        if boundary is None:
+            write_canon(frame, path, replace_partitions=True)
+            return len(frame)
+        return len(replace_tail(path, frame, boundary, stores=list(shard_stores)))
+
+    report = {"stores": f"{shard_stores[0]}-{shard_stores[-1]}", "start": start_date.date(), "end": end_date.date()}
+    with track_stage("block daily", verbose=False, reset_peak=True) as st_daily:
+        df = build_daily_frame(
+            train, test, stores, oil_filled, holiday_cal, tx, start_date, end_date,
+            store_median_tx=store_median_tx, families=families,
+        )
+        del train, test, tx
+        attach_keys(df, dim_family, dim_series)
+        if report_dtypes:
+            _print_schema_report(df, "daily_canon")
+        df = apply_schema(df, "daily_canon")
+        st_daily["rows"] = len(df)
+    with track_stage("block weekly", verbose=False, reset_peak=True) as st_weekly:
+        weekly = build_weekly_frame(df, engine=weekly_engine)
+        attach_keys(weekly, dim_family, dim_series)
+        if report_dtypes:
+            _print_schema_report(weekly, "weekly_canon")
+        weekly = apply_schema(weekly, "weekly_canon")
+    with track_stage("block write", verbose=False, reset_peak=True) as st_write:
+        report["daily_rows"] = write(df, daily_path)
+        del df
+        report["weekly_rows"] = write(weekly, weekly_path)
+        del weekly
+
+    report["seconds"] = round(st_daily["seconds"] + st_weekly["seconds"] + st_write["seconds"], 2)
+    for step, st in (("daily", st_daily), ("weekly", st_weekly), ("write", st_write)):
+        report[f"peak_{step}_mb"] = round(st["peak_rss_mb"], 1)
+    return report
+
+
+def plan_blocks(store_nbrs, start_date, end_date, n_families, budget_mb=None, min_blocks=1) -> list[tuple]:
+    """
+    Splits the build into (stores, start, end) blocks.
+    Without a budget: min_blocks store blocks over the full date range.
+    With budget_mb: store blocks whose estimated working set (BLOCK_ROW_BYTES per grid row)
+    fits the budget; a store that does not fit on its own is cut into date ranges of
+    whole Monday-start weeks, so every week is aggregated within one block.
+    """
+    start_date, end_date = pd.Timestamp(start_date), pd.Timestamp(end_date)
+    n_days = (end_date - start_date).days + 1
+    n_blocks = max(1, min(len(store_nbrs), min_blocks))
+    if budget_mb is None:
+        return [(s, start_date, end_date) for s in np.array_split(store_nbrs, n_blocks) if len(s)]
+
+    budget_rows = max(1, int(budget_mb * 2**20 // BLOCK_ROW_BYTES))
+    stores_per_block = budget_rows // (n_days * n_families)
+    if stores_per_block >= 1:
+        n_blocks = max(n_blocks, -(-len(store_nbrs) // stores_per_block))
+        return [(s, start_date, end_date) for s in np.array_split(store_nbrs, n_blocks) if len(s)]
+
+    days = max(7, budget_rows // n_families // 7 * 7)
+    cuts = list(pd.date_range(week_floor(start_date) + pd.Timedelta(days=days), end_date, freq=f"{days}D"))
+    bounds = list(zip([start_date] + cuts, [c - pd.Timedelta(days=1) for c in cuts] + [end_date]))
+    return [(np.array([s]), b0, b1) for s in store_nbrs for b0, b1 in bounds]
+
+
+def generate_sales_dataset(
+    streaming: bool = False,
+    incremental: bool = False,
+    weekly_engine: str = "reshape",
+    exports: bool = True,
+    workers: int = 1,
+    max_memory: float | None = None,
+):
+    """
+    Builds daily_canon / weekly_canon + dimension exports from the raw CSVs.
+    streaming=True ingests the raw files through the chunked Arrow reader (bounded memory).
+
+    incremental=True reads the watermark left by the previous run (last train date +
+    input fingerprints) and only rebuilds the ISO weeks from the one holding the first
+    new date onwards; older rows of daily_canon / weekly_canon are kept. Transactions
+    for new rows are filled with the store medians over the full transactions history
+    (same value a full rebuild gives them); kept days filled with a median that has since
+    moved are re-filled (see _refill_transactions). Any restated input falls back to a
+    full rebuild.
+
+    weekly_engine selects the weekly aggregation ("reshape" or "groupby", see make_weekly).
+    exports=False skips the dimension / bridge files (written by their own pipeline
+    stages, see generate_dimensions / generate_holiday_bridge).
+    The data-quality profile of the raw inputs is written to QUALITY_REPORT_PATH on every run.
+
+    workers > 1 shards the build by store_nbr over a process pool: only the date range,
+    the transactions medians and the dimensions are global, so each worker builds the
+    grid, merges, calendar features and weekly aggregation of its stores and writes its
+    own partitions. Output is identical to workers=1.
+
+    max_memory (MB) bounds the build: stores (or, if one store is too big, whole-week date
+    ranges of it) are processed in blocks sized to fit what is left of the budget after
+    loading the inputs, each block is streamed to parquet and dropped before the next.
+    Per-block peak RSS of the daily / weekly / write steps is printed.
+    """
+    # 1. Load Data
+    train, test, stores, oil, holidays, transactions = load_raw_data(
+        RAW_DATA_DIR, streaming=streaming, staging_dir=STAGING_DATA_DIR
+    )
+
+    # 2. Determine global date range
+    start_date = min(train["date"].min(), test["date"].min())
+    end_date = max(train["date"].max(), test["date"].max())
+    print(f"Global date range: {start_date} to {end_date}")
+
+    # Data quality of the inputs: nulls, negative sales, duplicated keys, grid gaps,
+    # store closures, promo outliers (one pass per table)
+    write_quality_report(QUALITY_REPORT_PATH, [
+        profile_table(train, "train", key=["date", "store_nbr", "family"], date_col="date"),
+        profile_table(test, "test", key=["date", "store_nbr", "family"], date_col="date"),
+        profile_table(transactions, "transactions", key=["date", "store_nbr"], date_col="date"),
+        profile_table(oil, "oil", key=["date"], date_col="date"),
+    ])
+
+    daily_path = PROCESSED_DATA_DIR / "daily_canon.parquet"
+    weekly_path = PROCESSED_DATA_DIR / "weekly_canon.parquet"
+
+    boundary = None
+    if incremental:
+        wm = read_watermark(WATERMARK_PATH)
+        boundary = _incremental_boundary(wm, train, test, oil, transactions, start_date)
+        if boundary is not None and not (daily_path.is_dir() and weekly_path.is_dir()):
+            print("Incremental: previous partitioned outputs missing -> full rebuild.")
+            boundary = None
+
+    # 3. Process inputs
+    oil_filled = process_oil(oil, start_date, end_date)
+    holiday_cal = load_holiday_calendar(holidays, stores, start_date, end_date, RAW_DATA_DIR, HOLIDAY_CACHE_DIR)
+    
+    tx = transactions.copy()
+    assert_unique_key(tx, ["date", "store_nbr"], "transactions")
+
+    # Per-store median over the grid == per-store median of the transactions rows in range
+    # (every date is repeated once per family), so it can be computed without the grid.
+    in_range = tx["date"].between(start_date, end_date)
+    store_median_tx = tx[in_range].groupby("store_nbr")["transactions"].median()
+
+    train_in, test_in = train, test
+    if boundary is not None:
+        refilled = _refill_transactions(daily_path, weekly_path, wm["store_median_tx"], store_median_tx, boundary)
+        if refilled:
+            print(f"Incremental: transactions median moved, re-filled the history of stores {refilled}")
+        print(f"Incremental: rebuilding from week {boundary.date()} to {end_date.date()}")
+        train_in, test_in = train[train["date"] >= boundary], test[test["date"] >= boundary]
+        oil_filled = oil_filled[oil_filled["date"] >= boundary]
+        tx = tx[tx["date"] >= boundary]
+
+    # Integer keys (stable across runs, persisted in dim_family / dim_series), fixed before
+    # the build so that every shard uses the same ids
+    store_nbrs = np.sort(pd.concat([train_in["store_nbr"], test_in["store_nbr"]]).unique())
+    families = pd.concat([train_in["family"], test_in["family"]], ignore_index=True).unique()
+    dim_family, dim_series = load_or_build_dims(store_nbrs, families, PROCESSED_DATA_DIR)
+
+    # 8. Save
+    if exports:
+        _save_dimensions(stores, dim_family, dim_series)
+        _save_bridge(holiday_cal)
+
+    # Core Facts (partitioned by year/store, sorted by store/family/date -> see src/data/storage.py).
+    # Everything below is per store: each shard builds and writes its own store partitions.
+    if boundary is None:
+        clear_canon(daily_path)
+        clear_canon(weekly_path)
+    block_start = boundary if boundary is not None else start_date
+    shared = {
+        "stores": stores,
+        "oil_filled": oil_filled,
+        "holiday_cal": holiday_cal,
+        "store_median_tx": store_median_tx if boundary is not None else None,
+        "families": families,
+        "dim_family": dim_family,
+        "dim_series": dim_series,
+        "weekly_engine": weekly_engine,
+        "boundary": boundary,
+    }
+
+    budget_mb = None
+    if max_memory is not None:
+        # What is already resident (raw inputs) is not available to the blocks; each worker gets a share
+        budget_mb = (max_memory - current_rss_mb()) / max(1, workers)
+        if budget_mb <= 0:
+            print(f"WARNING: max_memory={max_memory} MB is below the memory already in use; smallest blocks used.")
+            budget_mb = 1
+    blocks = plan_blocks(
+        store_nbrs, block_start, end_date, len(families), budget_mb,
+        min_blocks=workers * SHARDS_PER_WORKER if workers > 1 else 1,
+    )
+    date_blocks = len({(b0, b1) for _, b0, b1 in blocks}) > 1
+    if date_blocks and boundary is not None:
+        # An incremental tail is a few weeks: one store per block is enough
+        blocks = plan_blocks(store_nbrs, block_start, end_date, len(families), min_blocks=len(store_nbrs))
+        date_blocks = False
+    if date_blocks:
+        # every date range of a store shares its partitions: medians must be the global ones
+        shared["store_median_tx"] = store_median_tx
+
+    def block_inputs(i, block):
+        block_stores, b0, b1 = block
+        frames = (train_in, test_in, tx)
+        if len(blocks) > 1:
+            frames = tuple(f[f["store_nbr"].isin(block_stores) & f["date"].between(b0, b1)] for f in frames)
+        return (block_stores, b0, b1) + frames, {
+            **shared, "part_prefix": f"part-b{i}" if date_blocks else None, "report_dtypes": i == 0,
+        }
+
+    if max_memory is not None or workers > 1:
+        print(f"Block build: {len(blocks)} blocks on {max(1, workers)} worker(s)"
+              + (f", budget {budget_mb:,.0f} MB per block" if budget_mb is not None else ""))
+    if workers <= 1:
+        reports = []
+        for i, block in enumerate(blocks):
+            args, kwargs = block_inputs(i, block)
+            reports.append(_build_store_shard(*args, **kwargs))
+            del args
+    else:
+        # At most `workers` blocks in flight, so block inputs are only sliced when a worker is free
+        reports = [None] * len(blocks)
+        with ProcessPoolExecutor(max_workers=workers) as pool:
+            running = {}
+            for i, block in enumerate(blocks):
+                if len(running) >= workers:
+                    finished, _ = wait(running, return_when=FIRST_COMPLETED)
+                    for f in finished:
+                        reports[running.pop(f)] = f.result()
+                args, kwargs = block_inputs(i, block)
+                running[pool.submit(_build_store_shard, *args, **kwargs)] = i
+                del args
+            for f in as_completed(running):
+                reports[running[f]] = f.result()
+    block_report = pd.DataFrame(reports)
+    if len(block_report) > 1 or max_memory is not None:
+        print(block_report.to_string(index=False))
+    if max_memory is not None:
+        peak = block_report.filter(like="peak_").to_numpy().max()
+        status = "within" if peak <= max_memory else "OVER"
+        print(f"Peak RSS over blocks: {peak:,.0f} MB ({status} max_memory={max_memory:,.0f} MB)")
+    n_daily, n_weekly = block_report["daily_rows"].sum(), block_report["weekly_rows"].sum()
+
+    write_watermark(
+        WATERMARK_PATH,
+        _watermark_payload(
+            train, oil, transactions,
+            store_nbrs, dim_family["family"], start_date, end_date, store_median_tx,
+        ),
+    )
+    
+    print(f"Saved: {daily_path} ({n_daily:,} rows rebuilt)")
+    print(f"Saved: {weekly_path} ({n_weekly:,} rows rebuilt)")
+    print(f"Saved: {WATERMARK_PATH}")
@@ -0,0 +1,199 @@
+from __future__ import annotations
+import hashlib
+import inspect
+import json
+import time
+from concurrent.futures import FIRST_COMPLETED, ProcessPoolExecutor, wait
+from pathlib import Path
+import pandas as pd
+from .profiling import peak_rss_mb
+
+# Minimal stage DAG for the preprocessing pipeline.
+# A stage declares the files it reads (inputs), the files/directories it writes
+# (outputs) and the stages it waits for (deps). Its cache key hashes the content of
+# the inputs, the source of the code it runs and its kwargs; when the key matches the
+# stamp left by the last successful run and the outputs still exist, the stage is skipped.
+# Ready stages run side by side in a process pool.
+
+
+class Stage:
+    def __init__(
+        self,
+        name: str,
+        func,
+        inputs: list | None = None,
+        outputs: list | None = None,
+        deps: list[str] | None = None,
+        code: list | None = None,
+        kwargs: dict | None = None,
+    ):
+        self.name = name
+        self.func = func
+        self.inputs = [Path(p) for p in inputs or []]
+        self.outputs = [Path(p) for p in outputs or []]
+        self.deps = list(deps or [])
+        # Code version = source of these files (defaults to the module defining func)
+        self.code = [Path(p) for p in code] if code else [Path(inspect.getsourcefile(func))]
+        self.kwargs = dict(kwargs or {})
+
+
+class _Hasher:
+    """Content hashes of files / directories, memoized on (size, mtime) for the run."""
+
+    def __init__(self):
+        self._seen = {}
+
+    def file(self, path: Path) -> str:
+        st = path.stat()
+        memo = (str(path), st.st_size, st.st_mtime_ns)
+        if memo not in self._seen:
+            h = hashlib.sha256()
+            with open(path, "rb") as f:
+                for block in iter(lambda: f.read(1 << 20), b""):
+                    h.update(block)
+            self._seen[memo] = h.hexdigest()
+        return self._seen[memo]
+
+    def path(self, path: Path) -> str:
+        if not path.exists():
+            return "missing"
+        if path.is_file():
+            return self.file(path)
+        h = hashlib.sha256()
+        for p in sorted(q for q in path.rglob("*") if q.is_file()):
+            h.update(str(p.relative_to(path)).encode())
+            h.update(self.file(p).encode())
+        return h.hexdigest()
+
+
+def stage_key(stage: Stage, hasher: _Hasher) -> str:
+    h = hashlib.sha256()
+    for group in (stage.inputs, stage.code):
+        for p in group:
+            h.update(str(p).encode())
+            h.update(hasher.path(p).encode())
+    h.update(json.dumps(stage.kwargs, sort_keys=True, default=str).encode())
+    return h.hexdigest()[:16]
+
+
+def _stamp_path(stamp_dir: Path, name: str) -> Path:
+    return Path(stamp_dir) / f"{name}.json"
+
+
+def is_cached(stage: Stage, key: str, stamp_dir: Path) -> bool:
+    path = _stamp_path(stamp_dir, stage.name)
+    if not path.exists():
+        return False
+    stamp = json.loads(path.read_text())
+    return stamp.get("key") == key and all(p.exists() for p in stage.outputs)
+
+
+def _write_stamp(stamp_dir: Path, stage: Stage, key: str, seconds: float) -> None:
+    path = _stamp_path(stamp_dir, stage.name)
+    path.parent.mkdir(parents=True, exist_ok=True)
+    tmp = path.with_suffix(".tmp")
+    tmp.write_text(json.dumps({
+        "key": key,
+        "outputs": [str(p) for p in stage.outputs],
+        "seconds": round(seconds, 3),
+        "finished_at": pd.Timestamp.now().isoformat(timespec="seconds"),
+    }, indent=2))
+    tmp.replace(path)
+
+
+def _run_stage(func, kwargs: dict) -> tuple[float, float]:
+    """Worker side: runs one stage, returns (seconds, peak RSS of the worker in MB)."""
+    t0 = time.perf_counter()
+    func(**kwargs)
+    return time.perf_counter() - t0, peak_rss_mb()
+
+
+def _check_dag(stages: list[Stage]) -> None:
+    names = [s.name for s in stages]
+    if len(set(names)) != len(names):
+        raise ValueError(f"Duplicate stage names: {names}")
+    for s in stages:
+        unknown = [d for d in s.deps if d not in names]
+        if unknown:
+            raise ValueError(f"Stage '{s.name}' depends on unknown stages {unknown}")
+    # Kahn's algorithm, only to reject cycles up front
+    remaining = {s.name: set(s.deps) for s in stages}
+    while remaining:
+        ready = [n for n, d in remaining.items() if not d]
+        if not ready:
+            raise ValueError(f"Dependency cycle between stages {sorted(remaining)}")
+        for n in ready:
+            del remaining[n]
+        for d in remaining.values():
+            d.difference_update(ready)
+
+
+def run_pipeline(
+    stages: list[Stage],
+    stamp_dir: Path,
+    max_workers: int | None = None,
+    force: bool = False,
+) -> pd.DataFrame:
+    """
+    Runs the stages in dependency order, skipping the ones whose cache key is unchanged.
+    Stages whose deps are done run concurrently (max_workers=1 runs them in-process, one
+    after the other). force=True ignores the stamps. Returns the per-stage summary
+    (status, wall seconds, worker peak RSS), also printed.
+    """
+    _check_dag(stages)
+    hasher = _Hasher()
+    pending = {s.name: s for s in stages}
+    done = set()
+    rows = {}
+    t_start = time.perf_counter()
+
+    def ready_stages():
+        return [s for s in pending.values() if all(d in done for d in s.deps)]
+
+    def record(stage, status, seconds, peak):
+        rows[stage.name] = {"stage": stage.name, "status": status, "seconds": round(seconds, 2), "peak_rss_mb": peak}
+
+    # One fresh worker per stage: its peak RSS is the stage's own, and memory is returned
+    # to the OS between stages
+    pool = ProcessPoolExecutor(max_workers=max_workers, max_tasks_per_child=1) if max_workers != 1 else None
+    running = {}
+    try:
+        while pending or running:
+            for stage in ready_stages():
+                del pending[stage.name]
+                # Keys are computed once the deps are done, so outputs of deps are hashed as written
+                key = stage_key(stage, hasher)
+                if not force and is_cached(stage, key, stamp_dir):
+                    print(f"[{stage.name}] cache hit ({key})")
+                    record(stage, "cached", 0.0, float("nan"))
+                    done.add(stage.name)
+                    continue
+                print(f"[{stage.name}] running...")
+                if pool is None:
+                    seconds, peak = _run_stage(stage.func, stage.kwargs)
+                    _write_stamp(stamp_dir, stage, key, seconds)
+                    record(stage, "ran", seconds, peak)
+                    done.add(stage.name)
+                else:
+                    running[pool.submit(_run_stage, stage.func, stage.kwargs)] = (stage, key)
+            if not running:
+                continue  # cache hits / inline runs may have unlocked new stages
+            finished, _ = wait(running, return_when=FIRST_COMPLETED)
+            for fut in finished:
+                stage, key = running.pop(fut)
+                try:
+                    seconds, peak = fut.result()
+                except Exception as e:
+                    raise RuntimeError(f"Stage '{stage.name}' failed: {e}") from e
+                _write_stamp(stamp_dir, stage, key, seconds)
+                record(stage, "ran", seconds, peak)
+                done.add(stage.name)
+    finally:
+        if pool is not None:
+            pool.shutdown(wait=True, cancel_futures=True)
+
+    summary = pd.DataFrame([rows[s.name] for s in stages])
+    print(summary.to_string(index=False))
+    hits = int((summary["status"] == "cached").sum())
+    print(f"Pipeline: {time.perf_counter() - t_start:.2f}s wall | {hits}/{len(stages)} stages from cache")
+    return summary
@@ -2,17 +2,55 @@ from __future__ import annotations
 import pandas as pd
 import numpy as np
 from .validation import assert_unique_key
+from .profiling import track_stage
+from .calendar_features import broadcast_calendar
 
-def build_calendar_features(df: pd.DataFrame) -> pd.DataFrame:
-    df = df.copy()
-    df["day_of_week"] = df["date"].dt.dayofweek.astype("int8")  # 0=Mon
-    df["is_weekend"] = (df["day_of_week"] >= 5).astype("int8")
-    df["month"] = df["date"].dt.month.astype("int8")
-    df["year"] = df["date"].dt.year.astype("int16")
-
-    # Payday proxy: 15th or last day of month
-    last_dom = (df["date"] + pd.offsets.MonthEnd(0)).dt.day
-    df["is_payday_proxy"] = ((df["date"].dt.day == 15) | (df["date"].dt.day == last_dom)).astype("int8")
+CALENDAR_FEATURE_DTYPES = {
+    "day_of_week": "int8",  # 0=Mon
+    "is_weekend": "int8",
+    "month": "int8",
+    "year": "int16",
+    "is_payday_proxy": "int8",  # Payday proxy: 15th or last day of month
+}
+
+
+def build_calendar_features(df: pd.DataFrame, copy: bool = True) -> pd.DataFrame:
+    """
+    Calendar columns broadcast from the per-date calendar table (see calendar_features).
+    copy=False adds the columns to df itself (saves a full copy of a large grid).
+    """
+    if copy:
+        df = df.copy()
+    for c, values in broadcast_calendar(df["date"], CALENDAR_FEATURE_DTYPES).items():
+        df[c] = values
+    return df
+
+
+def merge_lookup(df: pd.DataFrame, right: pd.DataFrame, on: list[str]) -> pd.DataFrame:
+    """
+    In-place equivalent of df.merge(right, on=on, how="left") for a right table that is
+    unique on `on`: every df row gets the position of its right row (-1 if none) and the
+    other right columns are gathered by position, with the same NA/dtype promotion as the
+    merge. df is not copied and the join key is hashed on right's side only.
+    """
+    codes = np.zeros(len(df), dtype=np.int64)
+    right_codes = np.zeros(len(right), dtype=np.int64)
+    missing = np.zeros(len(df), dtype=bool)
+    for c in on:
+        uniques = pd.Index(pd.unique(right[c].to_numpy()))
+        left_c = uniques.get_indexer(df[c].to_numpy())
+        missing |= left_c < 0
+        codes = codes * len(uniques) + left_c
+        right_codes = right_codes * len(uniques) + uniques.get_indexer(right[c].to_numpy())
+    pos = pd.Index(right_codes).get_indexer(codes)
+    pos[missing] = -1
+
+    for c in right.columns:
+        if c in on:
+            continue
+        col = right[c]
+        values = col.array if isinstance(col.dtype, pd.api.extensions.ExtensionDtype) else col.to_numpy()
+        df[c] = pd.api.extensions.take(values, pos, allow_fill=True)
     return df
 
 
@@ -93,28 +131,205 @@ def process_holidays_store_aware(holidays: pd.DataFrame, stores: pd.DataFrame) -
     return agg
 
 
+def _grid_axes(base: pd.DataFrame, start_date: pd.Timestamp, end_date: pd.Timestamp, families=None):
+    """
+    Grid axes in the same order as the historical MultiIndex.from_product(dates, stores, families).
+    families overrides the family axis (a store shard must still get every family).
+    """
+    dates = pd.date_range(start_date, end_date, freq="D")
+    stores = base["store_nbr"].unique()
+    if families is None:
+        families = base["family"].unique()
+    return dates, stores, families
+
+
+def _grid_keys(dates, stores, families) -> pd.DataFrame:
+    """Key columns of the dense grid, built by repeat/tile (date-major, then store, then family)."""
+    n_d, n_s, n_f = len(dates), len(stores), len(families)
+    date_col = np.repeat(dates.values, n_s * n_f)
+    store_col = np.tile(np.repeat(np.asarray(stores), n_f), n_d)
+    if isinstance(families, pd.Categorical):
+        fam_col = pd.Categorical.from_codes(np.tile(families.codes, n_d * n_s), dtype=families.dtype)
+    else:
+        fam_col = np.tile(np.asarray(families, dtype=object), n_d * n_s)
+    return pd.DataFrame({"date": date_col, "store_nbr": store_col, "family": fam_col})
+
+
+def _grid_positions(base: pd.DataFrame, dates, stores, families) -> np.ndarray:
+    """Flat grid position of every base row: (day * n_stores + store) * n_families + family."""
+    n_s, n_f = len(stores), len(families)
+    d_code = ((base["date"].to_numpy() - dates[0].to_datetime64()) // np.timedelta64(1, "D")).astype(np.int64)
+    s_code = pd.Index(stores).get_indexer(base["store_nbr"])
+    if isinstance(families, pd.Categorical) and isinstance(base["family"].dtype, pd.CategoricalDtype) \
+            and base["family"].dtype == families.dtype:
+        # category code -> position in grid order, no hashing of strings
+        lookup = np.full(len(families.categories), -1, dtype=np.int64)
+        lookup[families.codes] = np.arange(n_f)
+        f_code = lookup[base["family"].cat.codes.to_numpy()]
+    else:
+        f_code = pd.Index(np.asarray(families, dtype=object)).get_indexer(base["family"].astype(object))
+    return (d_code * n_s + s_code) * n_f + f_code
+
+
 def build_daily_grid(base: pd.DataFrame, start_date: pd.Timestamp, end_date: pd.Timestamp) -> pd.DataFrame:
     """
     Ensure complete daily grid for each (store_nbr, family) so lags/rolling are safe.
     """
-    stores = base["store_nbr"].unique()
-    families = base["family"].unique()
-    dates = pd.date_range(start_date, end_date, freq="D")
+    return _grid_keys(*_grid_axes(base, start_date, end_date))
 
-    grid = (
-        pd.MultiIndex.from_product([dates, stores, families], names=["date", "store_nbr", "family"])
-        .to_frame(index=False)
-    )
-    return grid
+
+def build_daily_cube(
+    base: pd.DataFrame, start_date: pd.Timestamp, end_date: pd.Timestamp, families=None
+) -> pd.DataFrame:
+    """
+    Dense daily grid with the base columns already placed: equivalent to
+    build_daily_grid(...).merge(base, on=["date", "store_nbr", "family"], how="left")
+    without the three-key hash join.
+
+    Every base row is given its integer grid position (day/store/family codes), and each
+    value column is gathered into a preallocated grid-sized array (missing cells -> NA,
+    with the same dtype promotion as the left merge).
+    Keys in base must be unique (guaranteed by the load checks).
+    families: optional family axis (default: the families present in base).
+    """
+    with track_stage("daily cube") as stats:
+        dates, stores, families = _grid_axes(base, start_date, end_date, families)
+        n_total = len(dates) * len(stores) * len(families)
+
+        pos = _grid_positions(base, dates, stores, families)
+        if (pos < 0).any() or (pos >= n_total).any():
+            raise ValueError("build_daily_cube: base rows fall outside the grid axes")
+
+        # src[i] = base row landing on grid cell i (-1 = empty cell)
+        src = np.full(n_total, -1, dtype=np.int64)
+        src[pos] = np.arange(len(base), dtype=np.int64)
+
+        cube = _grid_keys(dates, stores, families)
+        for c in base.columns:
+            if c in ("date", "store_nbr", "family"):
+                continue
+            values = base[c].array if isinstance(base[c].dtype, pd.api.extensions.ExtensionDtype) else base[c].to_numpy()
+            cube[c] = pd.api.extensions.take(values, src, allow_fill=True)
+        stats["rows"] = n_total
+    return cube
 
 
-def make_weekly(df: pd.DataFrame, agg_rules: dict) -> pd.DataFrame:
+def make_weekly(df: pd.DataFrame, agg_rules: dict, engine: str = "groupby") -> pd.DataFrame:
     """
     Weekly bucket based on Monday-start weeks.
+    engine="reshape" uses make_weekly_dense (requires the dense date-major grid).
     """
+    if engine == "reshape":
+        return make_weekly_dense(df, agg_rules)
+    if engine != "groupby":
+        raise ValueError(f"Unknown weekly engine: {engine}")
     df = df.copy()
     # Strict Monday Start: Date - dayofweek
     df["week_start"] = df["date"] - pd.to_timedelta(df["date"].dt.dayofweek, unit="D")
     group_cols = ["week_start", "store_nbr", "family"]
     weekly = df.groupby(group_cols, as_index=False).agg(agg_rules)
     return weekly
+
+
+def _dense_shape(df: pd.DataFrame) -> tuple[int, int]:
+    """
+    (n_dates, n_series) if df is a complete date-major grid (every date holds the same
+    series in the same order, dates contiguous), else raises ValueError.
+    """
+    n = len(df)
+    dates = df["date"].to_numpy()
+    if n == 0:
+        raise ValueError("make_weekly_dense: empty frame")
+    n_dates = int((dates[-1] - dates[0]) // np.timedelta64(1, "D")) + 1
+    if n % n_dates:
+        raise ValueError("make_weekly_dense: frame is not a complete daily grid")
+    n_series = n // n_dates
+    expected = dates[0] + np.arange(n_dates).astype("timedelta64[D]")
+    if not (dates.reshape(n_dates, n_series) == expected[:, None]).all():
+        raise ValueError("make_weekly_dense: frame is not date-major / contiguous")
+    for c in ["store_nbr", "family"]:
+        col = df[c]
+        vals = col.cat.codes.to_numpy() if isinstance(col.dtype, pd.CategoricalDtype) else col.to_numpy()
+        if not (vals.reshape(n_dates, n_series) == vals[:n_series]).all():
+            raise ValueError(f"make_weekly_dense: series order of '{c}' changes across dates")
+    return n_dates, n_series
+
+
+def _reduce_days(block: np.ndarray, rule: str, has_nan: bool) -> np.ndarray:
+    """Reduces a (week, day, series) block along the day axis, skipping NaNs like groupby."""
+    is_int = not np.issubdtype(block.dtype, np.floating)
+    if rule == "sum":
+        if is_int:
+            return block.sum(axis=1, dtype=np.int64)
+        if has_nan:
+            return np.add.reduce(block, axis=1, where=~np.isnan(block), initial=0.0)
+        return block.sum(axis=1)
+    if rule == "mean":
+        block = block.astype(np.float64, copy=False)
+        if not has_nan:
+            return block.sum(axis=1) / block.shape[1]
+        valid = ~np.isnan(block)
+        total = np.add.reduce(block, axis=1, where=valid, initial=0.0)
+        count = valid.sum(axis=1)
+        return np.divide(total, count, out=np.full(total.shape, np.nan), where=count > 0)
+    if rule == "max":
+        return block.max(axis=1) if is_int else np.fmax.reduce(block, axis=1)
+    if rule == "min":
+        return block.min(axis=1) if is_int else np.fmin.reduce(block, axis=1)
+    raise ValueError(f"make_weekly_dense: unsupported rule '{rule}'")
+
+
+def make_weekly_dense(df: pd.DataFrame, agg_rules: dict) -> pd.DataFrame:
+    """
+    Same output as the groupby make_weekly (rows sorted by week_start/store/family,
+    same dtypes), computed on the dense grid: each column is viewed as a
+    (date, series) array, the whole Monday-Sunday weeks are reshaped (no copy) to
+    (week, 7, series) and reduced along the day axis. The partial first/last weeks
+    are reduced on their own days only.
+
+    Supported rules: sum, mean, max, min. NaNs are skipped like in groupby.
+    """
+    n_dates, n_series = _dense_shape(df)
+    first = pd.Timestamp(df["date"].iat[0])
+    head = (7 - first.dayofweek) % 7          # days of the partial first week
+    n_full = (n_dates - head) // 7
+    tail = n_dates - head - 7 * n_full        # days of the partial last week
+    n_weeks = (head > 0) + n_full + (tail > 0)
+
+    # Groupby output order: series sorted by (store_nbr, family)
+    keys = df[["store_nbr", "family"]].iloc[:n_series].reset_index(drop=True)
+    perm = keys.sort_values(["store_nbr", "family"], kind="stable").index.to_numpy()
+    keys = keys.iloc[perm].reset_index(drop=True)
+
+    week0 = first - pd.Timedelta(days=first.dayofweek)
+    fam = keys["family"]
+    if isinstance(fam.dtype, pd.CategoricalDtype):
+        fam_col = pd.Categorical.from_codes(np.tile(fam.cat.codes.to_numpy(), n_weeks), dtype=fam.dtype)
+    else:
+        fam_col = pd.array(np.tile(fam.to_numpy(), n_weeks), dtype=fam.dtype)
+    out = {
+        "week_start": np.repeat((week0 + pd.to_timedelta(np.arange(n_weeks) * 7, unit="D")).values, n_series),
+        "store_nbr": np.tile(keys["store_nbr"].to_numpy(), n_weeks),
+        "family": fam_col,
+    }
+
+    for col, rule in agg_rules.items():
+        vals = df[col].to_numpy().reshape(n_dates, n_series)
+        if vals.dtype == bool:
+            vals = vals.view(np.int8)
+        has_nan = np.issubdtype(vals.dtype, np.floating) and bool(np.isnan(vals).any())
+
+        blocks = []
+        if head:
+            blocks.append(vals[:head][None])
+        if n_full:
+            blocks.append(vals[head:head + 7 * n_full].reshape(n_full, 7, n_series))
+        if tail:
+            blocks.append(vals[n_dates - tail:][None])
+        res = np.concatenate([_reduce_days(b, rule, has_nan) for b in blocks], axis=0)
+
+        if rule in ("sum", "max", "min") and np.issubdtype(vals.dtype, np.integer):
+            res = res.astype(df[col].dtype)  # groupby keeps the input integer width
+        out[col] = res[:, perm].ravel()
+
+    return pd.DataFrame(out)
@@ -0,0 +1,85 @@
+from __future__ import annotations
+import os
+import sys
+import time
+from contextlib import contextmanager
+
+try:
+    import resource
+except ImportError:  # Windows
+    resource = None
+
+
+def current_rss_mb() -> float:
+    """Resident set size of the current process right now (MB)."""
+    try:
+        with open("/proc/self/statm") as f:
+            pages = int(f.read().split()[1])
+        return pages * os.sysconf("SC_PAGE_SIZE") / 1024**2
+    except (OSError, ValueError, AttributeError):
+        return peak_rss_mb()
+
+
+def peak_rss_mb() -> float:
+    """High-water mark of the process RSS (MB), since start or the last reset_peak_rss()."""
+    try:
+        with open("/proc/self/status") as f:
+            for line in f:
+                if line.startswith("VmHWM:"):
+                    return int(line.split()[1]) / 1024
+    except OSError:
+        pass
+    if resource is None:
+        return float("nan")
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # Linux reports kB, macOS reports bytes
+    return peak / 1024**2 if sys.platform == "darwin" else peak / 1024
+
+
+def reset_peak_rss() -> bool:
+    """
+    Resets the RSS high-water mark to the current RSS (Linux only, /proc/self/clear_refs),
+    so that the next peak_rss_mb() is the peak of what ran in between.
+    Returns False where unsupported (the peak then stays process-wide).
+    """
+    try:
+        with open("/proc/self/clear_refs", "w") as f:
+            f.write("5")
+        return True
+    except OSError:
+        return False
+
+
+@contextmanager
+def track_stage(name: str, verbose: bool = True, reset_peak: bool = False):
+    """
+    Times a block and records memory around it.
+    Yields a dict; set stats["rows"] inside the block to get a rows/sec figure.
+    reset_peak=True makes stats["peak_rss_mb"] the peak of this block only (where supported).
+    """
+    stats = {"stage": name, "rows": None}
+    if reset_peak:
+        reset_peak_rss()
+    rss_start = current_rss_mb()
+    t0 = time.perf_counter()
+    try:
+        yield stats
+    finally:
+        stats["seconds"] = time.perf_counter() - t0
+        stats["rss_start_mb"] = rss_start
+        stats["rss_end_mb"] = current_rss_mb()
+        stats["peak_rss_mb"] = peak_rss_mb()
+        if stats["rows"] is not None and stats["seconds"] > 0:
+            stats["rows_per_sec"] = stats["rows"] / stats["seconds"]
+        if verbose:
+            print(format_stage(stats))
+
+
+def format_stage(stats: dict) -> str:
+    msg = f"[{stats['stage']}] {stats['seconds']:.2f}s"
+    if stats.get("rows") is not None:
+        msg += f" | {stats['rows']:,} rows"
+        if "rows_per_sec" in stats:
+            msg += f" ({stats['rows_per_sec']:,.0f} rows/s)"
+    msg += f" | rss {stats['rss_end_mb']:.0f} MB (peak {stats['peak_rss_mb']:.0f} MB)"
+    return msg
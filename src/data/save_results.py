@@ -1,20 +1,40 @@
 import sqlite3
 import pandas as pd
 import json
+import re
 from pathlib import Path
 from datetime import datetime
 import uuid
 
 # Define paths to DBs
 EXPERIMENTS_DIR = Path(__file__).resolve().parent.parent.parent / "data" / "experiments"
+DIM_SERIES_PATH = Path(__file__).resolve().parent.parent.parent / "data" / "processed" / "dim_series.parquet"
 DB_FORECASTS = EXPERIMENTS_DIR / "forecasts.sqlite"
 DB_METRICS = EXPERIMENTS_DIR / "metrics.sqlite"
 DB_DECISIONS = EXPERIMENTS_DIR / "decisions.sqlite"
+MART_SQL = Path(__file__).resolve().parent.parent.parent / "sql" / "04_mart.sql"
+# Mart tables of each experiment DB (DDL from sql/04_mart.sql, created on first use)
+DB_TABLES = {
+    DB_FORECASTS: ["dim_runs", "fact_forecasts_weekly"],
+    DB_METRICS: ["fact_backtest_metrics", "fact_drift_weekly"],
+    DB_DECISIONS: ["fact_inventory_decisions_weekly"],
+}
+
+def mart_ddl(tables):
+    """CREATE TABLE IF NOT EXISTS statements of the given sql/04_mart.sql tables."""
+    statements = {}
+    for statement in MART_SQL.read_text().split(";"):
+        match = re.search(r"CREATE TABLE (\w+)", statement)
+        if match:
+            statements[match.group(1)] = statement.replace("CREATE TABLE", "CREATE TABLE IF NOT EXISTS", 1).strip() + ";"
+    return "\n".join(statements[t] for t in tables)
 
 def get_connection(db_path):
-    """Creates a connection to a specific SQLite DB."""
+    """Creates a connection to a specific SQLite DB, with its mart tables (DB_TABLES) created if missing."""
     try:
+        Path(db_path).parent.mkdir(parents=True, exist_ok=True)
         conn = sqlite3.connect(db_path)
+        conn.executescript(mart_ddl(DB_TABLES.get(Path(db_path), [])))
         return conn
     except sqlite3.Error as e:
         print(f"Error connecting to {db_path}: {e}")
@@ -23,7 +43,7 @@ def get_connection(db_path):
 def register_run(train_end_year_week, model_family, params, horizon=8, grain="weekly"):
     """
     Registers a new experiment run in forecasts.sqlite (dim_runs).
-    Returns the run_id.
+    Returns the run_id (None if it could not be registered).
     """
     run_id = str(uuid.uuid4())
     created_at = datetime.now().isoformat()
@@ -46,12 +66,27 @@ def register_run(train_end_year_week, model_family, params, horizon=8, grain="we
             conn.close()
     return None
 
+def with_series_id(df):
+    """
+    Facts are keyed on series_id. Frames still carrying (store_nbr, family) labels
+    are mapped through dim_series and the labels are dropped.
+    """
+    if "series_id" in df.columns:
+        return df.drop(columns=[c for c in ["store_nbr", "family", "family_id"] if c in df.columns])
+    dim = pd.read_parquet(DIM_SERIES_PATH, columns=["series_id", "store_nbr", "family"])
+    dim["family"] = dim["family"].astype(str)
+    out = df.assign(family=df["family"].astype(str)).merge(dim, on=["store_nbr", "family"], how="left")
+    if out["series_id"].isna().any():
+        raise ValueError("with_series_id: (store_nbr, family) pairs missing from dim_series")
+    out["series_id"] = out["series_id"].astype("int32")
+    return out.drop(columns=["store_nbr", "family"])
+
 def save_forecasts(df_forecasts, run_id):
     """
     Saves forecasts to fact_forecasts_weekly in forecasts.sqlite.
-    df_forecasts must have columns: year_week, store_nbr, family, horizon_step, yhat_mean, yhat_p10, yhat_p50, yhat_p90
+    df_forecasts must have columns: year_week, series_id (or store_nbr + family), horizon_step, yhat_mean, yhat_p10, yhat_p50, yhat_p90
     """
-    df = df_forecasts.copy()
+    df = with_series_id(df_forecasts)
     df["run_id"] = run_id
     
     conn = get_connection(DB_FORECASTS)
@@ -85,9 +120,9 @@ def save_metrics(df_metrics, run_id):
 def save_decisions(df_decisions, run_id):
     """
     Saves decisions to fact_inventory_decisions_weekly in decisions.sqlite.
-    df_decisions must have columns: year_week, store_nbr, family, order_qty, safety_stock, service_level, policy
+    df_decisions must have columns: year_week, series_id (or store_nbr + family), order_qty, safety_stock, service_level, policy
     """
-    df = df_decisions.copy()
+    df = with_series_id(df_decisions)
     df["run_id"] = run_id
     
     conn = get_connection(DB_DECISIONS)
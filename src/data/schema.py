@@ -0,0 +1,147 @@
+from __future__ import annotations
+import numpy as np
+import pandas as pd
+
+# Dtype registry of the pipeline frames.
+# One minimal dtype per column: float32 measures, int8 flags/small counts, int16/int32
+# keys, categorical labels. Applied when canon frames are written and read
+# (storage.write_canon / read_canon) and on the feature frames, so a column has the
+# same dtype wherever it is loaded. Columns not listed are left as they are.
+
+MEASURE = "float32"
+FLAG = "int8"
+
+_KEYS = {
+    "series_id": "int32",
+    "store_nbr": "int16",
+    "family": "category",
+    "family_id": "int16",
+}
+_HOLIDAYS = {c: FLAG for c in [
+    "is_holiday", "is_event", "is_workday", "is_bridge", "is_transfer_type", "n_holidays", "n_events",
+]}
+
+SCHEMAS = {
+    "daily_canon": {
+        **_KEYS,
+        "id": "Int32",  # Kaggle row id, missing on grid-filled rows
+        "sales": MEASURE,
+        "onpromotion": "int16",
+        "set": "category",
+        "city": "category",
+        "state": "category",
+        "type": "category",
+        "cluster": FLAG,
+        "dcoilwtico": MEASURE,
+        "transactions": MEASURE,
+        "transactions_missing": FLAG,
+        **_HOLIDAYS,
+        "day_of_week": FLAG,
+        "is_weekend": FLAG,
+        "month": FLAG,
+        "year": "int16",
+        "is_payday_proxy": FLAG,
+        "is_train_day": FLAG,
+        "is_test_day": FLAG,
+    },
+    "weekly_canon": {
+        **_KEYS,
+        "sales": MEASURE,
+        "onpromotion": "int16",
+        "dcoilwtico": MEASURE,
+        "transactions": MEASURE,
+        "transactions_missing": FLAG,
+        **_HOLIDAYS,
+        "is_payday_proxy": FLAG,
+        "is_train_day": FLAG,  # days per week: 0..7
+        "is_test_day": FLAG,
+        "is_clean_history": FLAG,
+        "is_future": FLAG,
+    },
+}
+# Feature frames = daily columns + engineered ones (lags of a float32 measure stay float32)
+SCHEMAS["features"] = {
+    **SCHEMAS["daily_canon"],
+    "day": FLAG,
+    "is_payday_15": FLAG,
+    "is_month_end": FLAG,
+    "days_to_payday": FLAG,
+    "is_weekend_high_lift": FLAG,
+    "oil_ma_7": MEASURE,
+    "is_earthquake_period": FLAG,
+    "is_earthquake_manabi": FLAG,
+}
+FEATURE_PREFIX_DTYPES = {
+    "sales_lag_": MEASURE,
+    "sales_roll_": MEASURE,
+    "sales_ewm_": MEASURE,
+    "sales_last_year": MEASURE,
+}
+
+
+def schema_for(name: str, columns) -> dict:
+    """Declared dtype of each column of `columns` present in schema `name`."""
+    if name not in SCHEMAS:
+        raise ValueError(f"Unknown schema '{name}' (known: {list(SCHEMAS)})")
+    declared = SCHEMAS[name]
+    out = {}
+    for c in columns:
+        if c in declared:
+            out[c] = declared[c]
+        elif name == "features":
+            for prefix, dtype in FEATURE_PREFIX_DTYPES.items():
+                if str(c).startswith(prefix):
+                    out[c] = dtype
+    return out
+
+
+def _cast(col: pd.Series, dtype: str) -> pd.Series:
+    target = pd.api.types.pandas_dtype(dtype)
+    if col.dtype == target:
+        return col
+    if isinstance(target, pd.CategoricalDtype):
+        return col.astype("category")
+    if pd.api.types.is_integer_dtype(target) and len(col):
+        # Never wrap around: an out-of-range value means the registry is wrong for this data
+        info = np.iinfo(target.numpy_dtype if hasattr(target, "numpy_dtype") else target)
+        lo, hi = col.min(), col.max()
+        if pd.notna(lo) and (lo < info.min or hi > info.max):
+            raise ValueError(f"{col.name}: values [{lo}, {hi}] do not fit {dtype}")
+    return col.astype(target)
+
+
+def apply_schema(df: pd.DataFrame, name: str) -> pd.DataFrame:
+    """
+    Casts the columns of df declared in schema `name` to their registry dtype.
+    Returns a new frame sharing the unchanged columns (no full copy); df is not modified.
+    """
+    out = None
+    for c, dtype in schema_for(name, df.columns).items():
+        cast = _cast(df[c], dtype)
+        if cast is not df[c]:
+            if out is None:
+                out = df.copy(deep=False)
+            out[c] = cast
+    return df if out is None else out
+
+
+def schema_report(df: pd.DataFrame, name: str) -> pd.DataFrame:
+    """In-memory bytes per column before / after apply_schema, with the bytes saved."""
+    after = apply_schema(df, name)
+    rows = []
+    for c in df.columns:
+        before_b = int(df[c].memory_usage(index=False, deep=True))
+        after_b = int(after[c].memory_usage(index=False, deep=True))
+        rows.append({
+            "column": c,
+            "dtype_before": str(df[c].dtype),
+            "dtype_after": str(after[c].dtype),
+            "bytes_before": before_b,
+            "bytes_after": after_b,
+            "saved": before_b - after_b,
+        })
+    report = pd.DataFrame(rows)
+    total = {"column": "TOTAL", "dtype_before": "", "dtype_after": "",
+             "bytes_before": report["bytes_before"].sum(), "bytes_after": report["bytes_after"].sum(),
+             "saved": report["saved"].sum()}
+    return pd.concat([report, pd.DataFrame([total])], ignore_index=True)
@@ -0,0 +1,299 @@
+from __future__ import annotations
+import json
+import shutil
+from pathlib import Path
+import numpy as np
+import pandas as pd
+import pyarrow as pa
+import pyarrow.dataset as ds
+from .schema import SCHEMAS, apply_schema
+
+# Physical layout of the canonical facts.
+# - Hive partitions year=YYYY/store_nbr=N, so a year or a store is a directory prune.
+# - Rows sorted by (series_id, date) == (store_nbr, family, date) inside each file, so
+#   row-group min/max statistics on series/family/date stay tight and predicates skip
+#   whole row groups.
+# - "year" is derived from the date column when the frame has no such column (weekly);
+#   derived keys are not returned by the reader.
+LAYOUTS = {
+    "daily_canon": {"date_col": "date", "partition_by": ["year", "store_nbr"]},
+    "weekly_canon": {"date_col": "week_start", "partition_by": ["year", "store_nbr"]},
+    "features": {"date_col": "date", "partition_by": ["year", "store_nbr"]},  # feature store (src/features/store.py)
+}
+SORT_KEY = ["store_nbr", "family"]  # legacy frames without series_id
+DICTIONARY_COLS = ["family"]  # stored dictionary-encoded, read back as category
+PARTITION_TYPES = {"year": pa.int16(), "store_nbr": pa.int16()}
+
+ROW_GROUP_ROWS = 1 << 16      # ~1 row group per (year, store) on the Favorita grid
+MIN_ROW_GROUP_ROWS = 1 << 12
+COMPRESSION = "zstd"
+# Non-dictionary encodings: float32 measures by byte plane (BYTE_STREAM_SPLIT, the
+# exponent bytes compress well), the row id / date columns as deltas (constant step
+# along a sorted series). Other columns keep the default dictionary encoding.
+DELTA_COLS = ["id", "date", "week_start"]
+META_FILE = "_layout.json"
+
+
+def _canon_name(path: Path) -> str:
+    return Path(path).name.replace(".parquet", "")
+
+
+def _with_schema(df: pd.DataFrame, path: Path) -> pd.DataFrame:
+    """df cast to the registry dtypes of the canon at `path` (unregistered names: as is)."""
+    name = _canon_name(path)
+    return apply_schema(df, name) if name in SCHEMAS else df
+
+
+def _layout_for(path: Path) -> dict:
+    name = _canon_name(path)
+    if name not in LAYOUTS:
+        raise ValueError(f"No partitioned layout registered for '{name}' (known: {list(LAYOUTS)})")
+    return LAYOUTS[name]
+
+
+def _file_options(schema: pa.Schema) -> ds.ParquetFileWriteOptions:
+    encodings = {}
+    for field in schema:
+        if field.name in DELTA_COLS and (pa.types.is_integer(field.type) or pa.types.is_timestamp(field.type)):
+            encodings[field.name] = "DELTA_BINARY_PACKED"
+        elif pa.types.is_float32(field.type):
+            encodings[field.name] = "BYTE_STREAM_SPLIT"
+    return ds.ParquetFileFormat().make_write_options(
+        compression=COMPRESSION,
+        use_dictionary=[f.name for f in schema if f.name not in encodings],
+        column_encoding=encodings,
+    )
+
+
+def _partitioning(layout: dict) -> ds.Partitioning:
+    fields = [(c, PARTITION_TYPES[c]) for c in layout["partition_by"]]
+    return ds.partitioning(pa.schema(fields), flavor="hive")
+
+
+def _sort_cols(columns, date_col: str) -> list[str]:
+    key = ["series_id"] if "series_id" in columns else SORT_KEY
+    return [c for c in key + [date_col] if c in columns]
+
+
+def _sort_order(df: pd.DataFrame, keys: list[str]) -> np.ndarray:
+    """Row order of a stable sort on `keys` (categoricals by code, i.e. category order)."""
+    arrays = []
+    for c in reversed(keys):  # lexsort: last key is the primary one
+        col = df[c]
+        arrays.append(col.cat.codes.to_numpy() if isinstance(col.dtype, pd.CategoricalDtype) else col.to_numpy())
+    return np.lexsort(arrays)
+
+
+def _prepare(df: pd.DataFrame, layout: dict):
+    """
+    Arrow tables of df in write order (+ their common schema), one per store: only one
+    store's rows are converted to Arrow at any point (bounded write memory), the big frame
+    itself is never sorted or copied. Within a table the row order is the layout's sort order.
+    """
+    date_col = layout["date_col"]
+    derived = [c for c in layout["partition_by"] if c not in df.columns]
+    overrides = {}
+    for c in DICTIONARY_COLS:
+        if c in df.columns and not isinstance(df[c].dtype, pd.CategoricalDtype):
+            overrides[c] = df[c].astype("category")
+
+    def chunk_frame(idx):
+        out = df.iloc[idx]
+        for c, col in overrides.items():
+            out = out.assign(**{c: col.iloc[idx].array})
+        if "year" in derived:
+            out = out.assign(year=out[date_col].dt.year.astype("int16"))
+        return out
+
+    sort_cols = _sort_cols(df.columns, date_col)
+    group_col = "store_nbr" if "store_nbr" in df.columns else None
+    order = _sort_order(df, ([group_col] if group_col else []) + sort_cols)
+
+    # Schema from the whole frame (object columns typed on all their values), then the
+    # per-chunk conversions are held to it
+    schema = pa.Schema.from_pandas(df, preserve_index=False)
+    for c, col in overrides.items():
+        dict_type = pa.Schema.from_pandas(pd.DataFrame({c: col.iloc[:0]}), preserve_index=False).field(c).type
+        schema = schema.set(schema.get_field_index(c), pa.field(c, dict_type))
+    if "year" in derived:
+        schema = schema.append(pa.field("year", pa.int16()))
+    for c in layout["partition_by"]:
+        schema = schema.set(schema.get_field_index(c), pa.field(c, PARTITION_TYPES[c]))
+
+    if group_col is not None and len(df):
+        keys = df[group_col].to_numpy()[order]
+        bounds = np.flatnonzero(keys[1:] != keys[:-1]) + 1
+        chunks = np.split(order, bounds)
+    else:
+        chunks = [order]
+
+    def tables():
+        for idx in chunks:
+            yield pa.Table.from_pandas(chunk_frame(idx), schema=schema, preserve_index=False)
+
+    return tables(), schema, derived
+
+
+def write_canon(
+    df: pd.DataFrame, path: Path, replace_partitions: bool = False, append: bool = False, part_prefix: str = "part"
+) -> None:
+    """
+    Writes a canonical fact frame as a partitioned, sorted, zstd-compressed parquet dataset.
+
+    replace_partitions=False rewrites the whole dataset.
+    replace_partitions=True only overwrites the partitions present in df (incremental refresh).
+    append=True adds files next to the existing ones (a date block of a partition already
+    written); part_prefix must then be unique per call. Each file stays sorted on its own.
+    Columns are stored with their registry dtype (see schema.py).
+    """
+    path = Path(path)
+    layout = _layout_for(path)
+    df = _with_schema(df, path)
+    tables, schema, derived = _prepare(df, layout)
+
+    if not (replace_partitions or append):
+        clear_canon(path)
+    # One write per store: its partition files are closed (row groups flushed) before the
+    # next store is converted, instead of every partition buffering until the end.
+    # Stores never share a partition, so "overwrite_or_ignore" cannot clobber another call.
+    behavior = "delete_matching" if replace_partitions and not append else "overwrite_or_ignore"
+    for table in tables:
+        ds.write_dataset(
+            table,
+            path,
+            format="parquet",
+            partitioning=_partitioning(layout),
+            file_options=_file_options(schema),
+            max_rows_per_group=ROW_GROUP_ROWS,
+            min_rows_per_group=MIN_ROW_GROUP_ROWS,
+            max_rows_per_file=1 << 22,
+            basename_template=f"{part_prefix}-{{i}}.parquet",
+            existing_data_behavior=behavior,
+        )
+        del table
+    pa.default_memory_pool().release_unused()
+    path.mkdir(parents=True, exist_ok=True)  # empty frame: still a (empty) dataset
+
+    meta = {
+        "columns": list(df.columns),
+        "derived": derived,
+        "partition_by": layout["partition_by"],
+        "sort_by": _sort_cols(df.columns, layout["date_col"]),
+    }
+    with open(path / META_FILE, "w") as f:
+        json.dump(meta, f, indent=2)
+
+
+def clear_canon(path: Path) -> None:
+    """Removes a canon dataset (directory or legacy single file) before a rebuild written in pieces."""
+    path = Path(path)
+    if path.is_dir():
+        shutil.rmtree(path)
+    elif path.exists():
+        path.unlink()
+
+
+def open_canon(path: Path) -> tuple[ds.Dataset, dict]:
+    """Returns the Arrow dataset + layout metadata. Works on legacy single files too."""
+    path = Path(path)
+    if path.is_dir():
+        meta_path = path / META_FILE
+        meta = json.loads(meta_path.read_text()) if meta_path.exists() else {}
+        layout = _layout_for(path)
+        dataset = ds.dataset(
+            path, format="parquet", partitioning=_partitioning(layout), exclude_invalid_files=True
+        )
+        meta.setdefault("date_col", layout["date_col"])
+        return dataset, meta
+    dataset = ds.dataset(path, format="parquet")
+    names = dataset.schema.names
+    return dataset, {
+        "columns": names,
+        "derived": [],
+        "partition_by": [],
+        "date_col": "week_start" if "week_start" in names else "date",
+    }
+
+
+def canon_filter(
+    meta: dict,
+    stores: list | None = None,
+    families: list | None = None,
+    start=None,
+    end=None,
+    series_ids: list | None = None,
+) -> ds.Expression | None:
+    date_col = meta["date_col"]
+    exprs = []
+    if series_ids is not None:
+        exprs.append(ds.field("series_id").isin([int(s) for s in series_ids]))
+    if stores is not None:
+        exprs.append(ds.field("store_nbr").isin([int(s) for s in stores]))
+    if families is not None:
+        exprs.append(ds.field("family").isin([str(f) for f in families]))
+    if start is not None:
+        start = pd.Timestamp(start)
+        exprs.append(ds.field(date_col) >= pa.scalar(start.to_datetime64()))
+        if "year" in meta.get("partition_by", []):
+            exprs.append(ds.field("year") >= start.year)
+    if end is not None:
+        end = pd.Timestamp(end)
+        exprs.append(ds.field(date_col) <= pa.scalar(end.to_datetime64()))
+        if "year" in meta.get("partition_by", []):
+            exprs.append(ds.field("year") <= end.year)
+    if not exprs:
+        return None
+    expr = exprs[0]
+    for e in exprs[1:]:
+        expr = expr & e
+    return expr
+
+
+def read_canon(
+    path: Path,
+    columns: list[str] | None = None,
+    stores: list | None = None,
+    families: list | None = None,
+    start=None,
+    end=None,
+    series_ids: list | None = None,
+) -> pd.DataFrame:
+    """
+    Reads daily_canon / weekly_canon with projection and predicate pushdown.
+
+    series_ids: integer series keys to keep (row-group prune, ids follow the sort order)
+    stores / families: values to keep (partition prune on store_nbr, row-group prune on family)
+    start / end: inclusive date bounds on the layout's date column (partition prune on year)
+    Rows come back sorted by (series_id, date), i.e. (store_nbr, family, date), with the
+    registry dtypes (files written before the registry are cast on read).
+    """
+    dataset, meta = open_canon(path)
+    all_cols = [c for c in meta.get("columns", dataset.schema.names) if c not in meta.get("derived", [])]
+    cols = all_cols if columns is None else [c for c in columns if c in all_cols]
+
+    table = dataset.to_table(columns=cols, filter=canon_filter(meta, stores, families, start, end, series_ids))
+    df = table.to_pandas()
+    sort_cols = _sort_cols(df.columns, meta["date_col"])
+    if sort_cols and len(df):
+        df = df.sort_values(sort_cols, kind="stable").reset_index(drop=True)
+    return _with_schema(df, path)
+
+
+def iter_canon_batches(path: Path, columns: list[str] | None = None, **predicates):
+    """Streams a canon dataset fragment by fragment (one partition file at a time)."""
+    dataset, meta = open_canon(path)
+    all_cols = [c for c in meta.get("columns", dataset.schema.names) if c not in meta.get("derived", [])]
+    cols = all_cols if columns is None else [c for c in columns if c in all_cols]
+    expr = canon_filter(meta, **predicates)
+    for fragment in dataset.get_fragments(filter=expr):
+        table = fragment.to_table(columns=cols, filter=expr, schema=dataset.schema)
+        if table.num_rows:
+            yield _with_schema(table.to_pandas(), path)
+
+
+def dataset_nbytes(path: Path) -> int:
+    """On-disk size of a dataset (all parquet files)."""
+    path = Path(path)
+    if path.is_file():
+        return path.stat().st_size
+    return sum(p.stat().st_size for p in path.rglob("*.parquet"))
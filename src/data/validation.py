@@ -1,13 +1,246 @@
 from __future__ import annotations
+import json
+from pathlib import Path
+import numpy as np
 import pandas as pd
 
+# Data-quality checks.
+# Keys are checked on integer codes, not by hashing rows: each key column is mapped to
+# int64 (day number for dates, the value for integers, a vocabulary index for labels),
+# the columns are combined into one int64 code (mixed radix) and sorted; duplicates are
+# equal neighbours, and the date steps between neighbours of the same series are the
+# gaps of the grid. TableProfile runs every check of a table in one pass over its
+# columns, batch by batch, and write_quality_report keeps the last profile of each table.
+
+PROMO_IQR_FENCE = 3.0  # promo outlier: onpromotion above Q3 + 3 IQR of the non-zero promos
+
+
 def require_columns(df: pd.DataFrame, cols: list[str], name: str) -> None:
     missing = [c for c in cols if c not in df.columns]
     if missing:
         raise ValueError(f"{name}: missing columns: {missing}")
 
 
+class _Vocab:
+    """Label -> int code, stable across batches (codes in order of first appearance)."""
+
+    def __init__(self):
+        self.labels = pd.Index([], dtype=object)
+
+    def _map(self, uniques) -> np.ndarray:
+        uniques = pd.Index(np.asarray(uniques, dtype=object))
+        new = uniques[~uniques.isin(self.labels)]
+        if len(new):
+            self.labels = self.labels.append(new)
+        return self.labels.get_indexer(uniques)
+
+    def codes(self, col: pd.Series) -> np.ndarray:
+        if isinstance(col.dtype, pd.CategoricalDtype):
+            local, uniques = col.cat.codes.to_numpy(), col.cat.categories
+        else:
+            local, uniques = pd.factorize(col, use_na_sentinel=True)
+        mapping = self._map(uniques)
+        return np.where(local >= 0, mapping[np.maximum(local, 0)], -1).astype(np.int64)
+
+
+def _column_codes(col: pd.Series, vocab: _Vocab, step: int = 1) -> tuple[np.ndarray, np.ndarray]:
+    """(int64 codes, null mask) of a key column. Dates are day numbers // step."""
+    if pd.api.types.is_datetime64_any_dtype(col.dtype):
+        values = col.to_numpy()
+        null = np.isnat(values)
+        return values.astype("datetime64[D]").astype(np.int64) // step, null
+    if pd.api.types.is_integer_dtype(col.dtype) and not col.hasnans:
+        return col.to_numpy(dtype=np.int64), np.zeros(len(col), dtype=bool)
+    codes = vocab.codes(col)
+    return codes, codes < 0
+
+
+def _sorted_keys(cols: list[np.ndarray]) -> tuple[np.ndarray, np.ndarray]:
+    """
+    Sorts rows on the key columns (last column = innermost key).
+    Returns (same_series, last): same_series[i] tells whether sorted rows i and i+1 share
+    every key but the last one, last is the sorted last column.
+    """
+    lows = [int(c.min()) for c in cols]
+    radix = [int(c.max()) - lo + 1 for c, lo in zip(cols, lows)]
+    if int(np.prod([float(r) for r in radix])) < 2 ** 62:
+        code = np.zeros(len(cols[0]), dtype=np.int64)
+        for c, lo, r in zip(cols, lows, radix):
+            code *= r
+            code += c - lo
+        if not (code[1:] >= code[:-1]).all():  # frames usually come sorted on their key
+            code.sort()
+        outer = code // radix[-1]
+        last = code - outer * radix[-1] + lows[-1]
+        return outer[1:] == outer[:-1], last
+    # Codes too wide for one int64: sort on the columns
+    order = np.lexsort(cols[::-1])
+    same = np.ones(max(len(order) - 1, 0), dtype=bool)
+    for c in cols[:-1]:
+        s = c[order]
+        same &= s[1:] == s[:-1]
+    return same, cols[-1][order]
+
+
+def duplicate_count(df: pd.DataFrame, key: list[str]) -> int:
+    """Rows repeating an earlier row on `key` (same count as df.duplicated(key).sum())."""
+    if len(df) < 2:
+        return 0
+    cols = []
+    for c in key:
+        codes, null = _column_codes(df[c], _Vocab())
+        if null.any():
+            # nulls compare equal to each other, like in df.duplicated
+            codes = np.where(null, codes[~null].min(initial=0) - 1, codes)
+        cols.append(codes)
+    same, last = _sorted_keys(cols)
+    return int(np.count_nonzero(same & (last[1:] == last[:-1])))
+
+
 def assert_unique_key(df: pd.DataFrame, key: list[str], name: str) -> None:
-    dup = df.duplicated(key).sum()
+    dup = duplicate_count(df, key)
     if dup != 0:
         raise ValueError(f"{name}: {dup} duplicated rows on key={key}")
+
+
+class TableProfile:
+    """
+    Data-quality profile of one table, accumulated over batches (update) and reported once
+    (summary). Checks run when their columns exist:
+    - null counts per column, negative sales
+    - duplicated keys (key), rows with a null key
+    - grid gaps: missing date steps inside each series' first..last date (date_col must be
+      in key; date_step=7 for weekly tables)
+    - store closures: store-days whose known sales are all zero
+    - promo outliers: onpromotion above Q3 + PROMO_IQR_FENCE * IQR of the non-zero promos
+    """
+
+    def __init__(self, name: str, key: list[str] | None = None, date_col: str | None = None, date_step: int = 1):
+        self.name = name
+        self.date_col = date_col
+        self.date_step = date_step
+        key = list(key or [])
+        # the date is the innermost key: sorted neighbours of a series are consecutive dates
+        if date_col in key:
+            key = [c for c in key if c != date_col] + [date_col]
+        self.key = key
+        self.rows = 0
+        self.nulls = {}
+        self.negative_sales = 0
+        self.null_keys = 0
+        self._vocab = {c: _Vocab() for c in key}
+        self._codes = {c: [] for c in key}
+        self._store_days = []
+        self._promo_hist = np.zeros(1, dtype=np.int64)
+
+    def update(self, df: pd.DataFrame) -> None:
+        self.rows += len(df)
+        for c, n in df.isna().sum().items():
+            self.nulls[c] = self.nulls.get(c, 0) + int(n)
+        if "sales" in df.columns:
+            sales = df["sales"].to_numpy(dtype=np.float64, na_value=np.nan)
+            self.negative_sales += int(np.count_nonzero(sales < 0))
+
+        if self.key and all(c in df.columns for c in self.key):
+            null = np.zeros(len(df), dtype=bool)
+            codes = {}
+            for c in self.key:
+                step = self.date_step if c == self.date_col else 1
+                codes[c], col_null = _column_codes(df[c], self._vocab[c], step)
+                null |= col_null
+            self.null_keys += int(null.sum())
+            for c in self.key:
+                self._codes[c].append(codes[c][~null])
+
+        if {"store_nbr", "date", "sales"}.issubset(df.columns):
+            known = df["sales"].notna().to_numpy()
+            if known.any():
+                self._store_days.append(
+                    df.loc[known, ["store_nbr", "date", "sales"]].groupby(["store_nbr", "date"], observed=True)["sales"].sum()
+                )
+
+        if "onpromotion" in df.columns:
+            promo = df["onpromotion"].to_numpy(dtype=np.float64, na_value=np.nan)
+            promo = promo[promo > 0].astype(np.int64)
+            if len(promo):
+                hist = np.bincount(promo)
+                if len(hist) > len(self._promo_hist):
+                    hist[:len(self._promo_hist)] += self._promo_hist
+                    self._promo_hist = hist
+                else:
+                    self._promo_hist[:len(hist)] += hist
+
+    def _key_checks(self) -> dict:
+        out = {"null_keys": self.null_keys}
+        cols = [np.concatenate(self._codes[c]) if self._codes[c] else np.zeros(0, np.int64) for c in self.key]
+        if len(cols[0]) < 2:
+            out["duplicate_keys"] = 0
+            if self.date_col in self.key:
+                out["grid_gaps"] = 0
+            return out
+        same, last = _sorted_keys(cols)
+        step = np.diff(last)
+        out["duplicate_keys"] = int(np.count_nonzero(same & (step == 0)))
+        if self.date_col in self.key:
+            out["series"] = int(np.count_nonzero(~same)) + 1
+            out["grid_gaps"] = int((step[same & (step > 1)] - 1).sum())
+        return out
+
+    def _promo_checks(self) -> dict:
+        hist = self._promo_hist
+        total = int(hist.sum())
+        if total == 0:
+            return {"promo_outliers": 0}
+        cum = np.cumsum(hist)
+        q1, q3 = (int(np.searchsorted(cum, q * total)) for q in (0.25, 0.75))
+        fence = q3 + PROMO_IQR_FENCE * (q3 - q1)
+        return {"promo_outliers": int(hist[int(fence) + 1:].sum()), "promo_fence": round(float(fence), 1)}
+
+    def summary(self) -> dict:
+        out = {"table": self.name, "rows": self.rows}
+        if self.rows:
+            rates = {c: round(n / self.rows, 6) for c, n in self.nulls.items() if n}
+            out["null_rate"] = rates
+        if "sales" in self.nulls:
+            out["negative_sales"] = self.negative_sales
+        if self.key:
+            out.update(self._key_checks())
+        if self._store_days:
+            per_day = pd.concat(self._store_days)
+            per_day = per_day.groupby(level=[0, 1], observed=True).sum()
+            out["store_closures"] = int((per_day == 0).sum())
+        if "onpromotion" in self.nulls:
+            out.update(self._promo_checks())
+        return out
+
+
+def profile_table(
+    df: pd.DataFrame, name: str, key: list[str] | None = None, date_col: str | None = None, date_step: int = 1
+) -> dict:
+    """Every data-quality check of one in-memory table (see TableProfile)."""
+    profile = TableProfile(name, key=key, date_col=date_col, date_step=date_step)
+    profile.update(df)
+    return profile.summary()
+
+
+def write_quality_report(path: Path, summaries: list[dict]) -> None:
+    """
+    Stores the table summaries in the JSON report at `path` (one entry per table, the last
+    profile of a table replaces the previous one) and prints them.
+    """
+    path = Path(path)
+    report = json.loads(path.read_text()) if path.exists() else {}
+    now = pd.Timestamp.now().isoformat(timespec="seconds")
+    for s in summaries:
+        report[s["table"]] = {**s, "profiled_at": now}
+    path.parent.mkdir(parents=True, exist_ok=True)
+    tmp = path.with_suffix(".tmp")
+    tmp.write_text(json.dumps(report, indent=2))
+    tmp.replace(path)
+
+    table = pd.DataFrame([{k: v for k, v in s.items() if k != "null_rate"} for s in summaries])
+    table["max_null_rate"] = [max(s.get("null_rate", {}).values(), default=0.0) for s in summaries]
+    print("Data quality:")
+    table = table.convert_dtypes().astype(object)
+    print(table.where(table.notna(), "-").to_string(index=False))
+    print(f"Saved: {path}")
@@ -1,105 +1,189 @@
+import time
 import pandas as pd
 import numpy as np
 from sklearn.base import BaseEstimator, TransformerMixin
+from src.features.panel import PanelFeatureEngine
+from src.data.calendar_features import calendar_table, day_numbers
+from src.data.schema import apply_schema
+
+
+class Feature:
+    """
+    One engineered column: func(cols) -> array, where cols maps each name of `inputs`
+    (columns of X, as Series) and `deps` (other features, as arrays) to its values.
+    Names starting with "_" are intermediates shared by several features, not returned.
+    """
+    def __init__(self, name, func, inputs=(), deps=()):
+        self.name = name
+        self.func = func
+        self.inputs = list(inputs)
+        self.deps = list(deps)
+
+
+def _days(cols):
+    return day_numbers(cols['date'])
+
+
+def _calendar(col):
+    # Date-derived columns are computed once per distinct date and broadcast by day offset
+    # (see calendar_features; int8 flags, see the 'features' schema in src/data/schema.py)
+    def func(cols):
+        days = cols['_days']
+        first, last = (days.min(), days.max()) if len(days) else (0, 0)
+        epoch = np.datetime64(0, 'D')
+        return calendar_table(epoch + first, epoch + last)[col].to_numpy()[days - first]
+    return func
+
+
+# --- 1. Calendar & Payday Features (The 'Quincena') ---
+# Payday is usually 15th and End of Month. Research showed Peak on 15th and 30/31.
+# [PILLAR 1] Payday Distance: days until next payday (15th, then ~30th).
+# If today is 16, target is 30 -> 14 days. If today is 14, target is 15 -> 1 day.
+
+# --- 2. Store Cluster Interactions (The 'Weekend Explosion') ---
+# Research found Clusters 14, 5, 11 explode on weekends
+# For Tree models, it's better to keep them separate categorical or manual interaction:
+# we create a specific flag for High-Weekend-Lift Clusters
+HIGH_LIFT_CLUSTERS = [14, 5, 11]
+
+
+def _weekend_high_lift(cols):
+    return (cols['cluster'].isin(HIGH_LIFT_CLUSTERS) & (cols['is_weekend'] == 1)).to_numpy().astype('int8')
+
+
+# --- 3. Lag Features (Autoregression) ---
+# Lags, rolling windows, EWMs and last-year values are generated BEFORE this step by
+# create_lags, on the dense series x day panel (src/features/panel.py): no sort or
+# groupby, any number of windows at the cost of a few array passes each.
+# This transformer only adds row-level features.
+
+# --- 4. Oil Trend (Macro) ---
+# Moving average of Oil to capture Trend vs Noise: 7 days over the dates (one oil price
+# per date), broadcast back to the rows.
+def _oil_ma_7(cols):
+    days = cols['_days']
+    first = days.min() if len(days) else 0
+    offset = days - first
+    per_day = np.full(int(offset.max()) + 1 if len(offset) else 0, np.nan)
+    per_day[offset] = cols['dcoilwtico'].to_numpy(dtype=np.float64, na_value=np.nan)
+    ma = pd.Series(per_day).rolling(window=7, min_periods=1).mean().to_numpy(dtype=np.float32)
+    return ma[offset]
+
+
+# --- 5. The Earthquake (Structural Break) ---
+# [PILLAR 3] Structural Break variable
+# Earthquake happened April 16, 2016. We flag the "Crisis Period" to isolate this behavior
+# (EARTHQUAKE_START / EARTHQUAKE_END in calendar_features: 2016-04-16 -> 2016-05-31, approx 1.5 months shock).
+# Even stronger: interaction for affected zones, Manabi was epicenter.
+def _earthquake_manabi(cols):
+    return ((cols['is_earthquake_period'] == 1) & (cols['state'] == 'Manabi').to_numpy()).astype('int8')
+
+
+FEATURE_PLAN = [
+    Feature('_days', _days, inputs=['date']),
+    Feature('day', _calendar('day'), deps=['_days']),
+    Feature('is_payday_15', _calendar('is_payday_15'), deps=['_days']),
+    Feature('is_month_end', _calendar('is_month_end'), deps=['_days']),
+    Feature('days_to_payday', _calendar('days_to_payday'), deps=['_days']),
+    Feature('is_weekend_high_lift', _weekend_high_lift, inputs=['cluster', 'is_weekend']),
+    Feature('oil_ma_7', _oil_ma_7, inputs=['dcoilwtico'], deps=['_days']),
+    Feature('is_earthquake_period', _calendar('is_earthquake_period'), deps=['_days']),
+    Feature('is_earthquake_manabi', _earthquake_manabi, inputs=['state'], deps=['is_earthquake_period']),
+]
+
+
+def resolve_plan(features=None, columns=None, plan=FEATURE_PLAN):
+    """
+    Features to compute, in dependency order, for the requested names (None = all).
+    Requested features whose input columns are missing raise; with features=None they
+    are skipped (with everything depending on them).
+    """
+    by_name = {f.name: f for f in plan}
+    unknown = [n for n in (features or []) if n not in by_name]
+    if unknown:
+        raise ValueError(f"Unknown features {unknown} (known: {list(by_name)})")
+    columns = None if columns is None else set(columns)
+
+    order, state = [], {}
+
+    def visit(name, required):
+        if state.get(name) == 'done':
+            return True
+        if state.get(name) == 'visiting':
+            raise ValueError(f"Dependency cycle through feature '{name}'")
+        state[name] = 'visiting'
+        f = by_name[name]
+        missing = [] if columns is None else [c for c in f.inputs if c not in columns]
+        ok = not missing and all(visit(d, required) for d in f.deps)
+        if not ok:
+            if required:
+                raise ValueError(f"Feature '{name}' needs missing columns {missing or '(via its deps)'}")
+            state[name] = 'skipped'
+            return False
+        state[name] = 'done'
+        order.append(f)
+        return True
+
+    for name in (features if features is not None else [n for n in by_name if not n.startswith('_')]):
+        if state.get(name) != 'skipped':
+            visit(name, required=features is not None)
+    return order
+
 
 class RetailFeatureEngineer(BaseEstimator, TransformerMixin):
     """
     Robust Feature Engineering for Ecuadorean Retail Demand.
     Implements research findings: Payday Effect, Store Clustering, and Lags.
+
+    Features are declared in FEATURE_PLAN (name, input columns, dependencies).
+    features: names to compute (None = every feature whose inputs are present); their
+    dependencies are computed too. Only the input columns of the plan are read.
+    Per-feature timings are kept in timings_ (printed with verbose=True).
     """
-    def __init__(self, include_lags=True):
+    def __init__(self, include_lags=True, features=None, verbose=False):
         self.include_lags = include_lags
+        self.features = features
+        self.verbose = verbose
         
     def fit(self, X, y=None):
         return self
 
     def transform(self, X):
         """
-        X should be the 'daily_canon' dataframe sorted by store, family, date.
+        X should be the 'daily_canon' dataframe (one row per series and date).
+        Returns X with the planned features added (X itself is not copied or modified).
         """
-        df = X.copy()
-        
-        # --- 1. Calendar & Payday Features (The 'Quincena') ---
-        # Payday is usually 15th and End of Month
-        df['day'] = df['date'].dt.day
-        
-        # Distance to 15th (e.g. on 14th dist is 1, on 16th dist is 1)
-        # We want a countdown or specific flag. 
-        # Research showed Peak on 15th and 30/31.
-        df['is_payday_15'] = (df['day'] == 15).astype(int)
-        df['is_month_end'] = df['date'].dt.is_month_end.astype(int)
-        
-        # [PILLAR 1] Payday Distance (Explicit Request)
-        # Calculate days until next payday (15th or End of Month)
-        # Setup targets: 15th and End
-        # Heuristic: Min distance to 15 or 30 (approx)
-        df['days_to_payday'] = df['day'].apply(lambda x: 15 - x if x < 15 else (30 - x if x < 30 else 0))
-        # Keep only positive distance or abs? Usually "days until".
-        # If today is 16, target is 30 -> 14 days. If today is 14, target is 15 -> 1 day.
-        
-        # --- 2. Store Cluster Interactions (The 'Weekend Explosion') ---
-        # Research found Clusters 14, 5, 11 explode on weekends
-        # We assume 'cluster' and 'is_weekend' columns exist from daily_canon
-        if 'cluster' in df.columns and 'is_weekend' in df.columns:
-            # Interaction Feature: Cluster ID * Is_Weekend
-            # For Tree models, it's better to keep them separate categorical or manual interaction
-            # We'll create a specific flag for High-Weekend-Lift Clusters
-            high_lift_clusters = [14, 5, 11]
-            df['is_weekend_high_lift'] = (df['cluster'].isin(high_lift_clusters) & (df['is_weekend'] == 1)).astype(int)
-
-        # --- 3. Lag Features (Autoregression) ---
-        # Crucial for time series. We lag SALES.
-        # NOTE: This requires Dataframe to be sorted and grouped properly.
-        # We assume input is already prepared or we do simple shifts if single series (dangerous).
-        # In a real pipeline, we use a custom LagTransformer specifically handles grouping.
-        # Here we define the logic but rely on external loop or highly optimized groupby for speed.
-        
-        # For simplicity in this transformer, we act on row-level features.
-        # Complex lag generation usually happens BEFORE this step in the pipeline 
-        # to avoid slow groupby-apply inside transform().
-        
-        # --- 4. Oil Trend (Macro) ---
-        # Moving average of Oil to capture Trend vs Noise
-        # Assuming data is daily contiguous
-            df['oil_ma_7'] = df['dcoilwtico'].rolling(window=7, min_periods=1).mean()
-
-        # --- 5. The Earthquake (Structural Break) ---
-        # [PILLAR 3] Structural Break variable
-        # Earthquake happened April 16, 2016. Impact lasted ~X weeks.
-        # We flag the "Crisis Period" to isolate this behavior.
-        crisis_start = pd.Timestamp('2016-04-16')
-        crisis_end = pd.Timestamp('2016-05-31') # Approx 1.5 months shock
-        
-        # Global shock flag (or specific to Manabi if state column exists)
-        df['is_earthquake_period'] = ((df['date'] >= crisis_start) & (df['date'] <= crisis_end)).astype(int)
-        
-        if 'state' in df.columns:
-             # Even stronger: Interaction for affected zones
-             # Manabi was epicenter.
-             df['is_earthquake_manabi'] = (df['is_earthquake_period'] & (df['state'] == 'Manabi')).astype(int)
-            
-        return df
-
-def create_lags(df, target_col='sales', lags=[7, 14, 28, 365]):
+        plan = resolve_plan(self.features, X.columns)
+        cols = {}
+        new = {}
+        timings = []
+        for f in plan:
+            for c in f.inputs:
+                cols.setdefault(c, X[c])
+            t0 = time.perf_counter()
+            cols[f.name] = np.asarray(f.func(cols))
+            if not f.name.startswith('_'):
+                new[f.name] = cols[f.name]
+            timings.append({'feature': f.name, 'seconds': time.perf_counter() - t0})
+        self.timings_ = pd.DataFrame(timings, columns=['feature', 'seconds'])
+        if self.verbose:
+            print(self.timings_.to_string(index=False))
+
+        df = X.drop(columns=[c for c in new if c in X.columns])
+        df = pd.concat([df, pd.DataFrame(new, index=X.index)], axis=1)
+        return apply_schema(df, 'features')
+
+def create_lags(df, target_col='sales', lags=[7, 14, 28, 365], **panel_features):
     """
-    Optimized Lag Generation.
-    Assumes df is MultiIndex [store, family, date] or sorted.
-    This creates huge memory pressure if not careful.
-    
-    We shift by 'group_id' (store_family).
+    Lag Generation on the dense series x day panel (see src/features/panel.py).
+    Lags are in days; rows keep their order (no sort, no groupby shift), the lag columns
+    come from one float32 block.
+
+    panel_features: extra PanelFeatureEngine options (windows, stats, ewm_alphas,
+    last_year, shift) for rolling / EWM / last-year features of the same target.
     """
-    # Create temporal features
-    df = df.copy()
-    
-    # We essentially need fast GroupBy Shift.
-    # Polars is better for this, but in Pandas:
-    # Ensure sorted
-    df = df.sort_values(by=['store_nbr', 'family', 'date'])
-    
-    group_cols = ['store_nbr', 'family']
-    
-    for lag in lags:
-        # Grouped Shift
-        df[f'sales_lag_{lag}'] = df.groupby(group_cols)[target_col].shift(lag)
-        
-    return df
+    engine = PanelFeatureEngine(target_col=target_col, lags=lags, **panel_features)
+    features = engine.transform(df)
+    df = df.drop(columns=[c for c in features.columns if c in df.columns])
+    df = pd.concat([df, features], axis=1)
+    return apply_schema(df, 'features')
@@ -0,0 +1,206 @@
+from __future__ import annotations
+import numpy as np
+import pandas as pd
+from src.data.keys import series_key
+from src.data.calendar_features import day_numbers
+
+# Panel feature engine.
+# The target is laid out once as a dense (series x day) float32 matrix (one row per
+# series, NaN where a day has no row), every feature is a strided operation along the
+# time axis of that matrix, and results are written column by column into one
+# preallocated float32 block aligned with the input rows. No sort, no groupby: a lag is
+# a shifted slice, rolling sums come from cumulative sums, rolling min/max from
+# block-wise prefix/suffix extrema (van Herk / Gil-Werman), EWMs from one recursion over
+# days run on all series at once.
+
+ROLLING_STATS = ("mean", "std", "min", "max")
+LAST_YEAR_LAG = 364  # same weekday, 52 weeks earlier
+
+
+def _lag(m: np.ndarray, k: int, out: np.ndarray) -> None:
+    k = min(k, m.shape[1])
+    out[:, :k] = np.nan
+    out[:, k:] = m[:, :m.shape[1] - k] if k else m
+
+
+class _RunningSums:
+    """
+    Cumulative sums along days of the series-centred values (and squares) and of the
+    non-NaN counts, computed once; any trailing window is then a difference of two columns.
+    Centring each series keeps the sum of squares small (no cancellation in the variance).
+    """
+
+    def __init__(self, m: np.ndarray, squares: bool):
+        m = m.astype(np.float64)
+        valid = ~np.isnan(m)
+        with np.errstate(invalid="ignore"):
+            self.center = np.nanmean(np.where(valid.any(axis=1, keepdims=True), m, 0.0), axis=1, keepdims=True)
+        x = np.where(valid, m - self.center, 0.0)
+        self.values = np.cumsum(x, axis=1)
+        self.squares = np.cumsum(x * x, axis=1) if squares else None
+        self.count = np.cumsum(valid, axis=1, dtype=np.int32)
+
+    @staticmethod
+    def window(cs: np.ndarray, w: int) -> np.ndarray:
+        out = cs.copy()
+        out[:, w:] -= cs[:, :-w]
+        return out
+
+
+def _rolling_extreme(m: np.ndarray, w: int, op) -> np.ndarray:
+    """Trailing-window max (op=np.fmax) / min (op=np.fmin) skipping NaNs, O(1) per cell."""
+    n_series, n_days = m.shape
+    n_blocks = -(-n_days // w)
+    padded = np.full((n_series, n_blocks * w), np.nan, dtype=m.dtype)
+    padded[:, :n_days] = m
+    blocks = padded.reshape(n_series, n_blocks, w)
+    prefix = op.accumulate(blocks, axis=2).reshape(n_series, -1)
+    suffix = op.accumulate(blocks[:, :, ::-1], axis=2)[:, :, ::-1].reshape(n_series, -1)
+    # window [t-w+1, t] = suffix of its first block part + prefix of its last block part
+    out = prefix[:, :n_days].copy()
+    if w <= n_days:
+        out[:, w - 1:] = op(suffix[:, :n_days - w + 1], prefix[:, w - 1:n_days])
+    return out
+
+
+def _ewm(m: np.ndarray, alpha: float) -> np.ndarray:
+    """pandas ewm(alpha, adjust=True, ignore_na=False).mean() along days, all series at once."""
+    decay = 1.0 - alpha
+    num = np.zeros(m.shape[0], dtype=np.float64)
+    den = np.zeros(m.shape[0], dtype=np.float64)
+    out = np.empty(m.shape, dtype=np.float64)
+    for t in range(m.shape[1]):
+        x = m[:, t]
+        seen = ~np.isnan(x)
+        num *= decay
+        den *= decay
+        num[seen] += x[seen]
+        den[seen] += 1.0
+        with np.errstate(invalid="ignore", divide="ignore"):
+            out[:, t] = num / den
+    return out
+
+
+class PanelFeatureEngine:
+    """
+    Lags, rolling mean/std/min/max, EWMs and same-day-last-year values of one target,
+    computed on the dense series x day matrix.
+
+    lags: days to shift the target by -> "{target}_lag_{k}"
+    windows: trailing windows (days) of the target lagged by `shift`
+        -> "{target}_roll_{stat}_{w}" for stat in stats (a full window is required, like
+        pandas rolling(w) with the default min_periods)
+    ewm_alphas: smoothing factors of EWMs of the target lagged by `shift` -> "{target}_ewm_{alpha}"
+    last_year: same weekday 52 weeks before -> "{target}_last_year"
+    shift: lag applied before the windows / EWMs, so they only see values known `shift`
+        days ahead (7 = the shortest default lag).
+    """
+
+    def __init__(
+        self,
+        target_col: str = "sales",
+        lags=(),
+        windows=(),
+        stats=ROLLING_STATS,
+        ewm_alphas=(),
+        last_year: bool = False,
+        shift: int = 7,
+        date_col: str = "date",
+    ):
+        unknown = [s for s in stats if s not in ROLLING_STATS]
+        if unknown:
+            raise ValueError(f"Unknown rolling stats {unknown} (known: {list(ROLLING_STATS)})")
+        self.target_col = target_col
+        self.lags = [int(k) for k in lags]
+        self.windows = [int(w) for w in windows]
+        self.stats = list(stats)
+        self.ewm_alphas = [float(a) for a in ewm_alphas]
+        self.last_year = last_year
+        self.shift = int(shift)
+        self.date_col = date_col
+
+    def feature_names(self) -> list[str]:
+        t = self.target_col
+        names = [f"{t}_lag_{k}" for k in self.lags]
+        names += [f"{t}_roll_{s}_{w}" for w in self.windows for s in self.stats]
+        names += [f"{t}_ewm_{a:g}" for a in self.ewm_alphas]
+        if self.last_year:
+            names.append(f"{t}_last_year")
+        return names
+
+    def _panel(self, df: pd.DataFrame) -> tuple[np.ndarray, np.ndarray | None]:
+        """(series x day) float32 matrix of the target, and the flat cell of each row (None: rows are the grid)."""
+        keys = series_key(df)
+        if len(keys) == 1:
+            series, _ = pd.factorize(df[keys[0]])
+        else:
+            series = np.zeros(len(df), dtype=np.int64)
+            for c in keys:
+                codes, uniques = pd.factorize(df[c])
+                series = series * len(uniques) + codes
+            series, _ = pd.factorize(series)
+        days = day_numbers(df[self.date_col])
+        first = days.min() if len(days) else 0
+        n_series = int(series.max()) + 1 if len(series) else 0
+        n_days = int(days.max() - first) + 1 if len(days) else 0
+        cell = series.astype(np.int64) * n_days + (days - first)
+
+        values = df[self.target_col].to_numpy(dtype=np.float32, na_value=np.nan)
+        if len(cell) == n_series * n_days and (cell == np.arange(len(cell))).all():
+            return values.reshape(n_series, n_days), None  # rows already are the grid, series-major
+        m = np.full(n_series * n_days, np.nan, dtype=np.float32)
+        m[cell] = values
+        return m.reshape(n_series, n_days), cell
+
+    def transform(self, df: pd.DataFrame, out: np.ndarray | None = None) -> pd.DataFrame:
+        """
+        Feature frame aligned with df's rows (same index), all columns float32.
+        out: preallocated (len(df), n_features) float32 block to fill (e.g. a np.memmap);
+        a Fortran-ordered one (each feature contiguous) avoids strided writes.
+        """
+        names = self.feature_names()
+        if out is None:
+            out = np.empty((len(df), len(names)), dtype=np.float32, order="F")
+        if out.shape != (len(df), len(names)) or out.dtype != np.float32:
+            raise ValueError(f"out must be a float32 array of shape {(len(df), len(names))}")
+        if not len(df) or not names:
+            return pd.DataFrame(out, index=df.index, columns=names)
+
+        m, cell = self._panel(df)
+        col = iter(range(len(names)))
+
+        def put(values: np.ndarray) -> None:
+            j = next(col)
+            out[:, j] = values.reshape(-1) if cell is None else values.reshape(-1)[cell]
+
+        tmp = np.empty_like(m)
+        for k in self.lags:
+            _lag(m, k, tmp)
+            put(tmp)
+
+        if self.windows or self.ewm_alphas:
+            base = np.empty_like(m)
+            _lag(m, self.shift, base)
+            sums = _RunningSums(base, squares="std" in self.stats)
+            for w in self.windows:
+                count = sums.window(sums.count, w)
+                full = count >= w
+                if "mean" in self.stats or "std" in self.stats:
+                    total = sums.window(sums.values, w)
+                for stat in self.stats:
+                    with np.errstate(invalid="ignore", divide="ignore"):
+                        if stat == "mean":
+                            values = total / count + sums.center
+                        elif stat == "std":
+                            squares = sums.window(sums.squares, w)
+                            values = np.sqrt(np.maximum((squares - total * total / count) / (count - 1), 0.0))
+                        else:
+                            values = _rolling_extreme(base, w, np.fmax if stat == "max" else np.fmin)
+                    put(np.where(full, values, np.nan))
+            for a in self.ewm_alphas:
+                put(_ewm(base, a))
+
+        if self.last_year:
+            _lag(m, LAST_YEAR_LAG, tmp)
+            put(tmp)
+        return pd.DataFrame(out, index=df.index, columns=names, copy=False)
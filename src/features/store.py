@@ -0,0 +1,188 @@
+from __future__ import annotations
+import hashlib
+import json
+from pathlib import Path
+import numpy as np
+import pandas as pd
+from src.data.incremental import file_fingerprint, prefix_fingerprint, replace_tail
+from src.data.storage import clear_canon, open_canon, read_canon, write_canon
+from src.features.features import RetailFeatureEngineer, create_lags
+from src.features.panel import LAST_YEAR_LAG
+
+# Feature store.
+# The output of create_lags + RetailFeatureEngineer on daily_canon is materialized as a
+# partitioned dataset (same layout as the canon facts, see storage.LAYOUTS["features"])
+# under data/features/<plan hash>/. The plan hash covers the feature definitions (options
+# + source of the feature code); the data version is a prefix fingerprint of daily_canon
+# up to the last day with known sales ("stable date") plus one of all of it. Rows after
+# the stable date (test days, sales unknown) are provisional and recomputed when new dates
+# arrive or their inputs are restated; rows up to it are kept.
+# Builds and refreshes run a few stores at a time: a store group is a set of complete
+# series, so its lags / rolling windows are the same as on the full grid, and only one
+# group's feature frame is in memory at any point.
+
+FEATURE_STORE_DIR = Path("data/features")
+DAILY_CANON_PATH = Path("data/processed/daily_canon.parquet")
+FEATURE_CODE = [Path(__file__).resolve().parent / f for f in ("features.py", "panel.py", "store.py")] + [
+    Path(__file__).resolve().parent.parent / "data" / f for f in ("calendar_features.py", "schema.py")
+]
+FINGERPRINT_COLS = ["sales", "onpromotion", "dcoilwtico", "transactions"]
+META_FILE = "_meta.json"
+OIL_MA_LOOKBACK = 6  # oil_ma_7 reads the 6 previous dates
+STORES_PER_BATCH = 6
+
+
+def feature_plan(lags=(7, 14, 28, 365), panel_features: dict | None = None, features: list | None = None) -> tuple[str, dict]:
+    """(hash, plan) of a feature configuration: its options and the source of the feature code."""
+    plan = {
+        "lags": [int(k) for k in lags],
+        "panel_features": dict(panel_features or {}),
+        "features": None if features is None else list(features),
+        "code": {p.name: file_fingerprint(p) for p in FEATURE_CODE},
+    }
+    digest = hashlib.sha256(json.dumps(plan, sort_keys=True, default=str).encode()).hexdigest()[:16]
+    return digest, plan
+
+
+def _lookback_days(plan: dict) -> int | None:
+    """History a new date's features depend on (None: all of it, EWMs never forget)."""
+    panel = plan["panel_features"]
+    if panel.get("ewm_alphas"):
+        return None
+    days = [OIL_MA_LOOKBACK] + plan["lags"]
+    if panel.get("windows"):
+        days.append(int(panel.get("shift", 7)) + max(panel["windows"]))
+    if panel.get("last_year"):
+        days.append(LAST_YEAR_LAG)
+    return max(days)
+
+
+def build_features(df: pd.DataFrame, plan: dict, verbose: bool = False) -> pd.DataFrame:
+    """create_lags + RetailFeatureEngineer with the options of `plan`."""
+    out = create_lags(df, lags=plan["lags"], **plan["panel_features"])
+    return RetailFeatureEngineer(features=plan["features"], verbose=verbose).transform(out)
+
+
+def store_batches(path: Path = DAILY_CANON_PATH, stores_per_batch: int = STORES_PER_BATCH) -> list[list[int]]:
+    """Groups of store_nbr of a store-partitioned dataset, read one group at a time (partition prune on store)."""
+    dataset, _ = open_canon(path)
+    stores = np.unique(dataset.to_table(columns=["store_nbr"]).column("store_nbr").to_numpy())
+    n_batches = max(1, -(-len(stores) // max(1, stores_per_batch)))
+    return [[int(s) for s in group] for group in np.array_split(stores, n_batches) if len(group)]
+
+
+def _group_features(daily_path: Path, plan: dict, stores_per_batch: int, start=None, verbose: bool = False):
+    """Yields (stores, features) of daily_canon store group by store group (dates from start)."""
+    for stores in store_batches(daily_path, stores_per_batch):
+        df = read_canon(daily_path, stores=stores, start=start)
+        if len(df):
+            yield stores, build_features(df, plan, verbose=verbose)
+
+
+def _history(keys: pd.DataFrame, upto: pd.Timestamp) -> dict:
+    return prefix_fingerprint(keys, upto, [c for c in FINGERPRINT_COLS if c in keys.columns])
+
+
+def _data_version(keys: pd.DataFrame) -> dict:
+    known = keys.loc[keys["sales"].notna(), "date"]
+    stable = known.max() if len(known) else keys["date"].min()
+    end = keys["date"].max()
+    return {
+        "start_date": str(keys["date"].min().date()),
+        "end_date": str(end.date()),
+        "stable_date": str(stable.date()),
+        # appendability check: the history up to the stable date
+        "history": _history(keys, stable),
+        # up-to-date check: every row, provisional ones included (their onpromotion /
+        # dcoilwtico can be restated without the date range moving)
+        "full": _history(keys, end),
+    }
+
+
+def _read_meta(store_path: Path) -> dict | None:
+    path = store_path.parent / META_FILE
+    if not (path.exists() and store_path.is_dir()):
+        return None
+    return json.loads(path.read_text())
+
+
+def _write_meta(store_path: Path, meta: dict) -> None:
+    path = store_path.parent / META_FILE
+    tmp = path.with_suffix(".tmp")
+    tmp.write_text(json.dumps(meta, indent=2, default=str))
+    tmp.replace(path)
+
+
+def refresh_features(
+    lags=(7, 14, 28, 365),
+    panel_features: dict | None = None,
+    features: list | None = None,
+    daily_path: Path = DAILY_CANON_PATH,
+    store_dir: Path = FEATURE_STORE_DIR,
+    verbose: bool = False,
+    stores_per_batch: int = STORES_PER_BATCH,
+) -> Path:
+    """
+    Brings the store of this feature plan up to date with daily_canon and returns its path
+    (features computed stores_per_batch stores at a time).
+    - same data version (all rows, provisional ones included): nothing is computed
+    - history unchanged up to the stored stable date, new or restated dates after it: only
+      the rows after the stable date are computed (from the lookback window of history they need)
+      and replace the provisional tail
+    - anything else (new plan, restated history): full build
+    """
+    plan_id, plan = feature_plan(lags, panel_features, features)
+    store_path = Path(store_dir) / plan_id / "features.parquet"
+    store_path.parent.mkdir(parents=True, exist_ok=True)
+    keys = read_canon(daily_path, columns=["date"] + FINGERPRINT_COLS)
+    version = _data_version(keys)
+    meta = _read_meta(store_path)
+
+    if meta is not None and meta["data"] == version:
+        print(f"Feature store {plan_id}: up to date ({version['end_date']})")
+        return store_path
+
+    old = None if meta is None else meta["data"]
+    appendable = (
+        old is not None
+        and old["start_date"] == version["start_date"]
+        and _history(keys, pd.Timestamp(old["stable_date"])) == old["history"]
+    )
+    del keys
+    if appendable:
+        boundary = pd.Timestamp(old["stable_date"]) + pd.Timedelta(days=1)
+        lookback = _lookback_days(plan)
+        start = None if lookback is None else boundary - pd.Timedelta(days=lookback)
+        print(f"Feature store {plan_id}: appending from {boundary.date()} (lookback {lookback or 'all'} days)")
+        for stores, df in _group_features(daily_path, plan, stores_per_batch, start, verbose):
+            new = df[df["date"] >= boundary].reset_index(drop=True)
+            del df
+            replace_tail(store_path, new, boundary, stores=stores)
+    else:
+        print(f"Feature store {plan_id}: full build")
+        clear_canon(store_path)
+        for i, (_, df) in enumerate(_group_features(daily_path, plan, stores_per_batch, verbose=verbose)):
+            write_canon(df, store_path, append=True, part_prefix=f"part-g{i}")
+            del df
+
+    _write_meta(store_path, {"plan_id": plan_id, "plan": plan, "data": version})
+    return store_path
+
+
+def load_features(
+    lags=(7, 14, 28, 365),
+    panel_features: dict | None = None,
+    features: list | None = None,
+    columns: list[str] | None = None,
+    daily_path: Path = DAILY_CANON_PATH,
+    store_dir: Path = FEATURE_STORE_DIR,
+    verbose: bool = False,
+    **predicates,
+) -> pd.DataFrame:
+    """
+    Features of daily_canon for this plan, from the store (refreshed first if the data or
+    the feature code changed). columns / predicates (stores, families, start, end,
+    series_ids) are pushed down to the stored dataset like in read_canon.
+    """
+    store_path = refresh_features(lags, panel_features, features, daily_path, store_dir, verbose)
+    return read_canon(store_path, columns=columns, **predicates)
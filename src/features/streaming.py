@@ -0,0 +1,198 @@
+from __future__ import annotations
+import json
+from pathlib import Path
+import pandas as pd
+import pyarrow as pa
+import pyarrow.compute as pc
+from src.data.storage import open_canon, read_canon
+from src.features.store import DAILY_CANON_PATH, FEATURE_STORE_DIR, STORES_PER_BATCH, refresh_features, store_batches
+
+# Streaming training data.
+# The challenger model does not need the full feature frame in memory: the feature store
+# (src/features/store.py, refreshed first, so features are only recomputed when the data
+# or the feature code changed) is read a few stores at a time, its store_nbr partitions
+# pruned, and each batch is filtered, stripped of its non-feature columns and encoded for
+# CatBoost on its own. Batches are appended to tab-separated files next to a CatBoost
+# column description, which CatBoost quantizes from disk (catboost.utils.quantize parses
+# the file into its own float columns, never a pandas frame). Only the quantized pools
+# (one byte per feature value) are kept after that; both training and the validation
+# predictions run on them.
+# Block quantization has no categorical support, so the categoricals are written as
+# integer codes (text labels coded on their sorted labels over the whole dataset, the same
+# in every batch) and quantized like numeric features: with fewer codes than border_count,
+# every code keeps its own bin.
+
+POOL_DIR = Path("data/pools")
+TARGET = "sales"
+# Not features: target, keys covered by store_nbr / family_id, columns unknown at forecast time
+NON_FEATURES = ["sales", "date", "id", "set", "transactions", "transactions_missing", "family", "series_id"]
+CAT_FEATURES = ["store_nbr", "family_id", "city", "state", "type", "cluster"]  # written as integer codes
+COLUMN_DESCRIPTION = "pool.cd"
+POOL_FILES = {"train": "train.tsv", "val": "val.tsv"}
+META_FILE = "_pool.json"
+
+
+def iter_feature_batches(
+    lags=(7, 14, 28, 365),
+    panel_features: dict | None = None,
+    features: list | None = None,
+    daily_path: Path = DAILY_CANON_PATH,
+    stores_per_batch: int = STORES_PER_BATCH,
+    verbose: bool = False,
+    store_dir: Path = FEATURE_STORE_DIR,
+    **predicates,
+):
+    """
+    Yields the feature frame of daily_canon store group by store group, read from the
+    feature store of this plan (brought up to date first). predicates (families, start,
+    end, columns) are pushed down to the stored features, computed on the full history.
+    """
+    store_path = refresh_features(lags, panel_features, features, daily_path, store_dir, verbose, stores_per_batch)
+    for stores in store_batches(store_path, stores_per_batch):
+        df = read_canon(store_path, stores=stores, **predicates)
+        if len(df):
+            yield df
+
+
+def category_labels(path: Path = DAILY_CANON_PATH, columns: list[str] = CAT_FEATURES) -> dict[str, list[str]]:
+    """Sorted labels of the text columns among `columns` over a whole dataset, scanned batch by batch."""
+    dataset, _ = open_canon(path)
+    out = {}
+    for c in columns:
+        if c not in dataset.schema.names:
+            continue
+        field = dataset.schema.field(c).type
+        if pa.types.is_integer(field) or (pa.types.is_dictionary(field) and pa.types.is_integer(field.value_type)):
+            continue
+        labels = set()
+        for batch in dataset.to_batches(columns=[c]):
+            labels.update(v for v in pc.unique(batch.column(0)).to_pylist() if v is not None)
+        out[c] = sorted(str(v) for v in labels)
+    return out
+
+
+def training_batch(
+    df: pd.DataFrame, required: list[str] | None = None, categories: dict[str, list[str]] | None = None
+) -> tuple[pd.DataFrame, pd.Series]:
+    """
+    (X, y) of one feature batch: rows with a known target (and known `required` columns,
+    e.g. the longest lag), non-feature columns dropped, text categoricals replaced by their
+    code in `categories` (category_labels; default the batch's own sorted labels, -1 unknown).
+    """
+    keep = df[TARGET].notna().to_numpy().copy()
+    for c in required or []:
+        keep &= df[c].notna().to_numpy()
+    df = df[keep]
+    X = df.drop(columns=NON_FEATURES, errors="ignore")
+    # Integer keys go to CatBoost as-is; only the text labels need codes
+    categories = categories or {}
+    codes = {}
+    for c in CAT_FEATURES:
+        if c in X.columns and not pd.api.types.is_integer_dtype(X[c]):
+            labels = categories.get(c)
+            if labels is None:
+                labels = sorted(X[c].dropna().astype(str).unique())
+            codes[c] = pd.Categorical(X[c].astype(str), categories=labels).codes.astype("int16")
+    if codes:
+        X = X.assign(**codes)
+    return X, df[TARGET]
+
+
+def _column_description(columns: list[str]) -> str:
+    lines = ["0\tLabel"]
+    for i, c in enumerate(columns, start=1):
+        lines.append(f"{i}\tNum\t{c}")  # categoricals included, as integer codes
+    return "\n".join(lines) + "\n"
+
+
+def write_pool_files(
+    split_date,
+    lags=(7, 14, 28, 365),
+    panel_features: dict | None = None,
+    features: list | None = None,
+    required: list[str] | None = None,
+    daily_path: Path = DAILY_CANON_PATH,
+    pool_dir: Path = POOL_DIR,
+    stores_per_batch: int = STORES_PER_BATCH,
+    verbose: bool = False,
+    store_dir: Path = FEATURE_STORE_DIR,
+) -> dict:
+    """
+    Streams the training rows into pool_dir: train.tsv (date < split_date), val.tsv
+    (date >= split_date, train days only) and the CatBoost column description pool.cd.
+    Returns the pool metadata (files, feature names, category codes, row counts), also
+    saved in _pool.json.
+    """
+    pool_dir = Path(pool_dir)
+    pool_dir.mkdir(parents=True, exist_ok=True)
+    split_date = pd.Timestamp(split_date)
+    paths = {k: pool_dir / f for k, f in POOL_FILES.items()}
+    files = {k: open(p, "w") for k, p in paths.items()}
+    columns = None
+    rows = {k: 0 for k in paths}
+    categories = category_labels(daily_path)
+    try:
+        for i, df in enumerate(iter_feature_batches(lags, panel_features, features, daily_path, stores_per_batch, store_dir=store_dir)):
+            date = df["date"].to_numpy()
+            is_val = (date >= split_date.to_datetime64()) & (df["is_train_day"].to_numpy() == 1)
+            is_train = date < split_date.to_datetime64()
+            X, y = training_batch(df, required, categories)
+            if columns is None:
+                columns = list(X.columns)
+            elif list(X.columns) != columns:
+                raise ValueError(f"Batch {i}: feature columns differ from the first batch")
+            kept = df.index.get_indexer(X.index)
+            del df
+            for k, mask in (("train", is_train[kept]), ("val", is_val[kept])):
+                part = pd.concat([y[mask], X[mask]], axis=1)
+                part.to_csv(files[k], sep="\t", header=False, index=False, na_rep="nan")
+                rows[k] += len(part)
+            if verbose:
+                print(f"Batch {i}: {len(X):,} rows (train {rows['train']:,}, val {rows['val']:,} so far)")
+    finally:
+        for f in files.values():
+            f.close()
+    if columns is None:
+        raise ValueError(f"No rows in {daily_path}")
+
+    (pool_dir / COLUMN_DESCRIPTION).write_text(_column_description(columns))
+    meta = {
+        "split_date": str(split_date.date()),
+        "files": {k: str(p) for k, p in paths.items()},
+        "column_description": str(pool_dir / COLUMN_DESCRIPTION),
+        "features": columns,
+        "categories": {c: labels for c, labels in categories.items() if c in columns},
+        "rows": rows,
+    }
+    (pool_dir / META_FILE).write_text(json.dumps(meta, indent=2))
+    return meta
+
+
+def quantize_pools(pool_dir: Path = POOL_DIR, border_count: int = 254, used_ram_limit: str | None = None) -> dict:
+    """
+    Quantizes train.tsv / val.tsv from disk block by block (val with the train borders)
+    and saves them as CatBoost quantized pools; returns the pool metadata with their
+    paths, to load with Pool("quantized://" + path).
+    """
+    from catboost.utils import quantize
+
+    pool_dir = Path(pool_dir)
+    meta = json.loads((pool_dir / META_FILE).read_text())
+    borders = pool_dir / "borders.tsv"
+    quantized = {}
+    for k in ("train", "val"):
+        pool = quantize(
+            meta["files"][k],
+            column_description=meta["column_description"],
+            border_count=border_count,
+            input_borders=str(borders) if k != "train" else None,
+            used_ram_limit=used_ram_limit,
+        )
+        if k == "train":
+            pool.save_quantization_borders(str(borders))
+        quantized[k] = pool_dir / f"{k}.quantized"
+        pool.save(str(quantized[k]))
+        del pool
+    meta["quantized"] = {k: str(p) for k, p in quantized.items()}
+    (pool_dir / META_FILE).write_text(json.dumps(meta, indent=2))
+    return meta